@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de l insertion d un score dans le leaderboard.
+
+Compare, pour une taille de store croissante (`MAX_STORE`), l ancien schema
+(append, filtre TTL par reconstruction de la liste, tri complet, troncature)
+avec `RankedBoard` (bisect, rejet sous la coupure, purge TTL par ordre de
+creation). Les scores soumis sont tires au hasard: une partie tombe sous la
+coupure et est rejetee.
+
+    python3 scripts/bench_board.py [--sizes 100,1000,10000,100000] [--rounds 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def _entries(count, rng, now):
+    return [
+        {
+            "id": f"s-{i}",
+            "name": "bench",
+            "color": "#7af6ff",
+            "score": float(rng.randint(1, 100000)),
+            "time": float(rng.randint(1, 600)),
+            "created": now - rng.uniform(0, 3600),
+        }
+        for i in range(count)
+    ]
+
+
+def _list_insert(board, entry, now, limit):
+    # ancien _add_score_entry + _prune_leaderboard
+    board.append(entry)
+    cutoff = now - server.BOARD_TTL
+    if not all(server._safe_float(e.get("created", now), now) >= cutoff for e in board):
+        board[:] = [e for e in board if server._safe_float(e.get("created", now), now) >= cutoff]
+    board.sort(key=server._score_sort_key, reverse=True)
+    del board[limit:]
+
+
+def _ranked_insert(board, entry, now, limit):
+    board.expire(now - server.BOARD_TTL)
+    board.add(entry, limit)
+
+
+def _per_call_us(fn, board, pending, now, limit):
+    start = time.perf_counter()
+    for entry in pending:
+        fn(board, entry, now, limit)
+    return (time.perf_counter() - start) * 1e6 / len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    now = time.time()
+    print(f"{'store':>8} {'list us/score':>14} {'ranked us/score':>16} {'speedup':>8}")
+    for size in sizes:
+        rng = random.Random(size)
+        initial = _entries(size, rng, now)
+        pending = [dict(e, id=f"n-{i}") for i, e in enumerate(_entries(args.rounds, rng, now))]
+        plain = sorted(initial, key=server._score_sort_key, reverse=True)
+        ranked = server.RankedBoard(initial, size)
+        # l ancien schema coute O(n log n) par score: moins de tours sur les grandes tailles
+        list_rounds = pending[: max(20, min(len(pending), len(pending) * 1000 // size))]
+        list_us = _per_call_us(_list_insert, plain, list_rounds, now, size)
+        ranked_us = _per_call_us(_ranked_insert, ranked, pending, now, size)
+        print(f"{size:>8} {list_us:>14.1f} {ranked_us:>16.2f} {list_us / ranked_us:>7.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test de charge `POST /api/state` avec et sans connexions persistantes.
+
+Lance `server.py` deux fois (KEEP_ALIVE=0 puis KEEP_ALIVE=1) sur un port
+libre, envoie des heartbeats depuis plusieurs threads clients et compare
+requetes/s et latence p50/p99. Resultat final en JSON sur stdout.
+
+    python3 scripts/bench_keepalive.py [--clients 32] [--duration 5] [--engine asyncio]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(keep_alive, engine):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(
+        {
+            "PORT": str(port),
+            "DRY_RUN": "1",
+            "KEEP_ALIVE": "1" if keep_alive else "0",
+            "ENGINE": engine,
+            "RATE_LIMIT_RPS": "0",
+            "MAX_SESSIONS_PER_IP": "0",
+        }
+    )
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def _client(port, idx, keep_alive, stop_at, latencies, errors):
+    conn = None
+    n = 0
+    while time.time() < stop_at:
+        body = json.dumps(
+            {"sessionId": f"bench-{idx}", "x": n % 800, "y": n % 600, "since": time.time()}
+        ).encode()
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.request("POST", "/api/state", body, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+            if not keep_alive or resp.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors.append("io")
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        n += 1
+    if conn is not None:
+        conn.close()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def run(keep_alive, clients, duration, engine="threading"):
+    proc, port = _start_server(keep_alive, engine)
+    try:
+        latencies = []
+        errors = []
+        stop_at = time.time() + duration
+        threads = [
+            threading.Thread(
+                target=_client, args=(port, i, keep_alive, stop_at, latencies, errors)
+            )
+            for i in range(clients)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {
+        "keepAlive": keep_alive,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / duration, 1),
+        "p50Ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99Ms": round(_percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--engine", default="threading", choices=("threading", "asyncio"))
+    args = parser.parse_args()
+
+    results = [
+        run(False, args.clients, args.duration, args.engine),
+        run(True, args.clients, args.duration, args.engine),
+    ]
+    for r in results:
+        print(
+            f"keep-alive={'on ' if r['keepAlive'] else 'off'} "
+            f"rps={r['rps']:>8} p50={r['p50Ms']:>6}ms p99={r['p99Ms']:>6}ms errors={r['errors']}",
+            file=sys.stderr,
+        )
+    print(
+        json.dumps(
+            {
+                "engine": args.engine,
+                "clients": args.clients,
+                "duration": args.duration,
+                "runs": results,
+            }
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Generateur de charge: des pilotes simules qui parlent a `server.py` comme `index.html`.
+
+Chaque pilote (une coroutine asyncio) reproduit le protocole du client:
+heartbeat `POST /api/state` toutes les 250 ms (avec `since`, `boardVersion`,
+`maxPeers`, `peerFormat`), `GET /api/board` toutes les 2 s avec `If-None-Match`,
+`POST /api/score` a chaque fin de partie et `POST /api/leave` en partant.
+Chaque pilote a sa propre IP (`X-Forwarded-For`, le serveur lance par le script
+a `TRUST_PROXY=1`): limites par IP et sessions par IP s appliquent comme en prod.
+
+Sans `--url`, le script lance `server.py` sur un port libre (variables
+supplementaires via `--env CLE=VALEUR`) et suit sa memoire (RSS, workers
+compris). Rapporte debit, latence p50/p95/p99 par route, taux d erreurs et de
+429; resultat final en JSON sur stdout pour comparer deux executions.
+
+    python3 scripts/bench_pilots.py [--pilots 1000] [--duration 30] [--procs 2] [--env WORKERS=4]
+    python3 scripts/bench_pilots.py --url http://127.0.0.1:8000 --pid 1234
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_keepalive import ROOT, _free_port, _percentile  # noqa: E402
+
+HEARTBEAT = 0.25  # seconds, CONFIG.syncIntervalMs
+BOARD_INTERVAL = 2.0  # seconds, CONFIG.boardIntervalMs
+MAX_PEERS = 5  # CONFIG.maxPeers
+PEER_FORMAT = 2
+REQUEST_TIMEOUT = 10.0
+ROUTES = ("state", "board", "score", "leave")
+
+
+class PilotConn:
+    """Connexion HTTP/1.1 minimale d'un pilote, reutilisee si le serveur la garde ouverte."""
+
+    def __init__(self, host, port, keep_alive):
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self._reader = None
+        self._writer = None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def request(self, method, path, payload=None, headers=()):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Connection: keep-alive" if self.keep_alive else "Connection: close",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if method == "POST":
+            lines.append("Content-Type: application/json")
+            lines.append(f"Content-Length: {len(body)}")
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        reader = self._reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        length = None
+        close = not self.keep_alive
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and "close" in value.lower():
+                close = True
+        if length is not None:
+            data = await reader.readexactly(length)
+        elif status in (204, 304):
+            data = b""
+        else:
+            data = await reader.read()
+            close = True
+        if close:
+            self.close()
+        return status, data
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {route: [] for route in ROUTES}
+        self.status = {route: {} for route in ROUTES}
+        self.io_errors = {route: 0 for route in ROUTES}
+
+    def observe(self, route, status, elapsed):
+        counts = self.status[route]
+        counts[status] = counts.get(status, 0) + 1
+        self.latencies[route].append(elapsed)
+
+    def as_dict(self):
+        return {
+            "latencies": self.latencies,
+            "status": self.status,
+            "ioErrors": self.io_errors,
+        }
+
+
+async def _call(conn, stats, route, method, path, payload=None, headers=()):
+    start = time.perf_counter()
+    try:
+        status, data = await asyncio.wait_for(
+            conn.request(method, path, payload, headers), REQUEST_TIMEOUT
+        )
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+        conn.close()
+        stats.io_errors[route] += 1
+        return None, None
+    stats.observe(route, status, time.perf_counter() - start)
+    if status != 200:
+        return status, None
+    try:
+        return status, json.loads(data)
+    except ValueError:
+        return status, None
+
+
+async def _pilot(idx, host, port, args, stop_at, stats, rng):
+    conn = PilotConn(host, port, args.keep_alive)
+    ip = f"10.{(idx >> 16) & 255}.{(idx >> 8) & 255}.{idx & 255}"
+    forwarded = (("X-Forwarded-For", ip),)
+    session_id = f"load-{os.getpid()}-{idx}-{rng.getrandbits(32):08x}"
+    identity = {
+        "id": session_id,
+        "sessionId": session_id,
+        "clientId": f"c-{idx}",
+        "instanceId": f"t-{idx}",
+        "name": f"Pilot{idx}",
+        "color": rng.choice(("#7af6ff", "#ff7ad9", "#ffe27a", "#8aff7a")),
+    }
+    x, y = rng.uniform(0, 1600), rng.uniform(0, 900)
+    score = best = 0
+    started = time.monotonic()
+    game_over_at = started + rng.expovariate(1.0 / args.game_seconds)
+    board_etag = ""
+    board_version = ""
+    server_time = 0.0
+    next_board = started + rng.uniform(0, BOARD_INTERVAL)
+    # les pilotes n'arrivent pas tous en meme temps
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    try:
+        while time.time() < stop_at:
+            tick = time.monotonic()
+            x = min(max(x + rng.uniform(-40, 40), 0), 1600)
+            y = min(max(y + rng.uniform(-40, 40), 0), 900)
+            score += rng.randint(0, 30)
+            best = max(best, score)
+            elapsed = int(tick - started)
+            payload = dict(
+                identity,
+                x=round(x, 1),
+                y=round(y, 1),
+                score=score,
+                time=elapsed,
+                best=best,
+                bestTime=elapsed,
+                pulseSeq=0,
+                since=server_time,
+                boardVersion=board_version,
+                maxPeers=MAX_PEERS,
+                peerFormat=PEER_FORMAT,
+            )
+            _, data = await _call(conn, stats, "state", "POST", "/api/state", payload, forwarded)
+            if data:
+                # comme le client: le curseur `since` n'avance qu'avec des pairs
+                if "players" in data:
+                    server_time = data.get("serverTime", server_time)
+                if "board" in data:
+                    board_version = data.get("boardVersion", "")
+            if tick >= next_board:
+                next_board = tick + BOARD_INTERVAL
+                headers = forwarded + ((("If-None-Match", board_etag),) if board_etag else ())
+                _, data = await _call(conn, stats, "board", "GET", "/api/board", None, headers)
+                if data:
+                    board_version = data.get("boardVersion", board_version)
+                    board_etag = f'"{board_version}"'
+            if tick >= game_over_at:
+                # comme submitScore(): rien a envoyer pour une partie a 0
+                if score > 0:
+                    result = {
+                        "sessionId": session_id,
+                        "clientId": identity["clientId"],
+                        "name": identity["name"],
+                        "color": identity["color"],
+                        "score": score,
+                        "time": elapsed,
+                    }
+                    await _call(conn, stats, "score", "POST", "/api/score", result, forwarded)
+                score = 0
+                started = time.monotonic()
+                game_over_at = started + rng.expovariate(1.0 / args.game_seconds)
+            await asyncio.sleep(max(0.0, HEARTBEAT - (time.monotonic() - tick)))
+    finally:
+        leave = {
+            "sessionId": session_id,
+            "clientId": identity["clientId"],
+            "instanceId": identity["instanceId"],
+        }
+        await _call(conn, stats, "leave", "POST", "/api/leave", leave, forwarded)
+        conn.close()
+
+
+async def _run_pilots(first, count, host, port, args, stop_at):
+    stats = Stats()
+    rng = random.Random(first)
+    await asyncio.gather(
+        *(
+            _pilot(first + i, host, port, args, stop_at, stats, random.Random(rng.random()))
+            for i in range(count)
+        )
+    )
+    return stats.as_dict()
+
+
+def _proc_main(job):
+    first, count, host, port, args, stop_at = job
+    return asyncio.run(_run_pilots(first, count, host, port, args, stop_at))
+
+
+def _rss_kb(pid):
+    """RSS du processus `pid` et de ses descendants (workers), en Kio; 0 si inconnu."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+                    break
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="ascii") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return total
+    return total + sum(_rss_kb(child) for child in children)
+
+
+def _watch_rss(pid, stop, samples):
+    while not stop.wait(1.0):
+        samples.append(_rss_kb(pid))
+
+
+def _start_server(extra_env):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(
+        {
+            "PORT": str(port),
+            "DRY_RUN": "1",
+            "TRUST_PROXY": "1",
+            "ACCESS_LOG": "off",
+        }
+    )
+    env.update(extra_env)
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            time.sleep(0.5)
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def _merge(results):
+    merged = Stats()
+    for result in results:
+        for route in ROUTES:
+            merged.latencies[route].extend(result["latencies"][route])
+            merged.io_errors[route] += result["ioErrors"][route]
+            counts = merged.status[route]
+            for status, n in result["status"][route].items():
+                counts[int(status)] = counts.get(int(status), 0) + n
+    return merged
+
+
+def _summary(stats, duration):
+    routes = {}
+    total = errors = limited = 0
+    every = []
+    for route in ROUTES:
+        lats = stats.latencies[route]
+        counts = stats.status[route]
+        n = sum(counts.values()) + stats.io_errors[route]
+        route_limited = counts.get(429, 0)
+        route_errors = stats.io_errors[route] + sum(
+            c for s, c in counts.items() if s >= 400 and s != 429
+        )
+        routes[route] = {
+            "requests": n,
+            "rps": round(n / duration, 1),
+            "p50Ms": round(_percentile(lats, 50) * 1000, 2),
+            "p95Ms": round(_percentile(lats, 95) * 1000, 2),
+            "p99Ms": round(_percentile(lats, 99) * 1000, 2),
+            "errors": route_errors,
+            "status429": route_limited,
+            "status": {str(s): c for s, c in sorted(counts.items())},
+        }
+        total += n
+        errors += route_errors
+        limited += route_limited
+        every.extend(lats)
+    return {
+        "requests": total,
+        "rps": round(total / duration, 1),
+        "p50Ms": round(_percentile(every, 50) * 1000, 2),
+        "p95Ms": round(_percentile(every, 95) * 1000, 2),
+        "p99Ms": round(_percentile(every, 99) * 1000, 2),
+        "errors": errors,
+        "errorRate": round(errors / total, 4) if total else 0.0,
+        "status429": limited,
+        "rate429": round(limited / total, 4) if total else 0.0,
+        "routes": routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pilots", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--ramp", type=float, default=5.0, help="arrivee etalee des pilotes (s)")
+    parser.add_argument("--game-seconds", type=float, default=60.0, help="duree moyenne d une partie (s)")
+    parser.add_argument("--procs", type=int, default=1, help="processus clients")
+    parser.add_argument("--keep-alive", action="store_true", help="reutilise les connexions")
+    parser.add_argument("--url", help="serveur deja lance (sinon server.py est lance)")
+    parser.add_argument("--pid", type=int, help="pid du serveur de --url, pour la RSS")
+    parser.add_argument("--env", action="append", default=[], help="CLE=VALEUR pour server.py")
+    args = parser.parse_args()
+
+    proc = None
+    if args.url:
+        target = urlparse(args.url)
+        host, port = target.hostname or "127.0.0.1", target.port or 80
+        pid = args.pid
+    else:
+        extra = dict(item.split("=", 1) for item in args.env if "=" in item)
+        if args.keep_alive:
+            extra.setdefault("KEEP_ALIVE", "1")
+        proc, port = _start_server(extra)
+        host, pid = "127.0.0.1", proc.pid
+
+    rss = []
+    watch_stop = threading.Event()
+    watcher = None
+    if pid:
+        rss.append(_rss_kb(pid))
+        watcher = threading.Thread(target=_watch_rss, args=(pid, watch_stop, rss), daemon=True)
+        watcher.start()
+    procs = max(1, min(args.procs, args.pilots))
+    share = [args.pilots // procs + (1 if i < args.pilots % procs else 0) for i in range(procs)]
+    firsts = [sum(share[:i]) for i in range(procs)]
+    start = time.time()
+    stop_at = start + args.duration
+    try:
+        jobs = [(firsts[i], share[i], host, port, args, stop_at) for i in range(procs)]
+        if procs == 1:
+            results = [_proc_main(jobs[0])]
+        else:
+            with multiprocessing.Pool(procs) as pool:
+                results = pool.map(_proc_main, jobs)
+    finally:
+        watch_stop.set()
+        if watcher is not None:
+            watcher.join()
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=15)
+    elapsed = max(time.time() - start, 1e-9)
+
+    report = _summary(_merge(results), elapsed)
+    report.update(
+        {
+            "pilots": args.pilots,
+            "duration": round(elapsed, 2),
+            "keepAlive": args.keep_alive,
+            "serverEnv": args.env,
+            "server": {
+                "rssKbStart": rss[0] if rss else None,
+                "rssKbPeak": max(rss) if rss else None,
+                "rssKbEnd": rss[-1] if rss else None,
+            },
+        }
+    )
+    print(
+        f"pilots={args.pilots} rps={report['rps']} p50={report['p50Ms']}ms "
+        f"p95={report['p95Ms']}ms p99={report['p99Ms']}ms errors={report['errorRate']:.2%} "
+        f"429={report['rate429']:.2%} rssPeak={report['server']['rssKbPeak']}KiB",
+        file=sys.stderr,
+    )
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark de `POST /api/state` avec et sans les index de presence.
+
+Pour un nombre croissant de sessions en ligne, rejoue des heartbeats via
+`server.handle_api` (le meme coeur que les deux moteurs HTTP) et mesure la
+latence de chaque requete (p50/p99). "linear" reproduit les recherches d avant
+les index (`ip` et `clientId`/`instanceId` par parcours de tous les joueurs),
+"indexed" utilise `PresenceRegistry`.
+
+Chaque requete est le heartbeat d une session existante (anti-dup par
+clientId); une sur `--new-every` ouvre une nouvelle session pour le meme
+client (controle MAX_SESSIONS_PER_IP). Le tick de presence est reconstruit au
+rythme normal (PRESENCE_TICK_HZ), le delestage est coupe.
+
+    python3 scripts/bench_presence.py [--sizes 100,1000,10000] [--requests 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+class LinearRegistry(server.PresenceRegistry):
+    """Registre dont les recherches parcourent tous les joueurs, comme avant les index."""
+
+    def count_ip(self, ip):
+        return sum(1 for p in self._players.values() if p.get("ip") == ip)
+
+    def sessions_for_client(self, client_id, instance_id=None):
+        client_id = server._normalize_client_id(client_id)
+        if not client_id:
+            return []
+        instance_id = server._normalize_instance_id(instance_id)
+        matches = []
+        for sid, player in self._players.items():
+            if server._normalize_client_id(player.get("clientId")) != client_id:
+                continue
+            if server._normalize_instance_id(player.get("instanceId")) != instance_id:
+                continue
+            matches.append(sid)
+        return matches
+
+
+def _ip(i):
+    return f"10.0.{(i // 4) // 256}.{(i // 4) % 256}"
+
+
+def _state_body(sid, i, step):
+    return json.dumps(
+        {
+            "sessionId": sid,
+            "clientId": f"c-{i}",
+            "instanceId": f"t-{i}",
+            "name": f"p{i}",
+            "x": float((i * 37 + step) % 1600),
+            "y": float((i * 11 + step) % 900),
+            "score": i % 50,
+            "time": step % 90,
+        }
+    ).encode()
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _run(registry_cls, size, requests, new_every):
+    server.PLAYERS = registry_cls()
+    server.BROADCASTER = server.PresenceBroadcaster()
+    sids = [f"s-{i}" for i in range(size)]
+    for i, sid in enumerate(sids):
+        server.handle_api("POST", "/api/state", "", {}, _state_body(sid, i, 0), _ip(i))
+    latencies = []
+    for step in range(1, requests + 1):
+        i = (step * 7919) % size
+        if new_every and step % new_every == 0:
+            # rechargement de page: nouvelle session, l ancienne est retiree par clientId
+            sids[i] = f"s-{i}-{step}"
+        body = _state_body(sids[i], i, step)
+        start = time.perf_counter()
+        resp = server.handle_api("POST", "/api/state", "", {}, body, _ip(i))
+        latencies.append((time.perf_counter() - start) * 1e6)
+        if resp.status != 200:
+            raise SystemExit(f"/api/state -> {resp.status}: {resp.error}")
+    if len(server.PLAYERS) != size:
+        raise SystemExit(f"{len(server.PLAYERS)} sessions au lieu de {size}")
+    return _percentile(latencies, 0.5), _percentile(latencies, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--new-every", type=int, default=10)
+    args = parser.parse_args()
+
+    server.DRY_RUN = True
+    server.RATE_LIMITERS = {}
+    server.LOAD_SHED_LATENCY_MS = 0
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    print(
+        f"{'players':>8} {'linear p50':>11} {'linear p99':>11} "
+        f"{'indexed p50':>12} {'indexed p99':>12}   (us/requete)"
+    )
+    for size in sizes:
+        linear = _run(LinearRegistry, size, args.requests, args.new_every)
+        indexed = _run(server.PresenceRegistry, size, args.requests, args.new_every)
+        print(
+            f"{size:>8} {linear[0]:>11.1f} {linear[1]:>11.1f} "
+            f"{indexed[0]:>12.1f} {indexed[1]:>12.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
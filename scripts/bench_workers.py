@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Debit de `POST /api/state` selon le nombre de workers (WORKERS=N).
+
+Lance `server.py` pour chaque valeur de `--workers` (KEEP_ALIVE=1, sans
+limitation de debit), envoie des heartbeats depuis plusieurs processus
+clients (chacun avec plusieurs threads, pour ne pas etre borne par le GIL du
+client) et compare requetes/s, latence p50/p99 et acceleration par rapport a
+un seul worker. Resultat final en JSON sur stdout.
+
+    python3 scripts/bench_workers.py [--workers 1,2,4] [--procs 4] [--clients 16] [--duration 5]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_keepalive import ROOT, _client, _free_port, _percentile  # noqa: E402
+
+
+def _start_server(workers, engine):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(
+        {
+            "PORT": str(port),
+            "DRY_RUN": "1",
+            "KEEP_ALIVE": "1",
+            "ENGINE": engine,
+            "WORKERS": str(workers),
+            "RATE_LIMIT_RPS": "0",
+            "MAX_SESSIONS_PER_IP": "0",
+            "ACCESS_LOG": "off",
+        }
+    )
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            # laisse aux autres workers le temps d'ouvrir leur socket
+            time.sleep(0.5)
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def _client_proc(args):
+    port, proc_idx, clients, stop_at = args
+    latencies = []
+    errors = []
+    threads = [
+        threading.Thread(
+            target=_client,
+            args=(port, proc_idx * clients + i, True, stop_at, latencies, errors),
+        )
+        for i in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, len(errors)
+
+
+def run(workers, procs, clients, duration, engine="threading"):
+    proc, port = _start_server(workers, engine)
+    try:
+        stop_at = time.time() + duration
+        with multiprocessing.Pool(procs) as pool:
+            results = pool.map(
+                _client_proc, [(port, i, clients, stop_at) for i in range(procs)]
+            )
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+    latencies = [lat for lats, _ in results for lat in lats]
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "rps": round(len(latencies) / duration, 1),
+        "p50Ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99Ms": round(_percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, max(1, cpus // 2), cpus})
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default=",".join(str(w) for w in default_workers))
+    parser.add_argument("--procs", type=int, default=max(1, cpus // 2))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--engine", default="threading", choices=("threading", "asyncio"))
+    args = parser.parse_args()
+
+    counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    results = [run(w, args.procs, args.clients, args.duration, args.engine) for w in counts]
+    base = results[0]["rps"] or 1.0
+    for r in results:
+        r["speedup"] = round(r["rps"] / base, 2)
+        print(
+            f"workers={r['workers']:>2} rps={r['rps']:>8} p50={r['p50Ms']:>6}ms "
+            f"p99={r['p99Ms']:>6}ms speedup={r['speedup']:>5}x errors={r['errors']}",
+            file=sys.stderr,
+        )
+    print(
+        json.dumps(
+            {
+                "engine": args.engine,
+                "cpus": cpus,
+                "procs": args.procs,
+                "clients": args.clients,
+                "duration": args.duration,
+                "runs": results,
+            }
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,141 @@
 #!/usr/bin/env python3
+import asyncio
+import bisect
+import html
 import json
+import logging
+import logging.handlers
+import math
+import mimetypes
 import os
+import posixpath
+import random
 import socket
 import time
 import threading
 import functools
+import gzip
+import hashlib
+import heapq
+from array import array
+from collections import OrderedDict, deque, namedtuple
 import secrets
-from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
-from urllib.parse import urlparse
+import sqlite3
+import signal
+import subprocess
+import sys
+from email.parser import BytesParser
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import HTTPMessage
+from http.server import (
+    DEFAULT_ERROR_CONTENT_TYPE,
+    DEFAULT_ERROR_MESSAGE,
+    ThreadingHTTPServer,
+    SimpleHTTPRequestHandler,
+)
+from urllib.parse import parse_qs, quote, unquote, urlparse
 
-LOCK = threading.Lock()
-RATE_LOCK = threading.Lock()
+
+class TimedLock:
+    """
+    `threading.Lock` utilisable en `with` qui mesure l'attente et la durée de
+    détention; les compteurs sont mis à jour verrou tenu (voir `stats()`).
+    """
+
+    __slots__ = (
+        "name",
+        "_lock",
+        "_acquired_at",
+        "acquisitions",
+        "contended",
+        "wait_total",
+        "hold_total",
+        "hold_max",
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._acquired_at = 0.0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            self._acquired_at = time.perf_counter()
+        else:
+            start = time.perf_counter()
+            self._lock.acquire()
+            self._acquired_at = time.perf_counter()
+            self.contended += 1
+            self.wait_total += self._acquired_at - start
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self._acquired_at
+        self.hold_total += held
+        if held > self.hold_max:
+            self.hold_max = held
+        self._lock.release()
+        return False
+
+    def locked(self):
+        return self._lock.locked()
+
+    def stats(self):
+        with self._lock:
+            n = self.acquisitions
+            return {
+                "acquisitions": n,
+                "contended": self.contended,
+                "waitMs": round(self.wait_total * 1000, 3),
+                "holdMs": round(self.hold_total * 1000, 3),
+                "holdAvgMs": round(self.hold_total * 1000 / n, 4) if n else 0.0,
+                "holdMaxMs": round(self.hold_max * 1000, 3),
+            }
+
+
+# domaines de verrouillage, toujours pris dans cet ordre quand il faut en tenir plusieurs:
+# PRESENCE_LOCK (PLAYERS) -> BOARD_LOCK (LEADERBOARD, BOARD_*). SAVE_LOCK sérialise
+# l'écriture de scores.json et ne doit jamais être pris sous PRESENCE_LOCK ni BOARD_LOCK.
+PRESENCE_LOCK = TimedLock("presence")
+BOARD_LOCK = TimedLock("board")
+SAVE_LOCK = TimedLock("save")
+LOCKS = (PRESENCE_LOCK, BOARD_LOCK, SAVE_LOCK)
 EXPIRATION = 300  # seconds, conserve les joueurs un moment (présence en ligne)
+REAP_INTERVAL = 1.0  # seconds, période du thread qui purge les sessions expirées
 PORT = int(os.environ.get("PORT", "8000"))
+# moteur HTTP: "threading" (ThreadingHTTPServer, défaut) ou "asyncio"
+ENGINE = os.environ.get("ENGINE", "threading").strip().lower()
+# processus servant le port (SO_REUSEPORT); 1 = un seul processus, sans superviseur
+try:
+    WORKERS = int(os.environ.get("WORKERS", "1"))
+except (TypeError, ValueError):
+    WORKERS = 1
+WORKER_SYNC_INTERVAL = 0.05  # seconds, période des lots worker -> parent
+WORKER_RESPAWN_DELAY = 1.0  # seconds, avant de relancer un worker mort
+# redémarrage à chaud (SIGHUP): attente du nouveau processus, puis des requêtes en cours
+try:
+    HOT_RESTART_TIMEOUT = float(os.environ.get("HOT_RESTART_TIMEOUT", "10"))
+except (TypeError, ValueError):
+    HOT_RESTART_TIMEOUT = 10.0
+try:
+    HOT_RESTART_DRAIN = float(os.environ.get("HOT_RESTART_DRAIN", "5"))
+except (TypeError, ValueError):
+    HOT_RESTART_DRAIN = 5.0
+# file d'attente de la socket d'écoute (listen), plafonnée par net.core.somaxconn
+try:
+    LISTEN_BACKLOG = int(os.environ.get("LISTEN_BACKLOG", "1024"))
+except (TypeError, ValueError):
+    LISTEN_BACKLOG = 1024
+# après le drainage, délai laissé aux connexions persistantes pour une dernière requête
+# (réponse en Connection: close) avant de les fermer
+HOT_RESTART_IDLE_GRACE = 0.5  # seconds
 try:
     IDLE_TIMEOUT = float(os.environ.get("IDLE_TIMEOUT", "15"))
 except (TypeError, ValueError):
@@ -21,6 +144,12 @@ if IDLE_TIMEOUT <= 0:
     IDLE_TIMEOUT = 15.0
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCORES_FILE = os.path.join(BASE_DIR, "scores.json")
+# journal des modifications du leaderboard depuis le dernier instantané scores.json
+JOURNAL_FILE = os.path.join(BASE_DIR, "scores.jsonl")
+# stockage des scores: "json" (scores.json + journal, défaut) ou "sqlite" (SCORES_DB)
+STORE_BACKEND = os.environ.get("STORE", "json").strip().lower()
+SCORES_DB = os.environ.get("SCORES_DB") or os.path.join(BASE_DIR, "scores.db")
+SQLITE_BATCH = 500  # lignes par DELETE (purge TTL, évictions)
 DRY_RUN = os.environ.get("DRY_RUN", "").strip().lower() in ("1", "true", "yes", "on")
 ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or os.environ.get("RESET_TOKEN") or ""
 TRUST_PROXY = os.environ.get("TRUST_PROXY", "").strip().lower() in ("1", "true", "yes", "on")
@@ -37,21 +166,141 @@ try:
     RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", str(default_burst)))
 except (TypeError, ValueError):
     RATE_LIMIT_BURST = 0 if RATE_LIMIT_RPS <= 0 else max(int(RATE_LIMIT_RPS * 2), 1)
+# budgets propres à /api/state et /api/score (par défaut ceux de RATE_LIMIT_RPS/BURST)
+try:
+    RATE_LIMIT_STATE_RPS = float(os.environ.get("RATE_LIMIT_STATE_RPS", str(RATE_LIMIT_RPS)))
+    RATE_LIMIT_STATE_BURST = float(os.environ.get("RATE_LIMIT_STATE_BURST", str(RATE_LIMIT_BURST)))
+except (TypeError, ValueError):
+    RATE_LIMIT_STATE_RPS, RATE_LIMIT_STATE_BURST = RATE_LIMIT_RPS, RATE_LIMIT_BURST
+try:
+    RATE_LIMIT_SCORE_RPS = float(os.environ.get("RATE_LIMIT_SCORE_RPS", str(RATE_LIMIT_RPS)))
+    RATE_LIMIT_SCORE_BURST = float(os.environ.get("RATE_LIMIT_SCORE_BURST", str(RATE_LIMIT_BURST)))
+except (TypeError, ValueError):
+    RATE_LIMIT_SCORE_RPS, RATE_LIMIT_SCORE_BURST = RATE_LIMIT_RPS, RATE_LIMIT_BURST
+# seaux max gardés par route (mémoire bornée), répartis sur RATE_LIMIT_SHARDS verrous
+try:
+    RATE_LIMIT_MAX_IPS = int(os.environ.get("RATE_LIMIT_MAX_IPS", "100000"))
+except (TypeError, ValueError):
+    RATE_LIMIT_MAX_IPS = 100000
+RATE_LIMIT_SHARDS = 16
+# délestage adaptatif: au-delà de cette latence moyenne de traitement d'une requête API
+# (ou de ce nombre de requêtes en cours) /api/state allège ses réponses et espace les clients
+try:
+    LOAD_SHED_LATENCY_MS = float(os.environ.get("LOAD_SHED_LATENCY_MS", "50"))
+except (TypeError, ValueError):
+    LOAD_SHED_LATENCY_MS = 50.0
+try:
+    LOAD_SHED_INFLIGHT = int(os.environ.get("LOAD_SHED_INFLIGHT", "32"))
+except (TypeError, ValueError):
+    LOAD_SHED_INFLIGHT = 32
+LOAD_EWMA_ALPHA = 0.1
+LOAD_LAG_INTERVAL = 0.1  # seconds, sonde de retard de la boucle asyncio
+SYNC_INTERVAL_MS = 250  # intervalle de synchronisation nominal du client (CONFIG.syncIntervalMs)
 try:
     CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", "300"))
 except (TypeError, ValueError):
     CACHE_MAX_AGE = 300
+STATIC_CACHE_MAX_FILE = 4 * 1024 * 1024  # au-delà, fichier statique lu sur disque à chaque requête
+STATIC_GZIP_MIN = 512  # octets, en dessous pas de variante gzip
+STATIC_GZIP_TYPES = ("application/javascript", "application/json", "application/xml", "image/svg+xml")
+STATIC_WATCH_INTERVAL = 1.0  # seconds, vérification des dates des fichiers statiques en cache
+# connexions persistantes HTTP/1.1 (opt-in)
+KEEP_ALIVE = os.environ.get("KEEP_ALIVE", "").strip().lower() in ("1", "true", "yes", "on")
+try:
+    KEEP_ALIVE_TIMEOUT = float(os.environ.get("KEEP_ALIVE_TIMEOUT", "5"))
+except (TypeError, ValueError):
+    KEEP_ALIVE_TIMEOUT = 5.0
+if KEEP_ALIVE_TIMEOUT <= 0 or KEEP_ALIVE_TIMEOUT > IDLE_TIMEOUT:
+    KEEP_ALIVE_TIMEOUT = min(5.0, IDLE_TIMEOUT)
+try:
+    KEEP_ALIVE_MAX_REQUESTS = int(os.environ.get("KEEP_ALIVE_MAX_REQUESTS", "1000"))
+except (TypeError, ValueError):
+    KEEP_ALIVE_MAX_REQUESTS = 1000
+try:
+    MAX_KEEP_ALIVE_CONNECTIONS = int(os.environ.get("MAX_KEEP_ALIVE_CONNECTIONS", "512"))
+except (TypeError, ValueError):
+    MAX_KEEP_ALIVE_CONNECTIONS = 512
+# tick de présence: un instantané encodé par tick, partagé par /api/state et /api/stream
+try:
+    PRESENCE_TICK_HZ = float(
+        os.environ.get("PRESENCE_TICK_HZ") or os.environ.get("STREAM_TICK_HZ") or "10"
+    )
+except (TypeError, ValueError):
+    PRESENCE_TICK_HZ = 10.0
+if PRESENCE_TICK_HZ <= 0:
+    PRESENCE_TICK_HZ = 10.0
+try:
+    STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", "1000"))
+except (TypeError, ValueError):
+    STREAM_MAX_CLIENTS = 1000
+# pairs renvoyés par /api/state: les plus proches, plafonnés par MAX_PEERS
+try:
+    MAX_PEERS = int(os.environ.get("MAX_PEERS", "16"))
+except (TypeError, ValueError):
+    MAX_PEERS = 16
+if MAX_PEERS <= 0:
+    MAX_PEERS = 16
+try:
+    INTEREST_RADIUS = float(os.environ.get("INTEREST_RADIUS", "0"))
+except (TypeError, ValueError):
+    INTEREST_RADIUS = 0.0
+try:
+    INTEREST_CELL_SIZE = float(os.environ.get("INTEREST_CELL_SIZE", "256"))
+except (TypeError, ValueError):
+    INTEREST_CELL_SIZE = 256.0
+if INTEREST_CELL_SIZE <= 0:
+    INTEREST_CELL_SIZE = 256.0
+STREAM_PING_INTERVAL = 15.0  # seconds, commentaire SSE pour garder la connexion ouverte
+# journal d'accès JSON lines: "-" = stdout (défaut), "off" = désactivé, sinon chemin de fichier
+ACCESS_LOG_TARGET = os.environ.get("ACCESS_LOG", "-").strip() or "-"
+try:
+    ACCESS_LOG_MAX_BYTES = int(os.environ.get("ACCESS_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+except (TypeError, ValueError):
+    ACCESS_LOG_MAX_BYTES = 10 * 1024 * 1024
+try:
+    ACCESS_LOG_BACKUPS = int(os.environ.get("ACCESS_LOG_BACKUPS", "5"))
+except (TypeError, ValueError):
+    ACCESS_LOG_BACKUPS = 5
+# part des /api/state réussis journalisés (les erreurs le sont toujours)
+try:
+    LOG_SAMPLE_STATE = float(os.environ.get("LOG_SAMPLE_STATE", "1"))
+except (TypeError, ValueError):
+    LOG_SAMPLE_STATE = 1.0
+LOG_SAMPLE_STATE = min(max(LOG_SAMPLE_STATE, 0.0), 1.0)
+LOG_FLUSH_INTERVAL = 0.5  # seconds, période d'écriture des lots du journal d'accès
+LOG_QUEUE_MAX = 100000  # lignes en attente max; au-delà les plus anciennes sont perdues
 
-PLAYERS = {}  # sessionId -> player state (éphémère)
-LEADERBOARD = []  # liste d'entrées de scores (persistée)
-IP_LIMITER = {}  # ip -> {tokens, last}
+BOARD_VERSION = 0  # incrémenté à chaque modification du leaderboard
+BOARD_SNAPSHOT = None  # BoardSnapshot du top MAX_BOARD, reconstruit à la demande
+BOARD_EPOCH = secrets.token_hex(4)  # distingue les versions d'un redémarrage à l'autre
 
 BOARD_TTL = 30 * 24 * 3600  # seconds, conserve les scores un moment
 MAX_BOARD = 10
-MAX_STORE = 100
+MAX_PAGE = 50  # entrées max par page de GET /api/board?offset=&limit=
+try:
+    MAX_STORE = int(os.environ.get("MAX_STORE", "100"))
+except (TypeError, ValueError):
+    MAX_STORE = 100
+if MAX_STORE < MAX_BOARD:
+    MAX_STORE = 100
 MAX_BODY_BYTES = 16 * 1024
-SAVE_INTERVAL = 2.0  # seconds
-LAST_SAVE = 0.0
+# persistance write-behind: au plus une écriture de scores.json par SAVE_INTERVAL
+try:
+    SAVE_INTERVAL = float(os.environ.get("SAVE_INTERVAL", "2"))
+except (TypeError, ValueError):
+    SAVE_INTERVAL = 2.0
+if SAVE_INTERVAL < 0:
+    SAVE_INTERVAL = 2.0
+SAVE_FSYNC = os.environ.get("SAVE_FSYNC", "").strip().lower() in ("1", "true", "yes", "on")
+# compaction du journal dans scores.json: après COMPACT_EVENTS événements ou COMPACT_INTERVAL secondes
+try:
+    COMPACT_EVENTS = int(os.environ.get("COMPACT_EVENTS", "1000"))
+except (TypeError, ValueError):
+    COMPACT_EVENTS = 1000
+try:
+    COMPACT_INTERVAL = float(os.environ.get("COMPACT_INTERVAL", "300"))
+except (TypeError, ValueError):
+    COMPACT_INTERVAL = 300.0
 
 
 def _safe_float(value, default=0.0):
@@ -68,6 +317,18 @@ def _safe_int(value, default=0):
         return default
 
 
+def _safe_coord(value):
+    coord = _safe_float(value, 0.0)
+    if not math.isfinite(coord):
+        return 0.0
+    return coord
+
+
+def _safe_score(value):
+    """Score ou temps reçu: fini et positif (NaN/inf comme x/y dans `_safe_coord`)."""
+    return max(_safe_coord(value), 0.0)
+
+
 def _normalize_name(name):
     cleaned = " ".join(str(name or "").strip().split())
     if not cleaned:
@@ -104,531 +365,2978 @@ def _normalize_session_id(value):
     return cleaned[:64]
 
 
-def _get_client_ip(handler):
+class PresenceRegistry:
+    """
+    Sessions en ligne (sessionId -> état joueur), avec index secondaires.
+
+    Les index `ip -> sessions` et `(clientId, instanceId) -> sessions` sont tenus
+    à jour à chaque insertion/suppression: compter les sessions d'une IP ou
+    retrouver les sessions d'un client ne parcourt plus tous les joueurs.
+    Les expirations sont rangées par seconde de dernier `ts` (timer wheel):
+    purger les sessions expirées ne visite que les seaux échus.
+    Les champs indexés (`ip`, `clientId`, `instanceId`, `ts`) ne doivent changer
+    que via une nouvelle affectation `registry[sid] = player`.
+
+    Avec WORKERS > 1, `changes` (sid -> joueur, None si retiré) collecte les
+    affectations et suppressions locales à publier aux autres workers; `merge`
+    applique les leurs sans les republier. Les expirations ne sont pas publiées:
+    chaque copie purge selon les mêmes `ts`.
+    """
+
+    def __init__(self):
+        self.changes = None
+        self._players = {}
+        self._by_ip = {}
+        self._by_client = {}
+        self._expiry = {}  # seconde de `ts` -> sessions
+        self._expiry_heap = []  # secondes présentes dans `_expiry`
+
+    @staticmethod
+    def _client_key(player):
+        client_id = _normalize_client_id(player.get("clientId"))
+        if not client_id:
+            return None
+        return (client_id, _normalize_instance_id(player.get("instanceId")))
+
+    @staticmethod
+    def _index_add(index, key, sid):
+        if key is None:
+            return
+        bucket = index.get(key)
+        if bucket is None:
+            index[key] = {sid}
+        else:
+            bucket.add(sid)
+
+    @staticmethod
+    def _index_discard(index, key, sid):
+        if key is None:
+            return
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.discard(sid)
+        if not bucket:
+            del index[key]
+
+    @staticmethod
+    def _expiry_key(player):
+        return int(_safe_float(player.get("ts", 0), 0.0))
+
+    def _unindex(self, sid, player):
+        self._index_discard(self._by_ip, player.get("ip"), sid)
+        self._index_discard(self._by_client, self._client_key(player), sid)
+        self._index_discard(self._expiry, self._expiry_key(player), sid)
+
+    def __setitem__(self, sid, player):
+        if self.changes is not None:
+            self.changes[sid] = player
+        prev = self._players.get(sid)
+        if prev is not None:
+            self._unindex(sid, prev)
+        self._players[sid] = player
+        self._index_add(self._by_ip, player.get("ip"), sid)
+        self._index_add(self._by_client, self._client_key(player), sid)
+        bucket = self._expiry_key(player)
+        if bucket not in self._expiry:
+            heapq.heappush(self._expiry_heap, bucket)
+        self._index_add(self._expiry, bucket, sid)
+
+    def __delitem__(self, sid):
+        player = self._players.pop(sid)
+        self._unindex(sid, player)
+        if self.changes is not None:
+            self.changes[sid] = None
+
+    def merge(self, changes):
+        """
+        Applique des changements publiés par un autre worker. Le plus récent `ts`
+        l'emporte; les joueurs reçus sont marqués `remote`: seul le worker qui a
+        vu la dernière mise à jour enregistre le meilleur score à l'expiration.
+        """
+        journal, self.changes = self.changes, None
+        try:
+            for sid, player in changes.items():
+                if player is None:
+                    if sid in self._players:
+                        del self[sid]
+                    continue
+                prev = self._players.get(sid)
+                if prev is not None and _safe_float(prev.get("ts"), 0.0) > _safe_float(player.get("ts"), 0.0):
+                    continue
+                player["remote"] = True
+                self[sid] = player
+        finally:
+            self.changes = journal
+
+    def __getitem__(self, sid):
+        return self._players[sid]
+
+    def __contains__(self, sid):
+        return sid in self._players
+
+    def __len__(self):
+        return len(self._players)
+
+    def __iter__(self):
+        return iter(self._players)
+
+    def get(self, sid, default=None):
+        return self._players.get(sid, default)
+
+    def keys(self):
+        return self._players.keys()
+
+    def values(self):
+        return self._players.values()
+
+    def items(self):
+        return self._players.items()
+
+    def clear(self):
+        self._players.clear()
+        self._by_ip.clear()
+        self._by_client.clear()
+        self._expiry.clear()
+        self._expiry_heap.clear()
+
+    def count_ip(self, ip):
+        return len(self._by_ip.get(ip, ()))
+
+    def sessions_for_client(self, client_id, instance_id=None):
+        """Sessions d'un clientId; sans instanceId, seules celles sans instance."""
+        client_id = _normalize_client_id(client_id)
+        if not client_id:
+            return []
+        key = (client_id, _normalize_instance_id(instance_id))
+        return list(self._by_client.get(key, ()))
+
+    def pop_expired(self, cutoff):
+        """Retire et renvoie les `(sid, joueur)` dont le `ts` est antérieur à `cutoff`."""
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0] + 1 <= cutoff:
+            bucket = heapq.heappop(heap)
+            # un seau vidé puis recréé peut figurer deux fois dans le tas
+            sids = self._expiry.pop(bucket, None)
+            if not sids:
+                continue
+            for sid in sids:
+                player = self._players.pop(sid)
+                self._index_discard(self._by_ip, player.get("ip"), sid)
+                self._index_discard(self._by_client, self._client_key(player), sid)
+                expired.append((sid, player))
+        return expired
+
+
+PLAYERS = PresenceRegistry()  # sessionId -> player state (éphémère)
+
+
+def _client_ip(headers, client_address):
     if TRUST_PROXY:
-        forwarded = handler.headers.get("X-Forwarded-For", "")
+        forwarded = headers.get("X-Forwarded-For", "")
         if forwarded:
             return forwarded.split(",")[0].strip()
-        real_ip = handler.headers.get("X-Real-IP", "").strip()
+        real_ip = headers.get("X-Real-IP", "").strip()
         if real_ip:
             return real_ip
-    if handler.client_address:
-        return handler.client_address[0]
+    if client_address:
+        return client_address[0]
     return "unknown"
 
 
-def _consume_rate_limit(ip, now):
-    if RATE_LIMIT_RPS <= 0 or RATE_LIMIT_BURST <= 0:
-        return True
-    with RATE_LOCK:
-        state = IP_LIMITER.get(ip)
-        if not state:
-            IP_LIMITER[ip] = {"tokens": RATE_LIMIT_BURST - 1.0, "last": now}
-            return True
-        tokens = float(state.get("tokens", 0.0))
-        last = float(state.get("last", now))
-        tokens = min(RATE_LIMIT_BURST, tokens + max(0.0, now - last) * RATE_LIMIT_RPS)
-        if tokens < 1.0:
-            state["tokens"] = tokens
-            state["last"] = now
-            return False
-        state["tokens"] = tokens - 1.0
-        state["last"] = now
-    return True
-
+def _get_client_ip(handler):
+    return _client_ip(handler.headers, handler.client_address)
 
-def _score_sort_key(entry):
-    return (
-        _safe_float(entry.get("score", 0)),
-        _safe_float(entry.get("time", 0)),
-        _safe_float(entry.get("created", 0)),
-    )
 
+class _Bucket:
+    __slots__ = ("tokens", "last")
 
-def _prune_leaderboard(now):
-    if BOARD_TTL <= 0:
-        return
-    cutoff = now - BOARD_TTL
-    global LEADERBOARD
-    LEADERBOARD = [
-        e for e in LEADERBOARD if _safe_float(e.get("created", now), now) >= cutoff
-    ]
+    def __init__(self, tokens, last):
+        self.tokens = tokens
+        self.last = last
 
 
-def load_board():
+class RateLimiter:
     """
-    Charge le leaderboard depuis `scores.json`.
-
-    Compatibilité:
-    - Ancien format (liste d'objets avec `best`/`bestTime`) -> converti en entrées `score`/`time`.
-    - Nouveau format (liste d'objets avec `score`/`time`).
+    Seaux à jetons par IP, répartis sur `shards` dictionnaires ordonnés (un
+    verrou chacun). L'ordre d'un shard est celui du dernier passage: les seaux
+    inactifs sont en tête. Un seau inactif depuis `burst / rps` est plein, donc
+    identique à un seau neuf, et peut être oublié sans rien changer; au-delà de
+    `max_ips`, les seaux les moins récents sont évincés.
     """
-    global LEADERBOARD
-    try:
-        with open(SCORES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        return
-    except Exception:
-        return
 
-    if not isinstance(data, list):
-        return
+    def __init__(self, rps, burst, max_ips=RATE_LIMIT_MAX_IPS, shards=RATE_LIMIT_SHARDS):
+        self.rps = float(rps)
+        self.burst = float(burst)
+        self.enabled = self.rps > 0 and self.burst > 0
+        self.idle = self.burst / self.rps if self.enabled else 0.0
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._cap = max(1, max_ips // shards)
+        # compteurs par shard, mis à jour sous le verrou du shard
+        self._rejected = [0] * shards
+        self._evicted = [0] * shards
 
-    loaded = []
-    now = time.time()
-    for raw in data:
-        if not isinstance(raw, dict):
-            continue
-        score = raw.get("score", None)
-        if score is None:
-            score = raw.get("best", 0)
-        t = raw.get("time", None)
-        if t is None:
-            t = raw.get("bestTime", 0)
-        created = _safe_float(raw.get("created", raw.get("updated", now)), now)
-        entry_id = str(raw.get("id") or "").strip()
-        if not entry_id:
-            entry_id = f"s-{int(created * 1000)}-{secrets.token_urlsafe(6)}"
-        loaded.append(
-            {
-                "id": entry_id,
-                "name": _normalize_name(raw.get("name")),
-                "color": _normalize_color(raw.get("color")),
-                "score": max(_safe_float(score, 0.0), 0.0),
-                "time": max(_safe_float(t, 0.0), 0.0),
-                "created": created,
-            }
-        )
+    def consume(self, ip, now):
+        if not self.enabled:
+            return True
+        index = hash(ip) % len(self._shards)
+        buckets = self._shards[index]
+        with self._locks[index]:
+            bucket = buckets.get(ip)
+            if bucket is None:
+                if len(buckets) >= self._cap:
+                    self._evicted[index] += self._evict(buckets, now)
+                buckets[ip] = _Bucket(self.burst - 1.0, now)
+                return True
+            buckets.move_to_end(ip)
+            tokens = min(self.burst, bucket.tokens + max(0.0, now - bucket.last) * self.rps)
+            bucket.last = now
+            if tokens < 1.0:
+                bucket.tokens = tokens
+                self._rejected[index] += 1
+                return False
+            bucket.tokens = tokens - 1.0
+        return True
 
-    loaded.sort(key=_score_sort_key, reverse=True)
-    LEADERBOARD = loaded[:MAX_STORE]
+    def _evict(self, buckets, now):
+        # appelé verrou du shard tenu: oublie les seaux pleins, sinon le moins récent
+        cutoff = now - self.idle
+        dropped = 0
+        for ip, bucket in buckets.items():
+            if bucket.last > cutoff:
+                break
+            dropped += 1
+        if not dropped and buckets:
+            dropped = 1
+        for _ in range(dropped):
+            buckets.popitem(last=False)
+        return dropped
 
+    def sweep(self, now):
+        """Oublie les seaux inactifs de tous les shards; renvoie leur nombre."""
+        if not self.enabled:
+            return 0
+        cutoff = now - self.idle
+        total = 0
+        for index, buckets in enumerate(self._shards):
+            with self._locks[index]:
+                dropped = 0
+                while buckets:
+                    ip, bucket = next(iter(buckets.items()))
+                    if bucket.last > cutoff:
+                        break
+                    del buckets[ip]
+                    dropped += 1
+                self._evicted[index] += dropped
+            total += dropped
+        return total
 
-def save_board(force=False):
-    global LAST_SAVE
-    if DRY_RUN:
-        return
-    now = time.time()
-    if not force and now - LAST_SAVE < SAVE_INTERVAL:
-        return
-    LAST_SAVE = now
-    try:
-        tmp = SCORES_FILE + ".tmp"
-        board = sorted(LEADERBOARD, key=_score_sort_key, reverse=True)[:MAX_STORE]
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(board, f)
-        os.replace(tmp, SCORES_FILE)
-    except Exception:
-        return
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._shards)
 
+    def snapshot(self, now):
+        """`[ip, jetons]` des seaux entamés à `now` (un seau plein équivaut à un seau neuf)."""
+        rows = []
+        if not self.enabled:
+            return rows
+        for index, buckets in enumerate(self._shards):
+            with self._locks[index]:
+                for ip, bucket in buckets.items():
+                    tokens = min(self.burst, bucket.tokens + max(0.0, now - bucket.last) * self.rps)
+                    if tokens < self.burst:
+                        rows.append([ip, round(tokens, 3)])
+        return rows
 
-def _add_score_entry(name, score, t, color=None):
-    now = time.time()
-    entry = {
-        "id": f"s-{int(now * 1000)}-{secrets.token_urlsafe(6)}",
-        "name": _normalize_name(name),
-        "color": _normalize_color(color),
-        "score": max(_safe_float(score, 0.0), 0.0),
-        "time": max(_safe_float(t, 0.0), 0.0),
-        "created": now,
-    }
-    if entry["score"] <= 0:
-        return None
-    LEADERBOARD.append(entry)
-    _prune_leaderboard(now)
-    LEADERBOARD.sort(key=_score_sort_key, reverse=True)
-    del LEADERBOARD[MAX_STORE:]
-    # sur une soumission explicite de score, on force la persistance (le rythme est faible)
-    save_board(force=True)
-    return entry
+    def restore(self, rows, now):
+        """Recharge les seaux d'un `snapshot` pris à `now`."""
+        if not self.enabled:
+            return
+        for row in rows:
+            try:
+                ip, tokens = str(row[0]), min(self.burst, max(0.0, float(row[1])))
+            except (TypeError, ValueError, IndexError):
+                continue
+            index = hash(ip) % len(self._shards)
+            with self._locks[index]:
+                buckets = self._shards[index]
+                if ip not in buckets and len(buckets) >= self._cap:
+                    continue
+                buckets[ip] = _Bucket(tokens, now)
+                buckets.move_to_end(ip)
 
+    def stats(self):
+        return {
+            "rps": self.rps,
+            "burst": self.burst,
+            "buckets": len(self),
+            "rejected": sum(self._rejected),
+            "evicted": sum(self._evicted),
+        }
 
-def _record_session_best(player):
-    if not isinstance(player, dict):
-        return None
-    if player.get("scoreRecorded"):
-        return None
-    best_score = max(_safe_float(player.get("best", player.get("score", 0)), 0.0), 0.0)
-    best_time = max(
-        _safe_float(player.get("bestTime", player.get("time", 0)), 0.0), 0.0
-    )
-    player["scoreRecorded"] = True
-    if best_score <= 0:
-        return None
-    return _add_score_entry(
-        name=player.get("name"),
-        score=best_score,
-        t=best_time,
-        color=player.get("color"),
-    )
 
+# budgets par route: les heartbeats /api/state et les scores ont leur propre seau
+RATE_LIMITERS = {
+    "state": RateLimiter(RATE_LIMIT_STATE_RPS, RATE_LIMIT_STATE_BURST),
+    "score": RateLimiter(RATE_LIMIT_SCORE_RPS, RATE_LIMIT_SCORE_BURST),
+    "default": RateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST),
+}
+RATE_ROUTES = {"/api/state": "state", "/api/score": "score"}
 
-class Handler(SimpleHTTPRequestHandler):
-    timeout = IDLE_TIMEOUT
 
-    def handle_one_request(self):
-        try:
-            return super().handle_one_request()
-        except (socket.timeout, ConnectionResetError, BrokenPipeError):
-            self.close_connection = True
-            return
+def _consume_rate_limit(ip, now, path=None):
+    limiter = RATE_LIMITERS.get(RATE_ROUTES.get(path, "default"))
+    if limiter is None:
+        return True
+    return limiter.consume(ip, now)
 
-    def _mark_response(self, status_code, resp_len=0):
-        self._last_status = status_code
-        self._last_response_len = resp_len
 
-    def _log_api(self, method, path, status, duration_ms, req_len, resp_len, ip):
-        print(
-            f"[api] {method} {path} {status} {duration_ms:.1f}ms "
-            f"in={req_len} out={resp_len} ip={ip}"
+class LoadMonitor:
+    """
+    Charge du serveur: requêtes API en cours, latence moyenne (EWMA) de leur
+    traitement et retard de la boucle asyncio. `level()` en déduit le niveau de
+    délestage de /api/state: 1 = sans classement, moins de pairs; 2 = sans
+    pairs; 3 = une partie des heartbeats refusés (503). Chaque niveau double
+    l'intervalle de synchronisation conseillé aux clients (`syncIntervalMs`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.latency = 0.0  # seconds, EWMA
+        self.lag = 0.0  # seconds, EWMA du retard de la boucle asyncio
+        self.shed = {"board": 0, "peers": 0, "heartbeat": 0}
+
+    def begin(self):
+        with self._lock:
+            self.inflight += 1
+
+    def end(self, elapsed):
+        with self._lock:
+            self.inflight -= 1
+            self.latency += LOAD_EWMA_ALPHA * (elapsed - self.latency)
+
+    def observe_lag(self, lag):
+        self.lag += LOAD_EWMA_ALPHA * (lag - self.lag)
+
+    def pressure(self):
+        if LOAD_SHED_LATENCY_MS <= 0:
+            return 0.0
+        return max(
+            self.inflight / LOAD_SHED_INFLIGHT if LOAD_SHED_INFLIGHT > 0 else 0.0,
+            self.latency * 1000 / LOAD_SHED_LATENCY_MS,
+            self.lag * 1000 / LOAD_SHED_LATENCY_MS,
         )
 
-    def _cache_control_for_path(self):
-        if CACHE_MAX_AGE <= 0:
-            return "no-store"
-        path = (self.path or "").split("?", 1)[0]
-        if path in ("", "/") or path.endswith(".html") or path.endswith(".json"):
-            return "no-cache"
-        return f"public, max-age={CACHE_MAX_AGE}"
+    def level(self, pressure=None):
+        pressure = self.pressure() if pressure is None else pressure
+        if pressure < 1:
+            return 0
+        if pressure < 2:
+            return 1
+        if pressure < 4:
+            return 2
+        return 3
 
-    def end_headers(self):
-        header_buf = getattr(self, "_headers_buffer", None) or []
-        if not any(b.lower().startswith(b"connection:") for b in header_buf):
-            self.send_header("Connection", "close")
-        if self.command in ("GET", "HEAD") and not self.path.startswith("/api"):
-            if not any(b.lower().startswith(b"cache-control:") for b in header_buf):
-                self.send_header("Cache-Control", self._cache_control_for_path())
-        super().end_headers()
-        self.close_connection = True
+    @staticmethod
+    def sync_interval_ms(level):
+        return SYNC_INTERVAL_MS << level
 
-    def _set_cors(self):
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "POST, GET, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type, X-Admin-Token")
-
-    def _write_json(self, status_code, payload):
-        resp = json.dumps(payload).encode()
-        self._mark_response(status_code, len(resp))
-        self.send_response(status_code)
-        self._set_cors()
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Cache-Control", "no-store")
-        self.send_header("Content-Length", str(len(resp)))
-        self.end_headers()
-        self.wfile.write(resp)
+    def reject_heartbeat(self, pressure):
+        """Niveau 3: refuse une part croissante des heartbeats (au plus 90%)."""
+        if random.random() < min(0.9, (pressure - 2) / 4):
+            self.count("heartbeat")
+            return True
+        return False
 
-    def send_error(self, code, message=None, explain=None):
-        self._mark_response(code, 0)
-        return super().send_error(code, message, explain)
+    def count(self, kind):
+        with self._lock:
+            self.shed[kind] += 1
 
-    def do_OPTIONS(self):
-        self.send_response(204)
-        self._set_cors()
-        self.end_headers()
+    def stats(self):
+        pressure = self.pressure()
+        with self._lock:
+            return {
+                "inflight": self.inflight,
+                "latencyMs": round(self.latency * 1000, 3),
+                "lagMs": round(self.lag * 1000, 3),
+                "pressure": round(pressure, 3),
+                "level": self.level(pressure),
+                "shed": dict(self.shed),
+            }
 
-    def do_POST(self):
-        parsed = urlparse(self.path)
-        if parsed.path not in ("/api/state", "/api/score", "/api/leave", "/api/reset"):
-            return super().do_POST()
-        start = time.perf_counter()
-        ip = _get_client_ip(self)
-        req_len = 0
-        self._last_status = None
-        self._last_response_len = 0
 
-        try:
-            try:
-                length = int(self.headers.get("Content-Length", "0") or 0)
-            except ValueError:
-                self.send_error(400, "bad Content-Length")
-                return
-            req_len = length
-            if length < 0:
-                self.send_error(400, "bad Content-Length")
-                return
-            if length > MAX_BODY_BYTES:
-                if length:
-                    try:
-                        self.rfile.read(length)
-                    except Exception:
-                        pass
-                self.send_error(413, "payload too large")
-                return
-            if not _consume_rate_limit(ip, time.time()):
-                if length:
-                    try:
-                        self.rfile.read(length)
-                    except Exception:
-                        pass
-                self.send_error(429, "too many requests")
-                return
-            raw = self.rfile.read(length) if length else b""
-            try:
-                data = json.loads(raw or b"{}")
-            except Exception:
-                self.send_error(400, "bad json")
-                return
+LOAD = LoadMonitor()
 
-            if parsed.path == "/api/reset":
-                token = (data.get("token") or data.get("adminToken") or "").strip()
-                header_token = (self.headers.get("X-Admin-Token") or "").strip()
-                if not ADMIN_TOKEN:
-                    self.send_error(403, "reset disabled")
-                    return
-                if not token:
-                    token = header_token
-                if token != ADMIN_TOKEN:
-                    self.send_error(403, "invalid token")
-                    return
-                with LOCK:
-                    LEADERBOARD.clear()
-                    save_board(force=True)
-                    now = time.time()
-                self._write_json(200, {"ok": True, "cleared": True, "serverTime": now})
-                return
 
-            if parsed.path == "/api/score":
-                name = _normalize_name(data.get("name"))
-                score = _safe_float(data.get("score", 0), 0.0)
-                t = _safe_float(data.get("time", 0), 0.0)
-                color = _normalize_color(data.get("color"))
-                session_id = _normalize_session_id(
-                    data.get("sessionId") or data.get("sid") or data.get("id")
-                )
-                with LOCK:
-                    entry = _add_score_entry(name=name, score=score, t=t, color=color)
-                    if session_id and session_id in PLAYERS and entry:
-                        player = PLAYERS[session_id]
-                        player["scoreRecorded"] = True
-                        prev_best = max(_safe_float(player.get("best", 0), 0.0), 0.0)
-                        prev_time = max(_safe_float(player.get("bestTime", 0), 0.0), 0.0)
-                        if entry["score"] > prev_best or (
-                            entry["score"] == prev_best and entry["time"] > prev_time
-                        ):
-                            player["best"] = entry["score"]
-                            player["bestTime"] = entry["time"]
-                            player["score"] = entry["score"]
-                            player["time"] = entry["time"]
-                    board = sorted(LEADERBOARD, key=_score_sort_key, reverse=True)[:MAX_BOARD]
-                    now = time.time()
-                if not entry:
-                    self.send_error(400, "invalid score")
-                    return
-                self._write_json(200, {"ok": True, "board": board, "serverTime": now})
-                return
+def _score_sort_key(entry):
+    return (
+        _safe_float(entry.get("score", 0)),
+        _safe_float(entry.get("time", 0)),
+        _safe_float(entry.get("created", 0)),
+    )
 
-            if parsed.path == "/api/leave":
-                session_id = _normalize_session_id(
-                    data.get("sessionId") or data.get("sid") or data.get("id")
-                )
-                client_id = _normalize_client_id(data.get("clientId"))
-                instance_id = _normalize_instance_id(data.get("instanceId"))
-                if not session_id and not client_id:
-                    self.send_error(400, "missing sessionId/clientId")
-                    return
 
-                with LOCK:
-                    removed_ids = []
-                    if client_id:
-                        for sid, player in list(PLAYERS.items()):
-                            if _normalize_client_id(player.get("clientId")) != client_id:
-                                continue
-                            player_instance = _normalize_instance_id(player.get("instanceId"))
-                            if instance_id:
-                                if player_instance != instance_id:
-                                    continue
-                            else:
-                                if player_instance:
-                                    continue
-                            _record_session_best(player)
-                            removed_ids.append(sid)
-                            del PLAYERS[sid]
-                    if session_id and session_id in PLAYERS:
-                        _record_session_best(PLAYERS[session_id])
-                        removed_ids.append(session_id)
-                        del PLAYERS[session_id]
-                    now = time.time()
-
-                self._write_json(
-                    200,
-                    {
-                        "ok": True,
-                        "removed": bool(removed_ids),
-                        "removedIds": removed_ids,
-                        "serverTime": now,
-                    },
-                )
-                return
+class RankedBoard:
+    """
+    Entrées de scores triées par `_score_sort_key` décroissant. Insertion par
+    bisect (ou rejet immédiat sous la coupure `limit`), purge TTL dans l'ordre
+    de création. Les entrées ne doivent plus être modifiées une fois ajoutées.
+    """
 
-            session_id = _normalize_session_id(
-                data.get("sessionId") or data.get("sid") or data.get("id")
-            )
-            if not session_id:
-                self.send_error(400, "missing sessionId")
-                return
+    __slots__ = ("_keys", "_entries", "_created", "_by_id")
 
-            now = time.time()
-            since = _safe_float(data.get("since", 0), 0.0)
-            too_many = False
-            peers = []
-            board = []
-            with LOCK:
-                prev = PLAYERS.get(session_id, {})
-                session_is_new = session_id not in PLAYERS
-                if MAX_SESSIONS_PER_IP > 0 and session_is_new:
-                    current = sum(1 for p in PLAYERS.values() if p.get("ip") == ip)
-                    if current >= MAX_SESSIONS_PER_IP:
-                        too_many = True
-                if not too_many:
-                    client_id = _normalize_client_id(
-                        data.get("clientId") or prev.get("clientId")
-                    )
-                    instance_id = _normalize_instance_id(
-                        data.get("instanceId") or prev.get("instanceId")
-                    )
+    def __init__(self, entries=(), limit=None):
+        self._keys = []  # clés de rang croissantes, alignées sur _entries
+        self._entries = []
+        self._created = []  # (created, id) croissants
+        self._by_id = {}
+        for entry in entries:
+            self.add(entry, limit)
 
-                    # anti-dup: si un même clientId revient avec une autre session (reload/onglet), on nettoie ses anciennes sessions
-                    if client_id:
-                        for sid, player in list(PLAYERS.items()):
-                            if sid == session_id:
-                                continue
-                            if _normalize_client_id(player.get("clientId")) != client_id:
-                                continue
-                            player_instance = _normalize_instance_id(player.get("instanceId"))
-                            if instance_id:
-                                if player_instance != instance_id:
-                                    continue
-                            else:
-                                if player_instance:
-                                    continue
-                            del PLAYERS[sid]
-
-                    incoming_score = max(_safe_float(data.get("score", 0), 0.0), 0.0)
-                    incoming_time = max(_safe_float(data.get("time", 0), 0.0), 0.0)
-
-                    # compat: si le client envoie best/bestTime on les prend en compte
-                    incoming_best = max(
-                        _safe_float(data.get("best", incoming_score), 0.0), 0.0
-                    )
-                    incoming_best_time = max(
-                        _safe_float(data.get("bestTime", incoming_time), 0.0), 0.0
-                    )
+    @staticmethod
+    def _rank_key(entry):
+        score, t, created = _score_sort_key(entry)
+        # l'id départage les égalités: chaque clé est unique, retrouvée par bisect
+        return (-score, -t, -created, entry["id"])
 
-                    prev_best = max(_safe_float(prev.get("best", 0), 0.0), 0.0)
-                    prev_best_time = max(_safe_float(prev.get("bestTime", 0), 0.0), 0.0)
-
-                    incoming_pulse_seq = max(_safe_int(data.get("pulseSeq", 0), 0), 0)
-                    prev_pulse_seq = max(_safe_int(prev.get("pulseSeq", 0), 0), 0)
-                    pulse_seq = max(incoming_pulse_seq, prev_pulse_seq)
-                    pulse_at = _safe_float(prev.get("pulseAt", 0), 0.0)
-                    if incoming_pulse_seq > prev_pulse_seq:
-                        pulse_at = now
-
-                    # meilleur (score, puis time en tie-break)
-                    best_score = prev_best
-                    best_time = prev_best_time
-                    if (incoming_best > best_score) or (
-                        incoming_best == best_score and incoming_best_time > best_time
-                    ):
-                        best_score, best_time = incoming_best, incoming_best_time
-                    if (incoming_score > best_score) or (
-                        incoming_score == best_score and incoming_time > best_time
-                    ):
-                        best_score, best_time = incoming_score, incoming_time
-
-                    PLAYERS[session_id] = {
-                        "id": session_id,
-                        "clientId": client_id,
-                        "instanceId": instance_id,
-                        "x": _safe_float(data.get("x", 0), 0.0),
-                        "y": _safe_float(data.get("y", 0), 0.0),
-                        "color": _normalize_color(data.get("color", prev.get("color"))),
-                        "name": _normalize_name(data.get("name", prev.get("name"))),
-                        # "score/time" = meilleur de la session (ce que tu veux afficher dans le classement)
-                        "score": best_score,
-                        "time": best_time,
-                        "best": best_score,
-                        "bestTime": best_time,
-                        # champs additionnels non cassants (utile si tu veux afficher du "live" côté client plus tard)
-                        "currentScore": incoming_score,
-                        "currentTime": incoming_time,
-                        "pulseSeq": pulse_seq,
-                        "pulseAt": pulse_at,
-                        "ts": now,
-                        "ip": ip,
-                        "scoreRecorded": bool(prev.get("scoreRecorded", False)),
-                    }
-                    # prune stale players
-                    for key in list(PLAYERS.keys()):
-                        if now - PLAYERS[key]["ts"] > EXPIRATION:
-                            _record_session_best(PLAYERS[key])
-                            del PLAYERS[key]
-
-                    if since > 0:
-                        peers = [
-                            v
-                            for k, v in PLAYERS.items()
-                            if k != session_id and v.get("ts", 0) > since
-                        ]
-                    else:
-                        peers = [v for k, v in PLAYERS.items() if k != session_id]
-
-                    _prune_leaderboard(now)
-                    board = sorted(LEADERBOARD, key=_score_sort_key, reverse=True)[
-                        :MAX_BOARD
-                    ]
-
-            if too_many:
-                self.send_error(429, "too many sessions")
-                return
+    def __len__(self):
+        return len(self._entries)
 
-            self._write_json(
-                200, {"ok": True, "players": peers, "board": board, "serverTime": now}
-            )
-        finally:
-            if self._last_status is not None:
-                duration = (time.perf_counter() - start) * 1000
-                self._log_api(
-                    "POST",
-                    parsed.path,
-                    self._last_status,
-                    duration,
-                    req_len,
-                    self._last_response_len,
-                    ip,
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __contains__(self, entry_id):
+        return entry_id in self._by_id
+
+    def get(self, entry_id):
+        return self._by_id.get(entry_id)
+
+    def add(self, entry, limit=None):
+        """Insère `entry`; renvoie False si l'id existe déjà ou si l'entrée tombe sous la coupure."""
+        if entry["id"] in self._by_id:
+            return False
+        key = self._rank_key(entry)
+        if limit is not None and len(self._keys) >= limit:
+            if limit <= 0 or key > self._keys[-1]:
+                return False
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._entries.insert(i, entry)
+        bisect.insort(self._created, (-key[2], entry["id"]))
+        self._by_id[entry["id"]] = entry
+        if limit is not None:
+            while len(self._keys) > limit:
+                self._pop(len(self._keys) - 1)
+        return True
+
+    def _pop(self, i):
+        key = self._keys.pop(i)
+        entry = self._entries.pop(i)
+        del self._by_id[entry["id"]]
+        j = bisect.bisect_left(self._created, (-key[2], entry["id"]))
+        del self._created[j]
+        return entry
+
+    def remove(self, entry_id):
+        """Retire l'entrée `entry_id` et la renvoie (None si absente)."""
+        entry = self._by_id.get(entry_id)
+        if entry is None:
+            return None
+        return self._pop(bisect.bisect_left(self._keys, self._rank_key(entry)))
+
+    def rank(self, entry_id):
+        """Rang (1 = meilleur) de l'entrée `entry_id`, None si absente."""
+        entry = self._by_id.get(entry_id)
+        if entry is None:
+            return None
+        return bisect.bisect_left(self._keys, self._rank_key(entry)) + 1
+
+    def rank_for(self, score, t=0.0):
+        """Rang d'un nouveau score: 1 + nombre d'entrées strictement meilleures."""
+        return bisect.bisect_left(self._keys, (-score, -t, -math.inf, "")) + 1
+
+    def expire(self, cutoff):
+        """Retire et renvoie les entrées créées avant `cutoff`, sans parcourir le reste."""
+        expired = []
+        while self._created and self._created[0][0] < cutoff:
+            expired.append(self.remove(self._created[0][1]))
+        return expired
+
+    def clear(self):
+        self._keys.clear()
+        self._entries.clear()
+        self._created.clear()
+        self._by_id.clear()
+
+
+# top MAX_BOARD figé: `entries` (tuple de dicts copiés), `json` (encodage de la liste)
+# et `tag` (identifiant exposé comme `boardVersion` et ETag)
+BoardSnapshot = namedtuple("BoardSnapshot", ("version", "entries", "json", "tag"))
+
+
+LEADERBOARD = RankedBoard()  # entrées de scores (persistées), triées par _score_sort_key
+
+
+# _board_changed, _board_snapshot et _prune_leaderboard s'appellent sous BOARD_LOCK
+def _board_changed():
+    global BOARD_VERSION, BOARD_SNAPSHOT
+    BOARD_VERSION += 1
+    BOARD_SNAPSHOT = None
+
+
+def _board_snapshot():
+    """Renvoie le top MAX_BOARD courant; ne re-trie ni ne ré-encode tant que rien ne change."""
+    global BOARD_SNAPSHOT
+    snapshot = BOARD_SNAPSHOT
+    if snapshot is not None and snapshot.version == BOARD_VERSION:
+        return snapshot
+    entries = tuple(dict(e) for e in LEADERBOARD[:MAX_BOARD])
+    snapshot = BoardSnapshot(
+        BOARD_VERSION,
+        entries,
+        json.dumps(list(entries)).encode(),
+        f"{BOARD_EPOCH}-{BOARD_VERSION}",
+    )
+    BOARD_SNAPSHOT = snapshot
+    return snapshot
+
+
+class ScoreIndex:
+    """
+    Scores seuls d'un store profond, pour le rang hors du top MAX_STORE en
+    mémoire: triés (scores négés, `array('d')`) pour compter les meilleurs par
+    bisection, et rangés par date de création pour purger ce qui sort de la
+    fenêtre (`expire`).
+    """
+
+    __slots__ = ("_by_score", "_created", "_scores")
+
+    # au-delà, `expire` retrie le reste plutôt que de retirer les scores un à un
+    REBUILD_AT = 256
+
+    def __init__(self, rows=()):
+        self._created = array("d")  # dates de création croissantes
+        self._scores = array("d")  # score de chaque date de `_created`
+        self._by_score = array("d")  # scores négés croissants
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self._by_score)
+
+    def copy(self):
+        index = ScoreIndex()
+        index._created = array("d", self._created)
+        index._scores = array("d", self._scores)
+        index._by_score = array("d", self._by_score)
+        return index
+
+    def add(self, score, created):
+        self._by_score.insert(bisect.bisect_left(self._by_score, -score), -score)
+        i = bisect.bisect_right(self._created, created)
+        self._created.insert(i, created)
+        self._scores.insert(i, score)
+
+    def extend(self, rows):
+        """Ajoute des `(score, created)`; en nombre, retrie tout plutôt que d'insérer un à un."""
+        rows = list(rows)
+        if len(rows) < self.REBUILD_AT:
+            for score, created in rows:
+                self.add(float(score), float(created))
+            return
+        rows.extend(zip(self._scores, self._created))
+        rows = sorted((float(created), float(score)) for score, created in rows)
+        self._created = array("d", [created for created, _ in rows])
+        self._scores = array("d", [score for _, score in rows])
+        self._by_score = array("d", sorted(-score for _, score in rows))
+
+    def expire(self, cutoff):
+        """Retire les scores créés avant `cutoff`."""
+        n = bisect.bisect_left(self._created, cutoff)
+        if not n:
+            return
+        if n >= self.REBUILD_AT:
+            self._by_score = array("d", sorted(-score for score in self._scores[n:]))
+        else:
+            for score in self._scores[:n]:
+                del self._by_score[bisect.bisect_left(self._by_score, -score)]
+        del self._created[:n]
+        del self._scores[:n]
+
+    def better(self, score):
+        """Nombre de scores strictement supérieurs à `score`."""
+        return bisect.bisect_left(self._by_score, -score)
+
+    def clear(self):
+        del self._created[:]
+        del self._scores[:]
+        del self._by_score[:]
+
+
+class WindowBoard:
+    """
+    Classement d'une fenêtre de temps UTC (jour, semaine), tenu à jour à chaque
+    score et vidé au changement de fenêtre; instantané mis en cache par version.
+    """
+
+    __slots__ = ("name", "period", "offset", "start", "board", "version", "snapshot")
+
+    def __init__(self, name, period, offset=0.0):
+        self.name = name
+        self.period = period
+        self.offset = offset  # décalage du début de fenêtre par rapport à l'epoch
+        self.start = None
+        self.board = RankedBoard()
+        self.version = 0
+        self.snapshot = None
+
+    def _changed(self):
+        self.version += 1
+        self.snapshot = None
+
+    def roll(self, now):
+        start = math.floor((now - self.offset) / self.period) * self.period + self.offset
+        if start != self.start:
+            self.start = start
+            self.board = RankedBoard()
+            self._changed()
+
+    def add(self, entry, now):
+        self.roll(now)
+        if _safe_float(entry.get("created"), 0.0) < self.start:
+            return
+        if self.board.add(entry, MAX_STORE):
+            self._changed()
+
+    def remove(self, entry_id):
+        if self.board.remove(entry_id) is not None:
+            self._changed()
+
+    def clear(self):
+        self.board = RankedBoard()
+        self._changed()
+
+    def top(self, now):
+        """Instantané du top MAX_BOARD de la fenêtre courante (BoardSnapshot)."""
+        self.roll(now)
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == self.version:
+            return snapshot
+        entries = tuple(dict(e) for e in self.board[:MAX_BOARD])
+        snapshot = BoardSnapshot(
+            self.version,
+            entries,
+            json.dumps(list(entries)).encode(),
+            f"{BOARD_EPOCH}-{self.name}{int(self.start)}-{self.version}",
+        )
+        self.snapshot = snapshot
+        return snapshot
+
+
+# fenêtres en plus du classement complet ("all"); la semaine commence le lundi (epoch = jeudi)
+BOARD_WINDOWS = {
+    "day": WindowBoard("day", 86400.0),
+    "week": WindowBoard("week", 7 * 86400.0, 4 * 86400.0),
+}
+
+
+def _board_view(window, now):
+    """`(RankedBoard, BoardSnapshot)` de la fenêtre `window`; sous BOARD_LOCK."""
+    if window == "all":
+        return LEADERBOARD, _board_snapshot()
+    board = BOARD_WINDOWS[window]
+    snapshot = board.top(now)
+    return board.board, snapshot
+
+
+def _etag_matches(header_value, tag):
+    """Vrai si un en-tête `If-None-Match` désigne l'ETag `"tag"` (comparaison faible)."""
+    if not header_value:
+        return False
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == tag:
+            return True
+    return False
+
+
+def _prune_leaderboard(now):
+    if BOARD_TTL <= 0:
+        return
+    cutoff = now - BOARD_TTL
+    evicted = LEADERBOARD.expire(cutoff)
+    if not evicted:
+        return
+    for board in BOARD_WINDOWS.values():
+        for e in evicted:
+            board.remove(e["id"])
+    _board_changed()
+    BOARD_WRITER.record({"op": "evict", "ids": [e["id"] for e in evicted]})
+
+
+def _entry_from_raw(raw, now):
+    """Entrée normalisée depuis un objet stocké (ancien format `best`/`bestTime` accepté)."""
+    score = raw.get("score", None)
+    if score is None:
+        score = raw.get("best", 0)
+    t = raw.get("time", None)
+    if t is None:
+        t = raw.get("bestTime", 0)
+    created = _safe_float(raw.get("created", raw.get("updated", now)), now)
+    entry_id = str(raw.get("id") or "").strip()
+    if not entry_id:
+        entry_id = f"s-{int(created * 1000)}-{secrets.token_urlsafe(6)}"
+    return {
+        "id": entry_id,
+        "name": _normalize_name(raw.get("name")),
+        "color": _normalize_color(raw.get("color")),
+        "score": _safe_score(score),
+        "time": _safe_score(t),
+        "created": created,
+    }
+
+
+def _apply_journal_event(board, event, now, truncate=True):
+    """
+    Rejoue un événement du journal sur `board` (RankedBoard). Idempotent: une
+    compaction interrompue avant la remise à zéro du journal ne duplique rien.
+    """
+    op = event.get("op")
+    if op == "add" and isinstance(event.get("entry"), dict):
+        # même troncature à MAX_STORE qu'en ligne, pour que les `evict` suivants retombent juste
+        board.add(_entry_from_raw(event["entry"], now), MAX_STORE if truncate else None)
+    elif op == "evict":
+        for entry_id in event.get("ids") or ():
+            board.remove(entry_id)
+    elif op == "reset":
+        board.clear()
+
+
+def _replay_journal(board, now, recent=None):
+    """
+    Applique le journal `JOURNAL_FILE` à `board` (et sans troncature à `recent`
+    s'il est donné); renvoie le nombre d'événements lus.
+    """
+    try:
+        f = open(JOURNAL_FILE, "r", encoding="utf-8")
+    except OSError:
+        return 0
+    count = 0
+    with f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # dernière ligne tronquée par un arrêt brutal
+                continue
+            if isinstance(event, dict):
+                _apply_journal_event(board, event, now)
+                if recent is not None:
+                    _apply_journal_event(recent, event, now, truncate=False)
+                count += 1
+    return count
+
+
+def load_board():
+    """
+    Charge le leaderboard depuis STORE (voir `JsonStore.load`/`SqliteStore.load`).
+
+    Compatibilité:
+    - Ancien format (liste d'objets avec `best`/`bestTime`) -> converti en entrées `score`/`time`.
+    - Nouveau format (liste d'objets avec `score`/`time`).
+    """
+    global LEADERBOARD
+    now = time.time()
+    loaded, replayed = STORE.load(now)
+    with BOARD_LOCK:
+        LEADERBOARD = loaded
+        _board_changed()
+        for board in BOARD_WINDOWS.values():
+            board.clear()
+            board.roll(now)
+            # les scores de la fenêtre sous la coupure MAX_STORE sont encore dans le store
+            for entry in STORE.top(MAX_STORE, since=board.start):
+                board.add(entry, now)
+    BOARD_WRITER.journal_events = replayed
+
+
+def _append_journal(events):
+    """Ajoute des événements au journal, une ligne JSON chacun (False si l'écriture échoue)."""
+    if DRY_RUN:
+        return True
+    with SAVE_LOCK:
+        try:
+            with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e) + "\n" for e in events))
+                if SAVE_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+        except Exception:
+            return False
+    return True
+
+
+def save_board(board):
+    """
+    Compaction: écrit `board` comme instantané `scores.json` puis vide le
+    journal (False si l'écriture échoue). À appeler sans tenir BOARD_LOCK.
+    """
+    if DRY_RUN:
+        return True
+    with SAVE_LOCK:
+        try:
+            tmp = SCORES_FILE + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(board, f)
+                if SAVE_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, SCORES_FILE)
+            # un arrêt ici laisse un journal déjà inclus dans l'instantané: le rejeu l'ignore
+            with open(JOURNAL_FILE, "w", encoding="utf-8"):
+                pass
+        except Exception:
+            return False
+    return True
+
+
+class JsonStore:
+    """
+    Stockage par défaut: instantané `scores.json` + journal `scores.jsonl`, top
+    MAX_STORE seulement. L'instantané garde aussi, marqués `windowOnly`, les
+    scores du jour et de la semaine sous cette coupure (voir `BoardWriter.compact`):
+    `top` les rend au chargement pour reconstruire les fenêtres.
+    """
+
+    name = "json"
+    # ne conserve rien au-delà de LEADERBOARD: pas de recomplétion après une purge
+    deep = False
+
+    def __init__(self):
+        self._recent = RankedBoard()
+
+    def load(self, now):
+        """Renvoie `(RankedBoard, événements rejoués)`."""
+        try:
+            with open(SCORES_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = []
+        if not isinstance(data, list):
+            data = []
+        raws = [raw for raw in data if isinstance(raw, dict)]
+        loaded = RankedBoard(
+            (_entry_from_raw(raw, now) for raw in raws if not raw.get("windowOnly")), MAX_STORE
+        )
+        self._recent = RankedBoard(_entry_from_raw(raw, now) for raw in raws)
+        return loaded, _replay_journal(loaded, now, self._recent)
+
+    def append(self, events):
+        return _append_journal(events)
+
+    def compact(self, board, now):
+        return save_board(board)
+
+    def top(self, limit, since=None):
+        """Scores lus au dernier `load` (fenêtres), y compris sous la coupure MAX_STORE."""
+        return [e for e in self._recent if since is None or e["created"] >= since][:limit]
+
+    def observe(self, event):
+        return
+
+    def refresh_ranks(self):
+        return
+
+    def after_fork(self):
+        return
+
+    def close(self):
+        return
+
+
+class SqliteStore:
+    """
+    Stockage `sqlite3` (STORE=sqlite): garde tous les scores pendant BOARD_TTL,
+    LEADERBOARD n'en est que le top MAX_STORE en mémoire. Base en WAL ouverte
+    une fois: une connexion d'écriture (thread BoardWriter, chargement) et une
+    connexion de lecture partagée par les requêtes; la purge TTL se fait par
+    lots à la compaction. Les rangs hors du top viennent d'un ScoreIndex par
+    fenêtre, chargé avec la base et tenu à jour à chaque score enregistré
+    (`observe`).
+    """
+
+    name = "sqlite"
+    deep = True
+
+    def __init__(self, path):
+        self.path = path
+        self._open_lock = threading.Lock()
+        self._read_lock = threading.Lock()  # une requête à la fois sur la connexion de lecture
+        self._writer = None
+        self._reader = None
+        self._inherited = ()  # connexions du parent d'un worker forké, jamais réutilisées
+        self._ranks = {"all": ScoreIndex()}  # fenêtre ("all", "day", "week") -> ScoreIndex
+        self._ranks_lock = threading.Lock()
+        self._ranks_rowid = 0  # dernière ligne lue ou écrite par ce processus (`refresh_ranks`)
+
+    def _open(self):
+        """Ouvre la base: schéma et WAL une seule fois, sur la connexion d'écriture."""
+        with self._open_lock:
+            if self._writer is not None:
+                return
+            if DRY_RUN:
+                # DRY_RUN: lecture seule, sans créer la base ni ses tables ni passer en WAL
+                uri = "file:" + quote(os.path.abspath(self.path)) + "?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, timeout=10, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                self._reader = self._writer = conn
+                return
+            writer = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            writer.row_factory = sqlite3.Row
+            writer.execute("PRAGMA journal_mode=WAL")
+            writer.execute("PRAGMA synchronous=" + ("FULL" if SAVE_FSYNC else "NORMAL"))
+            writer.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS scores (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    color TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    time REAL NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS scores_rank ON scores (score DESC, time DESC, created DESC);
+                CREATE INDEX IF NOT EXISTS scores_created ON scores (created);
+                """
+            )
+            reader = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            reader.row_factory = sqlite3.Row
+            self._reader = reader
+            self._writer = writer
+
+    def _conn(self):
+        """Connexion d'écriture: thread BoardWriter seul, ou chargement avant son démarrage."""
+        if self._writer is None:
+            self._open()
+        return self._writer
+
+    def _read(self, sql, params=()):
+        """Lignes d'une requête de lecture, sur la connexion partagée."""
+        if self._reader is None:
+            self._open()
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def after_fork(self):
+        """
+        Côté worker forké: SQLite interdit de réutiliser une connexion ouverte avant
+        fork. Celles héritées du parent sont écartées sans être fermées (leur
+        fermeture toucherait aux fichiers WAL du parent); le worker ouvre les siennes.
+        """
+        self._inherited = (self._writer, self._reader)
+        self._writer = self._reader = None
+        self._open_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._ranks_lock = threading.Lock()
+
+    def close(self):
+        """Ferme les connexions (fin du thread BoardWriter); rouvertes au prochain accès."""
+        with self._open_lock:
+            writer, reader = self._writer, self._reader
+            self._writer = self._reader = None
+        if reader is not None and reader is not writer:
+            reader.close()
+        if writer is not None:
+            writer.close()
+
+    def _insert(self, conn, entries):
+        conn.executemany(
+            "INSERT OR IGNORE INTO scores (id, name, color, score, time, created)"
+            " VALUES (:id, :name, :color, :score, :time, :created)",
+            entries,
+        )
+
+    def load(self, now):
+        if not DRY_RUN:
+            conn = self._conn()
+            # première ouverture: reprise de scores.json / scores.jsonl existants
+            if conn.execute("SELECT 1 FROM scores LIMIT 1").fetchone() is None:
+                legacy, _ = JsonStore().load(now)
+                if legacy:
+                    with conn:
+                        self._insert(conn, legacy)
+        with self._ranks_lock:
+            self._ranks = {"all": ScoreIndex()}
+            self._ranks_rowid = 0
+        self.refresh_ranks()
+        return RankedBoard(self.top(MAX_STORE)), 0
+
+    def refresh_ranks(self):
+        """
+        Ajoute à l'index les lignes écrites par un autre processus depuis notre
+        dernière lecture ou écriture (chargement, puis fin d'une relève à chaud:
+        l'ancien processus a écrit ses derniers scores après notre chargement).
+        """
+        if DRY_RUN and not os.path.exists(self.path):
+            return
+        try:
+            rows = self._read(
+                "SELECT rowid, score, created FROM scores WHERE rowid > ? ORDER BY rowid",
+                (self._ranks_rowid,),
+            )
+        except sqlite3.Error:
+            if not DRY_RUN:
+                raise
+            return
+        with self._ranks_lock:
+            for index in self._ranks.values():
+                index.extend((row["score"], row["created"]) for row in rows)
+            if rows:
+                self._ranks_rowid = rows[-1]["rowid"]
+
+    def observe(self, event):
+        """Tient les index de rang à jour pour un événement du classement (sous BOARD_LOCK)."""
+        op = event.get("op")
+        # `evict` ne vient que de la purge TTL, que `expire` applique déjà aux index
+        if op == "add" and isinstance(event.get("entry"), dict):
+            entry = event["entry"]
+            score = _safe_score(entry.get("score"))
+            created = _safe_float(entry.get("created"), time.time())
+            with self._ranks_lock:
+                for index in self._ranks.values():
+                    index.add(score, created)
+        elif op == "reset":
+            with self._ranks_lock:
+                for index in self._ranks.values():
+                    index.clear()
+
+    def top(self, limit, since=None):
+        if DRY_RUN and not os.path.exists(self.path):
+            return []
+        try:
+            if since is None:
+                rows = self._read(
+                    "SELECT id, name, color, score, time, created FROM scores"
+                    " ORDER BY score DESC, time DESC, created DESC LIMIT ?",
+                    (limit,),
+                )
+            else:
+                rows = self._read(
+                    "SELECT id, name, color, score, time, created FROM scores WHERE created >= ?"
+                    " ORDER BY score DESC, time DESC, created DESC LIMIT ?",
+                    (since, limit),
+                )
+            return [dict(row) for row in rows]
+        except sqlite3.Error:
+            # DRY_RUN: base sans table `scores` (jamais initialisée)
+            if not DRY_RUN:
+                raise
+            return []
+
+    def get(self, entry_id):
+        """Entrée `entry_id` (dict), None si absente."""
+        if DRY_RUN and not os.path.exists(self.path):
+            return None
+        rows = self._read(
+            "SELECT id, name, color, score, time, created FROM scores WHERE id = ?", (entry_id,)
+        )
+        return dict(rows[0]) if rows else None
+
+    def rank(self, window, score, t, created=None, since=None):
+        """
+        `(rang, total)` d'un score parmi les scores de `window` créés depuis `since`:
+        scores strictement meilleurs par bisection dans le ScoreIndex, puis les
+        seuls ex aequo de même score départagés par la base (index `scores_rank`).
+        `created` départage les ex aequo; None pour un nouveau score, placé devant
+        eux comme dans `RankedBoard.rank_for`.
+        """
+        with self._ranks_lock:
+            index = self._ranks.get(window)
+            if index is None:
+                # première demande pour cette fenêtre: copie de l'index complet
+                index = self._ranks[window] = self._ranks["all"].copy()
+            if since is not None:
+                index.expire(since)
+            better, total = index.better(score), len(index)
+        since = -math.inf if since is None else since
+        if DRY_RUN and not os.path.exists(self.path):
+            ties = 0
+        elif created is None:
+            ties = self._read(
+                "SELECT COUNT(*) FROM scores WHERE score = ? AND time > ? AND created >= ?",
+                (score, t, since),
+            )[0][0]
+        else:
+            ties = self._read(
+                "SELECT COUNT(*) FROM scores WHERE score = ? AND (time, created) > (?, ?) AND created >= ?",
+                (score, t, created, since),
+            )[0][0]
+        rank = better + ties + 1
+        if created is not None:
+            # score déjà compté par `observe`; la base, écrite en différé, peut différer de l'index
+            rank = min(rank, total)
+        return rank, total
+
+    def append(self, events):
+        if DRY_RUN:
+            return True
+        conn = self._conn()
+        try:
+            with conn:
+                for event in events:
+                    op = event.get("op")
+                    if op == "add":
+                        self._insert(conn, [event["entry"]])
+                    elif op == "evict":
+                        ids = list(event.get("ids") or ())
+                        for i in range(0, len(ids), SQLITE_BATCH):
+                            chunk = ids[i : i + SQLITE_BATCH]
+                            conn.execute(
+                                "DELETE FROM scores WHERE id IN (%s)" % ",".join("?" * len(chunk)),
+                                chunk,
+                            )
+                    elif op == "reset":
+                        conn.execute("DELETE FROM scores")
+            # nos propres lignes sont déjà dans l'index (`observe`)
+            last = conn.execute("SELECT MAX(rowid) FROM scores").fetchone()[0] or 0
+        except sqlite3.Error:
+            return False
+        with self._ranks_lock:
+            self._ranks_rowid = max(self._ranks_rowid, last)
+        return True
+
+    def compact(self, board, now):
+        """Purge TTL par lots de SQLITE_BATCH lignes, une transaction courte par lot."""
+        if DRY_RUN or BOARD_TTL <= 0:
+            return True
+        conn = self._conn()
+        try:
+            while True:
+                with conn:
+                    cur = conn.execute(
+                        "DELETE FROM scores WHERE rowid IN"
+                        " (SELECT rowid FROM scores WHERE created < ? LIMIT ?)",
+                        (now - BOARD_TTL, SQLITE_BATCH),
+                    )
+                if cur.rowcount < SQLITE_BATCH:
+                    break
+        except sqlite3.Error:
+            return False
+        return True
+
+
+class BoardWriter:
+    """
+    Persistance write-behind du leaderboard: chaque modification est mise en
+    file (`record`, sous BOARD_LOCK pour garder l'ordre), un thread passe les
+    événements à STORE au plus une fois par `interval` et le compacte après
+    COMPACT_EVENTS événements ou COMPACT_INTERVAL secondes.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = SAVE_INTERVAL if interval is None else interval
+        self._cond = threading.Condition()
+        self._closed = False
+        self._events = deque()  # (seq, événement) pas encore dans le journal
+        self.seq = 0
+        self.journal_events = 0  # événements du journal depuis la dernière compaction
+        self.appends = 0
+        self.compactions = 0
+        self.errors = 0
+        self.flush_total = 0.0
+        self.flush_max = 0.0
+        self.compact_max = 0.0
+        self.last_flush = 0.0  # time.monotonic() du dernier ajout au journal
+        self.last_compact = time.monotonic()
+
+    def record(self, event):
+        with self._cond:
+            self.seq += 1
+            self._events.append((self.seq, event))
+            self._cond.notify()
+
+    def flush(self):
+        """Ajoute les événements en file au journal; renvoie True si un ajout a réussi."""
+        with self._cond:
+            batch = list(self._events)
+            self._events.clear()
+        if not batch:
+            return False
+        start = time.perf_counter()
+        ok = STORE.append([event for _, event in batch])
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            self.last_flush = time.monotonic()
+            if ok:
+                self.appends += 1
+                self.journal_events += len(batch)
+                self.flush_total += elapsed
+                self.flush_max = max(self.flush_max, elapsed)
+            else:
+                # on retentera au prochain intervalle, dans le même ordre
+                self.errors += 1
+                self._events.extendleft(reversed(batch))
+            due = self.journal_events >= COMPACT_EVENTS or (
+                self.journal_events
+                and time.monotonic() - self.last_compact >= COMPACT_INTERVAL
+            )
+        if ok and due:
+            self.compact()
+        if ok and STORE.deep:
+            self._refill()
+        return ok
+
+    def _refill(self):
+        """
+        Store profond: recomplète LEADERBOARD avec les scores sortis du top
+        MAX_STORE (troncature) quand des purges y ont fait de la place.
+        """
+        with BOARD_LOCK:
+            if len(LEADERBOARD) >= MAX_STORE:
+                return
+            with self._cond:
+                # des événements pas encore écrits: la base est en retard sur la mémoire
+                if self._events:
+                    return
+            try:
+                rows = STORE.top(MAX_STORE)
+            except sqlite3.Error:
+                return
+            cutoff = time.time() - BOARD_TTL if BOARD_TTL > 0 else None
+            added = 0
+            for row in rows:
+                if cutoff is not None and row["created"] < cutoff:
+                    continue
+                if LEADERBOARD.add(row, MAX_STORE):
+                    added += 1
+            if added:
+                _board_changed()
+
+    def compact(self):
+        """Écrit l'instantané et vide le journal; les événements en file déjà inclus sont abandonnés."""
+        start = time.perf_counter()
+        with BOARD_LOCK:
+            board = LEADERBOARD[:MAX_STORE]
+            if not STORE.deep:
+                # store JSON: les scores du jour/de la semaine sous la coupure survivent au redémarrage
+                kept = {e["id"] for e in board}
+                now = time.time()
+                for window in BOARD_WINDOWS.values():
+                    window.roll(now)
+                    for entry in window.board:
+                        if entry["id"] not in kept:
+                            kept.add(entry["id"])
+                            board.append(dict(entry, windowOnly=True))
+            with self._cond:
+                upto = self.seq
+        ok = STORE.compact(board, time.time())
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            if not ok:
+                self.errors += 1
+                return False
+            while self._events and self._events[0][0] <= upto:
+                self._events.popleft()
+            self.journal_events = 0
+            self.last_compact = time.monotonic()
+            self.compactions += 1
+            self.compact_max = max(self.compact_max, elapsed)
+        return True
+
+    def close(self):
+        """Demande l'arrêt du thread, qui compacte une dernière fois avant de sortir."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._events or self._closed)
+                if self._closed:
+                    break
+                delay = self.last_flush + self.interval - time.monotonic()
+                # regroupe les modifications arrivées pendant l'intervalle
+                if delay > 0:
+                    self._cond.wait_for(lambda: self._closed, delay)
+                    if self._closed:
+                        break
+            self.flush()
+        self.flush()
+        if self.journal_events:
+            self.compact()
+        STORE.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._events),
+                "journalEvents": self.journal_events,
+                "appends": self.appends,
+                "compactions": self.compactions,
+                "errors": self.errors,
+                "flushAvgMs": round(self.flush_total * 1000 / self.appends, 3)
+                if self.appends
+                else 0.0,
+                "flushMs": round(self.flush_total * 1000, 3),
+                "flushMaxMs": round(self.flush_max * 1000, 3),
+                "compactMaxMs": round(self.compact_max * 1000, 3),
+            }
+
+
+STORE = SqliteStore(SCORES_DB) if STORE_BACKEND == "sqlite" else JsonStore()
+BOARD_WRITER = BoardWriter()
+
+
+def start_board_writer():
+    thread = threading.Thread(target=BOARD_WRITER.run, name="board-writer", daemon=True)
+    thread.start()
+    return thread
+
+
+def _add_score_entry(name, score, t, color=None):
+    now = time.time()
+    entry = {
+        "id": f"s-{int(now * 1000)}-{secrets.token_urlsafe(6)}",
+        "name": _normalize_name(name),
+        "color": _normalize_color(color),
+        "score": _safe_score(score),
+        "time": _safe_score(t),
+        "created": now,
+    }
+    if entry["score"] <= 0:
+        return None
+    with BOARD_LOCK:
+        _prune_leaderboard(now)
+        # sous la coupure MAX_STORE l'entrée n'entre pas en mémoire, mais le store la garde
+        if LEADERBOARD.add(entry, MAX_STORE):
+            _board_changed()
+        for board in BOARD_WINDOWS.values():
+            board.add(entry, now)
+        event = {"op": "add", "entry": entry}
+        STORE.observe(event)
+        BOARD_WRITER.record(event)
+    return entry
+
+
+def _claim_session_score(player):
+    """
+    Test-and-set de `scoreRecorded`, à appeler sous PRESENCE_LOCK: seul le
+    premier appelant (reaper, /api/leave ou /api/score) enregistre la partie.
+    """
+    if not isinstance(player, dict) or player.get("scoreRecorded"):
+        return False
+    player["scoreRecorded"] = True
+    return True
+
+
+def _record_session_best(player):
+    """À appeler sans PRESENCE_LOCK (pris ici pour réserver l'enregistrement)."""
+    with PRESENCE_LOCK:
+        if not _claim_session_score(player):
+            return None
+    best_score = _safe_score(player.get("best", player.get("score", 0)))
+    best_time = _safe_score(player.get("bestTime", player.get("time", 0)))
+    if best_score <= 0:
+        return None
+    return _add_score_entry(
+        name=player.get("name"),
+        score=best_score,
+        t=best_time,
+        color=player.get("color"),
+    )
+
+
+def _reap_expired_players(now):
+    """
+    Purge les sessions inactives depuis plus de `EXPIRATION` et enregistre leur
+    meilleur score.
+    """
+    with PRESENCE_LOCK:
+        expired = PLAYERS.pop_expired(now - EXPIRATION)
+    # sessions déjà retirées de PLAYERS: plus besoin du verrou de présence
+    for _, player in expired:
+        # WORKERS > 1: c'est le worker qui a vu la session en dernier qui l'enregistre
+        if not player.get("remote"):
+            _record_session_best(player)
+    return [sid for sid, _ in expired]
+
+
+def _reaper_loop(stop_event):
+    while not stop_event.wait(REAP_INTERVAL):
+        try:
+            now = time.time()
+            _reap_expired_players(now)
+            for limiter in RATE_LIMITERS.values():
+                limiter.sweep(now)
+        except Exception:
+            continue
+
+
+def start_reaper():
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_reaper_loop, args=(stop_event,), name="presence-reaper", daemon=True
+    )
+    thread.start()
+    return stop_event
+
+
+def _encode_json(payload, raw=None):
+    """
+    Encode `payload` en JSON; `raw` associe des clés supplémentaires à des
+    valeurs déjà encodées (bytes) insérées telles quelles dans l'objet.
+    """
+    resp = json.dumps(payload).encode()
+    if not raw:
+        return resp
+    parts = [resp[:-1]]
+    sep = b", " if len(resp) > 2 else b""
+    for key, value in raw.items():
+        parts.append(sep + json.dumps(key).encode() + b": " + value)
+        sep = b", "
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Instantané de présence: à chaque tick, les joueurs modifiés sont encodés une
+# seule fois; /api/state assemble ses réponses à partir de ces fragments et le
+# tick est poussé à tous les abonnés de /api/stream.
+# ---------------------------------------------------------------------------
+
+# `players`: PeerEntry de tous les joueurs, `grid`: SpatialGrid sur ces entrées,
+# `changed`: (sid, fragments) des joueurs modifiés depuis le tick précédent,
+# `removed`: sessions disparues, `board`: BoardSnapshot courant, `index`: sid -> PeerEntry
+PresenceTick = namedtuple(
+    "PresenceTick", ("seq", "time", "players", "grid", "changed", "removed", "board", "index")
+)
+# `fragments`: encodages du joueur, indexés par format de pair (voir _peer_fragments)
+PeerEntry = namedtuple("PeerEntry", ("sid", "ts", "x", "y", "fragments"))
+
+# Formats de pair négociés par le client (`peerFormat`):
+# 1 = objet avec les seuls champs publics (défaut),
+# 2 = tableau positionnel PEER_FIELDS, coordonnées et scores arrondis à l'entier.
+PEER_FORMAT_OBJECT = 1
+PEER_FORMAT_COMPACT = 2
+PEER_FIELDS = ("id", "x", "y", "color", "name", "score", "time", "pulseSeq", "pulseAt")
+
+
+def _peer_format(value):
+    if _safe_int(value, PEER_FORMAT_OBJECT) == PEER_FORMAT_COMPACT:
+        return PEER_FORMAT_COMPACT
+    return PEER_FORMAT_OBJECT
+
+
+def _peer_fragments(player):
+    """Encode un joueur dans chaque format de pair; ip/clientId/instanceId restent privés."""
+    score = _safe_score(player.get("best", player.get("score", 0)))
+    t = _safe_score(player.get("bestTime", player.get("time", 0)))
+    pulse_at = _safe_coord(player.get("pulseAt", 0))
+    public = {
+        "id": player.get("id"),
+        "x": player.get("x", 0.0),
+        "y": player.get("y", 0.0),
+        "color": player.get("color"),
+        "name": player.get("name"),
+        "score": score,
+        "time": t,
+        "pulseSeq": player.get("pulseSeq", 0),
+        "pulseAt": pulse_at,
+    }
+    compact = [
+        public["id"],
+        round(public["x"]),
+        round(public["y"]),
+        public["color"],
+        public["name"],
+        round(score),
+        round(t),
+        public["pulseSeq"],
+        round(pulse_at, 3),
+    ]
+    return (
+        json.dumps(public).encode(),
+        json.dumps(compact, separators=(",", ":")).encode(),
+    )
+
+
+def _peer_list(entries, peer_format):
+    idx = peer_format - 1
+    return b"[" + b",".join([frags[idx] for frags in entries]) + b"]"
+
+
+class SpatialGrid:
+    """
+    Grille uniforme (cellules de `cell_size`) sur les positions d'un tick, pour
+    trouver les k pairs les plus proches en ne visitant que les cellules voisines.
+    """
+
+    def __init__(self, entries, cell_size):
+        self.cell_size = cell_size
+        self.size = len(entries)
+        cells = {}
+        for entry in entries:
+            key = (int(entry.x // cell_size), int(entry.y // cell_size))
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [entry]
+            else:
+                bucket.append(entry)
+        self.cells = cells
+        if cells:
+            xs = [k[0] for k in cells]
+            ys = [k[1] for k in cells]
+            self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            self.bounds = (0, 0, 0, 0)
+
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def nearest(self, x, y, k, radius=0.0, accept=None):
+        """Jusqu'à `k` entrées les plus proches de (x, y), triées par distance."""
+        if k <= 0 or not self.size:
+            return []
+        cell = self.cell_size
+        cx, cy = int(x // cell), int(y // cell)
+        min_x, min_y, max_x, max_y = self.bounds
+        max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy, 0)
+        if radius > 0:
+            max_ring = min(max_ring, int(radius // cell) + 1)
+        radius_sq = radius * radius if radius > 0 else math.inf
+        # grille trop clairsemée autour du point: un parcours simple coûte moins cher
+        if (2 * max_ring + 1) ** 2 > 4 * self.size:
+            candidates = (e for bucket in self.cells.values() for e in bucket)
+            scored = []
+            for e in candidates:
+                if accept is not None and not accept(e):
+                    continue
+                d2 = (e.x - x) ** 2 + (e.y - y) ** 2
+                if d2 <= radius_sq:
+                    scored.append((d2, e))
+            return [e for _, e in heapq.nsmallest(k, scored, key=lambda item: item[0])]
+        best = []  # tas max (distance négative) des k meilleurs
+        counter = 0
+        for r in range(max_ring + 1):
+            for key in self._ring(cx, cy, r):
+                for e in self.cells.get(key, ()):
+                    if accept is not None and not accept(e):
+                        continue
+                    d2 = (e.x - x) ** 2 + (e.y - y) ** 2
+                    if d2 > radius_sq:
+                        continue
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, counter, e))
+                    elif -best[0][0] > d2:
+                        heapq.heapreplace(best, (-d2, counter, e))
+            # les cellules de l'anneau suivant sont à au moins r * cell
+            if len(best) == k and -best[0][0] <= (r * cell) ** 2:
+                break
+        return [e for _, _, e in sorted(best, key=lambda item: -item[0])]
+
+
+class PresenceBroadcaster:
+    def __init__(self, interval=None):
+        self.interval = interval if interval is not None else 1.0 / PRESENCE_TICK_HZ
+        self._cond = threading.Condition()
+        self._tick_lock = threading.Lock()
+        self._fragments = {}  # sid -> (ts, fragments)
+        self._listeners = []
+        self.current = PresenceTick(
+            0, 0.0, (), SpatialGrid((), INTEREST_CELL_SIZE), (), (), None, {}
+        )
+        self.subscribers = 0
+
+    def subscribe(self):
+        with self._cond:
+            if self.subscribers >= STREAM_MAX_CLIENTS:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers = max(0, self.subscribers - 1)
+
+    def add_listener(self, callback):
+        """`callback(tick)` est appelé depuis le thread de diffusion à chaque tick."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def tick(self, now=None):
+        """Construit et publie un nouveau tick (à appeler sans tenir de verrou de données)."""
+        with self._tick_lock:
+            return self._tick(time.time() if now is None else now)
+
+    def fresh(self, now):
+        """
+        Tick courant, reconstruit s'il a plus d'un intervalle; si un autre thread
+        le reconstruit déjà, on sert le précédent plutôt que d'attendre.
+        """
+        tick = self.current
+        if now - tick.time < self.interval:
+            return tick
+        if not self._tick_lock.acquire(blocking=False):
+            return self.current
+        try:
+            if now - self.current.time < self.interval:
+                return self.current
+            return self._tick(now)
+        finally:
+            self._tick_lock.release()
+
+    def _tick(self, now):
+        fragments = self._fragments
+        stale = []
+        with BOARD_LOCK:
+            board = _board_snapshot()
+        with PRESENCE_LOCK:
+            order = []
+            for sid, player in PLAYERS.items():
+                ts = player.get("ts", 0)
+                order.append((sid, ts, player.get("x", 0.0), player.get("y", 0.0)))
+                cached = fragments.get(sid)
+                if cached is None or cached[0] != ts:
+                    stale.append((sid, ts, player))
+            removed = [sid for sid in fragments if sid not in PLAYERS]
+        # encodage hors verrou: les dicts joueurs sont remplacés, pas modifiés
+        changed = []
+        for sid, ts, player in stale:
+            try:
+                frags = _peer_fragments(player)
+            except (TypeError, ValueError, OverflowError):
+                # un joueur non encodable est omis du tick plutôt que de bloquer tous les autres
+                fragments.pop(sid, None)
+                continue
+            fragments[sid] = (ts, frags)
+            changed.append((sid, frags))
+        for sid in removed:
+            del fragments[sid]
+        players = tuple(
+            PeerEntry(sid, ts, x, y, fragments[sid][1])
+            for sid, ts, x, y in order
+            if sid in fragments
+        )
+        tick = PresenceTick(
+            self.current.seq + 1,
+            now,
+            players,
+            SpatialGrid(players, INTEREST_CELL_SIZE),
+            tuple(changed),
+            tuple(removed),
+            board,
+            {entry.sid: entry for entry in players},
+        )
+        with self._cond:
+            self.current = tick
+            self._cond.notify_all()
+        for callback in list(self._listeners):
+            try:
+                callback(tick)
+            except Exception:
+                continue
+        return tick
+
+    def wait(self, seq, timeout):
+        """Attend un tick plus récent que `seq` (ou `timeout`) et renvoie le tick courant."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.current.seq > seq, timeout)
+            return self.current
+
+
+BROADCASTER = PresenceBroadcaster()
+
+
+def _broadcaster_loop(stop_event):
+    # /api/state rafraîchit le tick à la demande; ce thread ne sert qu'aux flux
+    while not stop_event.wait(BROADCASTER.interval):
+        if not BROADCASTER.subscribers:
+            continue
+        try:
+            BROADCASTER.tick()
+        except Exception:
+            continue
+
+
+def start_broadcaster():
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_broadcaster_loop, args=(stop_event,), name="presence-broadcaster", daemon=True
+    )
+    thread.start()
+    return stop_event
+
+
+class StreamSubscriber:
+    """
+    Abonné /api/stream: reçoit, comme /api/state, les `max_peers` pairs les plus
+    proches de sa dernière position connue. `visible` (sid -> ts) retient ce qui
+    lui a été envoyé: un tick ne renvoie que les pairs entrés dans ce voisinage
+    ou modifiés, et retire ceux qui en sortent.
+    """
+
+    __slots__ = ("session_id", "peer_format", "max_peers", "seq", "board_tag", "x", "y", "visible")
+
+    def __init__(self, session_id, peer_format=PEER_FORMAT_OBJECT, max_peers=MAX_PEERS):
+        self.session_id = session_id
+        self.peer_format = peer_format
+        self.max_peers = max_peers
+        self.seq = 0
+        self.board_tag = None
+        self.x = 0.0
+        self.y = 0.0
+        self.visible = {}
+
+
+def _sse_event(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+def _stream_events(sub, tick):
+    """
+    Événements SSE (bytes, éventuellement vides) à envoyer à `sub` pour `tick`:
+    `snapshot` des pairs les plus proches au premier tick, sinon `presence` avec
+    les pairs entrés dans le voisinage ou modifiés et `removed` pour ceux qui en
+    sont sortis; `board` si le classement a changé.
+    """
+    out = []
+    own = sub.session_id
+    fmt = sub.peer_format
+    me = tick.index.get(own)
+    if me is not None:
+        sub.x, sub.y = me.x, me.y
+    nearest = tick.grid.nearest(
+        sub.x, sub.y, sub.max_peers, INTEREST_RADIUS, accept=lambda e: e.sid != own
+    )
+    visible = {e.sid: e.ts for e in nearest}
+    if sub.seq == 0:
+        players = _peer_list([e.fragments for e in nearest], fmt)
+        payload = {"serverTime": tick.time, "peerFormat": fmt}
+        out.append(_sse_event("snapshot", _encode_json(payload, raw={"players": players})))
+    else:
+        sent = sub.visible
+        frags = [e.fragments for e in nearest if sent.get(e.sid) != e.ts]
+        removed = [sid for sid in sent if sid not in visible]
+        if frags or removed:
+            players = _peer_list(frags, fmt)
+            payload = {"serverTime": tick.time, "peerFormat": fmt, "removed": removed}
+            out.append(_sse_event("presence", _encode_json(payload, raw={"players": players})))
+    sub.visible = visible
+    board = tick.board
+    if board is not None and board.tag != sub.board_tag:
+        sub.board_tag = board.tag
+        out.append(
+            _sse_event("board", _encode_json({"boardVersion": board.tag}, raw={"board": board.json}))
+        )
+    sub.seq = tick.seq
+    return b"".join(out)
+
+
+# ---------------------------------------------------------------------------
+# Coeur de l'API, indépendant du transport (Handler threadé ou moteur asyncio).
+# Chaque route renvoie une ApiResponse; le transport ajoute CORS et Content-Length
+# et rend `error` à sa manière (page d'erreur HTTP).
+# ---------------------------------------------------------------------------
+
+ApiResponse = namedtuple("ApiResponse", ("status", "body", "headers", "error"))
+
+API_GET_ROUTES = ("/api/state", "/api/board", "/api/rank", "/api/stats", "/api/metrics")
+API_STREAM_ROUTE = "/api/stream"
+API_POST_ROUTES = ("/api/state", "/api/score", "/api/leave", "/api/reset")
+CORS_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "POST, GET, OPTIONS"),
+    ("Access-Control-Allow-Headers", "Content-Type, X-Admin-Token, Authorization, If-None-Match"),
+    ("Access-Control-Expose-Headers", "ETag"),
+)
+
+
+def _api_error(status, message):
+    return ApiResponse(status, b"", (), message)
+
+
+def _api_json(payload, raw=None, etag=None, status=200):
+    headers = [("Content-Type", "application/json")]
+    if etag:
+        # revalidation à chaque lecture: le navigateur renvoie If-None-Match
+        headers.append(("Cache-Control", "no-cache"))
+        headers.append(("ETag", f'"{etag}"'))
+    else:
+        headers.append(("Cache-Control", "no-store"))
+    return ApiResponse(status, _encode_json(payload, raw), tuple(headers), None)
+
+
+def _api_overloaded(sync_ms, now):
+    body = _encode_json(
+        {"ok": False, "error": "overloaded", "syncIntervalMs": sync_ms, "serverTime": now}
+    )
+    headers = (
+        ("Content-Type", "application/json"),
+        ("Cache-Control", "no-store"),
+        ("Retry-After", str(max(1, math.ceil(sync_ms / 1000)))),
+    )
+    return ApiResponse(503, body, headers, None)
+
+
+def _api_not_modified(etag):
+    return ApiResponse(
+        304, b"", (("Cache-Control", "no-cache"), ("ETag", f'"{etag}"')), None
+    )
+
+
+def _api_content_length(value):
+    """
+    Valide un en-tête Content-Length: renvoie `(longueur, erreur)` où `erreur`
+    est une ApiResponse 400/413 (le transport doit alors vider ou fermer).
+    """
+    try:
+        length = int(value or 0)
+    except ValueError:
+        return 0, _api_error(400, "bad Content-Length")
+    if length < 0:
+        return 0, _api_error(400, "bad Content-Length")
+    if length > MAX_BODY_BYTES:
+        return length, _api_error(413, "payload too large")
+    return length, None
+
+
+def _api_reset(data, headers):
+    token = (data.get("token") or data.get("adminToken") or "").strip()
+    header_token = (headers.get("X-Admin-Token") or "").strip()
+    if not ADMIN_TOKEN:
+        return _api_error(403, "reset disabled")
+    if not token:
+        token = header_token
+    if token != ADMIN_TOKEN:
+        return _api_error(403, "invalid token")
+    with BOARD_LOCK:
+        LEADERBOARD.clear()
+        _board_changed()
+        for board in BOARD_WINDOWS.values():
+            board.clear()
+        STORE.observe({"op": "reset"})
+        BOARD_WRITER.record({"op": "reset"})
+    return _api_json({"ok": True, "cleared": True, "serverTime": time.time()})
+
+
+def _api_score(data):
+    name = _normalize_name(data.get("name"))
+    score = _safe_score(data.get("score", 0))
+    t = _safe_score(data.get("time", 0))
+    color = _normalize_color(data.get("color"))
+    session_id = _normalize_session_id(
+        data.get("sessionId") or data.get("sid") or data.get("id")
+    )
+    if score <= 0:
+        return _api_error(400, "invalid score")
+    with PRESENCE_LOCK:
+        player = PLAYERS.get(session_id) if session_id else None
+        if player is not None:
+            # copie réaffectée: les dicts joueurs sont remplacés, pas modifiés
+            player = dict(player)
+            player.pop("remote", None)
+            # réservé avant l'ajout: le reaper ou /api/leave ne compteront pas la partie une 2e fois
+            _claim_session_score(player)
+            prev_best = _safe_score(player.get("best", 0))
+            prev_time = _safe_score(player.get("bestTime", 0))
+            if score > prev_best or (score == prev_best and t > prev_time):
+                player["best"] = score
+                player["bestTime"] = t
+                player["score"] = score
+                player["time"] = t
+            PLAYERS[session_id] = player
+    entry = _add_score_entry(name=name, score=score, t=t, color=color)
+    with BOARD_LOCK:
+        board = _board_snapshot()
+        # None si le score est sous la coupure MAX_STORE
+        rank = LEADERBOARD.rank(entry["id"])
+    payload = {"ok": True, "id": entry["id"], "rank": rank, "boardVersion": board.tag}
+    if rank is None:
+        deep = _store_rank("all", entry["score"], entry["time"], entry["created"], time.time())
+        if deep is not None:
+            payload["rank"] = deep[0]
+        else:
+            # store JSON: seuls les MAX_STORE meilleurs scores sont conservés
+            payload["outsideTop"] = MAX_STORE
+    payload["serverTime"] = time.time()
+    return _api_json(payload, raw={"board": board.json})
+
+
+def _api_leave(data):
+    session_id = _normalize_session_id(
+        data.get("sessionId") or data.get("sid") or data.get("id")
+    )
+    client_id = _normalize_client_id(data.get("clientId"))
+    instance_id = _normalize_instance_id(data.get("instanceId"))
+    if not session_id and not client_id:
+        return _api_error(400, "missing sessionId/clientId")
+
+    removed = []
+    with PRESENCE_LOCK:
+        if client_id:
+            for sid in PLAYERS.sessions_for_client(client_id, instance_id):
+                removed.append((sid, PLAYERS[sid]))
+                del PLAYERS[sid]
+        if session_id and session_id in PLAYERS:
+            removed.append((session_id, PLAYERS[session_id]))
+            del PLAYERS[session_id]
+    removed_ids = [sid for sid, _ in removed]
+    for _, player in removed:
+        _record_session_best(player)
+    now = time.time()
+
+    return _api_json(
+        {
+            "ok": True,
+            "removed": bool(removed_ids),
+            "removedIds": removed_ids,
+            "serverTime": now,
+        }
+    )
+
+
+def _api_state(data, ip):
+    session_id = _normalize_session_id(
+        data.get("sessionId") or data.get("sid") or data.get("id")
+    )
+    if not session_id:
+        return _api_error(400, "missing sessionId")
+
+    now = time.time()
+    pressure = LOAD.pressure()
+    level = LOAD.level(pressure)
+    sync_ms = LOAD.sync_interval_ms(level)
+    if level >= 3 and LOAD.reject_heartbeat(pressure):
+        return _api_overloaded(sync_ms, now)
+    since = _safe_float(data.get("since", 0), 0.0)
+    client_board_version = str(data.get("boardVersion") or "")
+    # client abonné à /api/stream: simple mise à jour de position, rien à renvoyer
+    streaming = bool(data.get("stream"))
+    x = _safe_coord(data.get("x", 0))
+    y = _safe_coord(data.get("y", 0))
+    peers = []
+    with PRESENCE_LOCK:
+        prev = PLAYERS.get(session_id, {})
+        session_is_new = session_id not in PLAYERS
+        if MAX_SESSIONS_PER_IP > 0 and session_is_new:
+            if PLAYERS.count_ip(ip) >= MAX_SESSIONS_PER_IP:
+                return _api_error(429, "too many sessions")
+        client_id = _normalize_client_id(data.get("clientId") or prev.get("clientId"))
+        instance_id = _normalize_instance_id(
+            data.get("instanceId") or prev.get("instanceId")
+        )
+
+        # anti-dup: si un même clientId revient avec une autre session (reload/onglet), on nettoie ses anciennes sessions
+        if client_id:
+            for sid in PLAYERS.sessions_for_client(client_id, instance_id):
+                if sid != session_id:
+                    del PLAYERS[sid]
+
+        incoming_score = _safe_score(data.get("score", 0))
+        incoming_time = _safe_score(data.get("time", 0))
+
+        # compat: si le client envoie best/bestTime on les prend en compte
+        incoming_best = _safe_score(data.get("best", incoming_score))
+        incoming_best_time = _safe_score(data.get("bestTime", incoming_time))
+
+        prev_best = _safe_score(prev.get("best", 0))
+        prev_best_time = _safe_score(prev.get("bestTime", 0))
+
+        incoming_pulse_seq = max(_safe_int(data.get("pulseSeq", 0), 0), 0)
+        prev_pulse_seq = max(_safe_int(prev.get("pulseSeq", 0), 0), 0)
+        pulse_seq = max(incoming_pulse_seq, prev_pulse_seq)
+        pulse_at = _safe_float(prev.get("pulseAt", 0), 0.0)
+        if incoming_pulse_seq > prev_pulse_seq:
+            pulse_at = now
+
+        # meilleur (score, puis time en tie-break)
+        best_score = prev_best
+        best_time = prev_best_time
+        if (incoming_best > best_score) or (
+            incoming_best == best_score and incoming_best_time > best_time
+        ):
+            best_score, best_time = incoming_best, incoming_best_time
+        if (incoming_score > best_score) or (
+            incoming_score == best_score and incoming_time > best_time
+        ):
+            best_score, best_time = incoming_score, incoming_time
+
+        PLAYERS[session_id] = {
+            "id": session_id,
+            "clientId": client_id,
+            "instanceId": instance_id,
+            "x": x,
+            "y": y,
+            "color": _normalize_color(data.get("color", prev.get("color"))),
+            "name": _normalize_name(data.get("name", prev.get("name"))),
+            # "score/time" = meilleur de la session (ce que tu veux afficher dans le classement)
+            "score": best_score,
+            "time": best_time,
+            "best": best_score,
+            "bestTime": best_time,
+            # champs additionnels non cassants (utile si tu veux afficher du "live" côté client plus tard)
+            "currentScore": incoming_score,
+            "currentTime": incoming_time,
+            "pulseSeq": pulse_seq,
+            "pulseAt": pulse_at,
+            "ts": now,
+            "ip": ip,
+            "scoreRecorded": bool(prev.get("scoreRecorded", False)),
+        }
+    if streaming:
+        return _api_json({"ok": True, "syncIntervalMs": sync_ms, "serverTime": now})
+    payload = {
+        "ok": True,
+        "peerFormat": _peer_format(data.get("peerFormat")),
+        "syncIntervalMs": sync_ms,
+        "serverTime": now,
+    }
+    if level >= 2:
+        # surcharge: ni pairs ni classement, le client garde les siens
+        LOAD.count("peers")
+        return _api_json(payload)
+    with BOARD_LOCK:
+        _prune_leaderboard(now)
+        board = _board_snapshot()
+
+    # pairs tirés de l'instantané du tick (fragments déjà encodés), sans le demandeur:
+    # seulement les `max_peers` plus proches (dans INTEREST_RADIUS si défini)
+    tick = BROADCASTER.fresh(now)
+    max_peers = min(max(_safe_int(data.get("maxPeers"), MAX_PEERS), 1), MAX_PEERS)
+    if level:
+        max_peers = max(1, max_peers // 2)
+    nearest = tick.grid.nearest(
+        x,
+        y,
+        max_peers,
+        INTEREST_RADIUS,
+        accept=lambda e: e.sid != session_id and e.ts > since,
+    )
+    peers = _peer_list([e.fragments for e in nearest], payload["peerFormat"])
+    # curseur `since` du client: les mises à jour postérieures au tick viendront au suivant
+    payload["serverTime"] = tick.time
+    if client_board_version != board.tag and level:
+        # charge élevée: le classement attendra GET /api/board (ETag) ou le flux
+        LOAD.count("board")
+        return _api_json(payload, raw={"players": peers})
+    payload["boardVersion"] = board.tag
+    # le client a déjà ce classement: on n'envoie que la version
+    if client_board_version == board.tag:
+        return _api_json(payload, raw={"players": peers})
+    return _api_json(payload, raw={"players": peers, "board": board.json})
+
+
+def _board_window(params):
+    window = (params.get("window") or ["all"])[0].strip().lower() or "all"
+    if window != "all" and window not in BOARD_WINDOWS:
+        return None
+    return window
+
+
+def _api_board(query, headers):
+    params = parse_qs(query or "")
+    window = _board_window(params)
+    if window is None:
+        return _api_error(400, "bad window")
+    if "offset" in params or "limit" in params:
+        return _api_board_page(params, window, headers)
+    with BOARD_LOCK:
+        now = time.time()
+        _prune_leaderboard(now)
+        _, board = _board_view(window, now)
+    if _etag_matches(headers.get("If-None-Match"), board.tag):
+        return _api_not_modified(board.tag)
+    # pas de serverTime dans une représentation à ETag: un 304 rendrait l'heure du cache
+    return _api_json(
+        {"ok": True, "window": window, "boardVersion": board.tag},
+        raw={"board": board.json},
+        etag=board.tag,
+    )
+
+
+def _api_board_page(params, window, headers):
+    offset = max(_safe_int((params.get("offset") or [""])[0], 0), 0)
+    limit = min(max(_safe_int((params.get("limit") or [""])[0], MAX_BOARD), 1), MAX_PAGE)
+    with BOARD_LOCK:
+        now = time.time()
+        _prune_leaderboard(now)
+        ranked, board = _board_view(window, now)
+        page = [dict(e) for e in ranked[offset : offset + limit]]
+        total = len(ranked)
+    etag = f"{board.tag}-{offset}-{limit}"
+    if _etag_matches(headers.get("If-None-Match"), etag):
+        return _api_not_modified(etag)
+    return _api_json(
+        {
+            "ok": True,
+            "window": window,
+            "board": page,
+            "offset": offset,
+            "limit": limit,
+            "total": total,
+            "boardVersion": board.tag,
+        },
+        etag=etag,
+    )
+
+
+def _api_rank(query):
+    params = parse_qs(query or "")
+    entry_id = (params.get("id") or [""])[0].strip()
+    raw_score = (params.get("score") or [""])[0].strip()
+    if not entry_id and not raw_score:
+        return _api_error(400, "missing score/id")
+    window = _board_window(params)
+    if window is None:
+        return _api_error(400, "bad window")
+    score = _safe_score(raw_score)
+    t = _safe_score((params.get("time") or [""])[0])
+    with BOARD_LOCK:
+        now = time.time()
+        _prune_leaderboard(now)
+        ranked, _ = _board_view(window, now)
+        total = len(ranked)
+        if entry_id:
+            rank = ranked.rank(entry_id)
+        else:
+            rank = ranked.rank_for(score, t)
+    if STORE.deep and total >= MAX_STORE:
+        # classement en mémoire tronqué à MAX_STORE: le store profond a le rang et le total
+        if entry_id:
+            try:
+                entry = STORE.get(entry_id)
+            except sqlite3.Error:
+                entry = None
+            deep = entry and _store_rank(window, entry["score"], entry["time"], entry["created"], now)
+        else:
+            deep = _store_rank(window, score, t, None, now)
+        if deep:
+            rank, total = deep
+    if rank is None:
+        return _api_error(404, "unknown id")
+    return _api_json(
+        {"ok": True, "window": window, "rank": rank, "total": total, "serverTime": now}
+    )
+
+
+def _store_rank(window, score, t, created, now):
+    """
+    `(rang, total)` calculés par un store profond (STORE=sqlite) dans la fenêtre
+    `window`, pour un score hors du top MAX_STORE tenu en mémoire; None sinon.
+    """
+    if not STORE.deep:
+        return None
+    if window == "all":
+        since = now - BOARD_TTL if BOARD_TTL > 0 else None
+    else:
+        since = BOARD_WINDOWS[window].start
+    if created is not None and since is not None and created < since:
+        return None
+    try:
+        return STORE.rank(window, score, t, created, since)
+    except sqlite3.Error:
+        return None
+
+
+def _admin_error(headers, feature):
+    """
+    None si la requête porte ADMIN_TOKEN (`X-Admin-Token` ou
+    `Authorization: Bearer`), sinon la réponse 403.
+    """
+    if not ADMIN_TOKEN:
+        return _api_error(403, f"{feature} disabled")
+    token = (headers.get("X-Admin-Token") or "").strip()
+    auth = (headers.get("Authorization") or "").strip()
+    if not token and auth[:7].lower() == "bearer ":
+        token = auth[7:].strip()
+    if token != ADMIN_TOKEN:
+        return _api_error(403, "invalid token")
+    return None
+
+
+def _api_stats(headers):
+    error = _admin_error(headers, "stats")
+    if error is not None:
+        return error
+    with PRESENCE_LOCK:
+        players = len(PLAYERS)
+    with BOARD_LOCK:
+        stored = len(LEADERBOARD)
+    return _api_json(
+        {
+            "ok": True,
+            "players": players,
+            "stored": stored,
+            "store": STORE.name,
+            "streams": BROADCASTER.subscribers,
+            "locks": {lock.name: lock.stats() for lock in LOCKS},
+            "rateLimit": {route: limiter.stats() for route, limiter in RATE_LIMITERS.items()},
+            "load": LOAD.stats(),
+            "writer": BOARD_WRITER.stats(),
+            "serverTime": time.time(),
+        }
+    )
+
+
+# bornes (secondes) de l'histogramme de latence des requêtes API
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+    """Compteurs et histogrammes des requêtes API, exposés par /api/metrics."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.requests = {}  # (method, route, status) -> nombre
+        self.bytes_in = {}  # route -> octets reçus
+        self.bytes_out = {}  # route -> octets envoyés
+        self.latency = {}  # route -> [compte par seau (+Inf en dernier), somme]
+
+    def observe(self, method, route, status, seconds, req_len, resp_len):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_in[route] = self.bytes_in.get(route, 0) + req_len
+            self.bytes_out[route] = self.bytes_out.get(route, 0) + resp_len
+            hist = self.latency.get(route)
+            if hist is None:
+                hist = self.latency[route] = [[0] * (len(self.buckets) + 1), 0.0]
+            hist[0][i] += 1
+            hist[1] += seconds
+
+    def render(self, out):
+        with self._lock:
+            requests = sorted(self.requests.items())
+            bytes_in = sorted(self.bytes_in.items())
+            bytes_out = sorted(self.bytes_out.items())
+            latency = sorted((route, list(counts), total) for route, (counts, total) in self.latency.items())
+        _metric(
+            out,
+            "ether_http_requests_total",
+            "counter",
+            "Requêtes API traitées.",
+            [({"method": m, "route": r, "status": s}, n) for (m, r, s), n in requests],
+        )
+        _metric(
+            out,
+            "ether_http_request_bytes_total",
+            "counter",
+            "Octets de corps de requête reçus.",
+            [({"route": r}, n) for r, n in bytes_in],
+        )
+        _metric(
+            out,
+            "ether_http_response_bytes_total",
+            "counter",
+            "Octets de corps de réponse envoyés.",
+            [({"route": r}, n) for r, n in bytes_out],
+        )
+        samples = []
+        for route, counts, total in latency:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                samples.append(("_bucket", {"route": route, "le": le}, cumulative))
+            samples.append(("_sum", {"route": route}, total))
+            samples.append(("_count", {"route": route}, cumulative))
+        name = "ether_http_request_duration_seconds"
+        out.append(f"# HELP {name} Durée de traitement des requêtes API.")
+        out.append(f"# TYPE {name} histogram")
+        out.extend(f"{name}{suffix}{_metric_labels(labels)} {value}" for suffix, labels, value in samples)
+
+
+METRICS = Metrics()
+
+
+def _metric_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _metric(out, name, kind, help_text, samples):
+    """Ajoute à `out` une métrique au format texte Prometheus; `samples` = [(labels, valeur)]."""
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} {kind}")
+    out.extend(f"{name}{_metric_labels(labels)} {value}" for labels, value in samples)
+
+
+def _render_metrics():
+    out = []
+    METRICS.render(out)
+    with PRESENCE_LOCK:
+        players = len(PLAYERS)
+    with BOARD_LOCK:
+        stored = len(LEADERBOARD)
+        windows = [({"window": name}, len(board.board)) for name, board in sorted(BOARD_WINDOWS.items())]
+    _metric(out, "ether_players", "gauge", "Sessions de jeu actives.", [(None, players)])
+    _metric(out, "ether_stream_clients", "gauge", "Abonnés /api/stream.", [(None, BROADCASTER.subscribers)])
+    _metric(out, "ether_board_entries", "gauge", "Scores en mémoire (classement complet).", [(None, stored)])
+    _metric(out, "ether_board_window_entries", "gauge", "Scores par fenêtre de classement.", windows)
+
+    locks = [(lock.name, lock.stats()) for lock in LOCKS]
+    for suffix, kind, help_text, field, scale in (
+        ("acquisitions_total", "counter", "Acquisitions du verrou.", "acquisitions", 1),
+        ("contended_total", "counter", "Acquisitions qui ont dû attendre.", "contended", 1),
+        ("wait_seconds_total", "counter", "Temps passé à attendre le verrou.", "waitMs", 1000),
+        ("hold_seconds_total", "counter", "Temps passé verrou tenu.", "holdMs", 1000),
+        ("hold_max_seconds", "gauge", "Plus longue détention du verrou.", "holdMaxMs", 1000),
+    ):
+        _metric(
+            out,
+            f"ether_lock_{suffix}",
+            kind,
+            help_text,
+            [({"lock": name}, stats[field] / scale) for name, stats in locks],
+        )
+
+    load = LOAD.stats()
+    for name, kind, help_text, value in (
+        ("inflight", "gauge", "Requêtes API en cours de traitement.", load["inflight"]),
+        ("latency_seconds", "gauge", "Latence moyenne (EWMA) du traitement des requêtes API.", load["latencyMs"] / 1000),
+        ("loop_lag_seconds", "gauge", "Retard moyen (EWMA) de la boucle asyncio.", load["lagMs"] / 1000),
+        ("pressure", "gauge", "Charge relative aux seuils de délestage (>= 1: délestage).", load["pressure"]),
+        ("level", "gauge", "Niveau de délestage de /api/state (0 à 3).", load["level"]),
+    ):
+        _metric(out, f"ether_load_{name}", kind, help_text, [(None, value)])
+    _metric(
+        out,
+        "ether_load_shed_total",
+        "counter",
+        "Réponses /api/state allégées ou refusées, par travail délesté.",
+        [({"kind": kind}, n) for kind, n in sorted(load["shed"].items())],
+    )
+
+    limiters = [({"route": route}, limiter.stats()) for route, limiter in sorted(RATE_LIMITERS.items())]
+    for suffix, kind, help_text, field in (
+        ("buckets", "gauge", "Seaux de limitation de débit en mémoire.", "buckets"),
+        ("rejected_total", "counter", "Requêtes refusées (429) par la limitation de débit.", "rejected"),
+        ("evicted_total", "counter", "Seaux oubliés (inactifs ou au-delà de RATE_LIMIT_MAX_IPS).", "evicted"),
+    ):
+        _metric(
+            out,
+            f"ether_rate_limit_{suffix}",
+            kind,
+            help_text,
+            [(labels, stats[field]) for labels, stats in limiters],
+        )
+
+    writer = BOARD_WRITER.stats()
+    for name, kind, help_text, value in (
+        ("pending_events", "gauge", "Modifications du classement pas encore écrites.", writer["pending"]),
+        ("journal_events", "gauge", "Événements écrits depuis la dernière compaction.", writer["journalEvents"]),
+        ("appends_total", "counter", "Écritures d'événements dans le store.", writer["appends"]),
+        ("compactions_total", "counter", "Compactions du store.", writer["compactions"]),
+        ("errors_total", "counter", "Écritures ou compactions en échec.", writer["errors"]),
+        ("flush_seconds_total", "counter", "Temps passé à écrire les événements.", writer["flushMs"] / 1000),
+        ("flush_max_seconds", "gauge", "Plus longue écriture d'événements.", writer["flushMaxMs"] / 1000),
+        ("compact_max_seconds", "gauge", "Plus longue compaction.", writer["compactMaxMs"] / 1000),
+    ):
+        _metric(out, f"ether_persist_{name}", kind, help_text, [(None, value)])
+    return "\n".join(out) + "\n"
+
+
+def _api_metrics(headers):
+    error = _admin_error(headers, "metrics")
+    if error is not None:
+        return error
+    return ApiResponse(
+        200,
+        _render_metrics().encode("utf-8"),
+        (("Content-Type", METRICS_CONTENT_TYPE), ("Cache-Control", "no-store")),
+        None,
+    )
+
+
+def _stream_open(query, ip):
+    """
+    Ouvre un abonnement /api/stream: renvoie `(StreamSubscriber, None)` ou
+    `(None, ApiResponse d'erreur)`. L'appelant doit ensuite appeler
+    `BROADCASTER.unsubscribe()` à la fermeture.
+    """
+    if not _consume_rate_limit(ip, time.time()):
+        return None, _api_error(429, "too many requests")
+    params = parse_qs(query or "")
+    session_id = _normalize_session_id((params.get("sessionId") or [""])[0])
+    if not session_id:
+        return None, _api_error(400, "missing sessionId")
+    if not BROADCASTER.subscribe():
+        return None, _api_error(503, "too many streams")
+    peer_format = _peer_format((params.get("peerFormat") or [""])[0])
+    max_peers = min(max(_safe_int((params.get("maxPeers") or [""])[0], MAX_PEERS), 1), MAX_PEERS)
+    return StreamSubscriber(session_id, peer_format, max_peers), None
+
+
+STREAM_HEADERS = (
+    ("Content-Type", "text/event-stream"),
+    ("Cache-Control", "no-store"),
+    ("X-Accel-Buffering", "no"),
+)
+
+
+def handle_api(method, path, query, headers, body, ip):
+    """
+    Traite une requête API déjà lue. `headers` expose `.get(nom)` insensible à
+    la casse; `body` est le corps brut (bytes) d'un POST.
+    """
+    LOAD.begin()
+    start = time.perf_counter()
+    try:
+        return _dispatch_api(method, path, query, headers, body, ip)
+    finally:
+        LOAD.end(time.perf_counter() - start)
+
+
+def _dispatch_api(method, path, query, headers, body, ip):
+    if not _consume_rate_limit(ip, time.time(), path):
+        return _api_error(429, "too many requests")
+    if method == "GET":
+        if path == "/api/stats":
+            return _api_stats(headers)
+        if path == "/api/metrics":
+            return _api_metrics(headers)
+        if path == "/api/rank":
+            return _api_rank(query)
+        return _api_board(query, headers)
+    try:
+        data = json.loads(body or b"{}")
+    except Exception:
+        return _api_error(400, "bad json")
+    if not isinstance(data, dict):
+        return _api_error(400, "bad json")
+    if path == "/api/reset":
+        return _api_reset(data, headers)
+    if path == "/api/score":
+        return _api_score(data)
+    if path == "/api/leave":
+        return _api_leave(data)
+    return _api_state(data, ip)
+
+
+def _is_api_route(method, path):
+    if method == "GET":
+        return path in API_GET_ROUTES
+    return method == "POST" and path in API_POST_ROUTES
+
+
+class AccessLog:
+    """
+    Journal d'accès en JSON lines: le thread de la requête ne fait qu'ajouter un
+    tuple à une file bornée, un thread l'encode et l'écrit par lots (un seul
+    `write` + `flush` par lot, rotation via `RotatingFileHandler`).
+    """
+
+    def __init__(self, target, sample_state=1.0, max_bytes=0, backups=0):
+        self.sample_state = sample_state
+        self._pending = deque(maxlen=LOG_QUEUE_MAX)
+        self._stop = threading.Event()
+        self.dropped = 0
+        self.written = 0
+        self._logger = None
+        if target and target != "off":
+            if target == "-":
+                handler = logging.StreamHandler(sys.stdout)
+            else:
+                # ouvert à la première écriture: le parent de WORKERS=N ne crée pas de fichier vide
+                handler = logging.handlers.RotatingFileHandler(
+                    target, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True
+                )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"ether.access.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+    def log(self, method, path, status, duration_ms, req_len, resp_len, ip):
+        if self._logger is None:
+            return
+        sample = 1.0
+        # heartbeats réussis échantillonnés; erreurs et autres routes toujours gardées
+        if status < 400 and path == "/api/state" and self.sample_state < 1.0:
+            if random.random() >= self.sample_state:
+                return
+            sample = self.sample_state
+        if len(self._pending) == LOG_QUEUE_MAX:
+            self.dropped += 1
+        self._pending.append(
+            (time.time(), method, path, status, duration_ms, req_len, resp_len, ip, sample)
+        )
+
+    def flush(self):
+        """Écrit les lignes en file en un seul lot; renvoie leur nombre."""
+        lines = []
+        pending = self._pending
+        while pending:
+            ts, method, path, status, duration_ms, req_len, resp_len, ip, sample = pending.popleft()
+            record = {
+                "ts": round(ts, 3),
+                "method": method,
+                "path": path,
+                "status": status,
+                "ms": round(duration_ms, 2),
+                "in": req_len,
+                "out": resp_len,
+                "ip": ip,
+            }
+            if sample < 1.0:
+                record["sample"] = sample
+            lines.append(json.dumps(record, separators=(",", ":")))
+        if lines and self._logger is not None:
+            self._logger.info("\n".join(lines))
+            self.written += len(lines)
+        return len(lines)
+
+    def run(self):
+        while not self._stop.wait(LOG_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                continue
+        self.flush()
+
+    def close(self):
+        self._stop.set()
+
+
+ACCESS_LOG = AccessLog(ACCESS_LOG_TARGET, LOG_SAMPLE_STATE, ACCESS_LOG_MAX_BYTES, ACCESS_LOG_BACKUPS)
+
+
+def _worker_log_target(target, index):
+    """Journal d'accès du worker `index` (access.log -> access-w1.log); stdout et off inchangés."""
+    if target in ("-", "off"):
+        return target
+    root, ext = os.path.splitext(target)
+    return f"{root}-w{index}{ext}"
+
+
+def start_access_log():
+    thread = threading.Thread(target=ACCESS_LOG.run, name="access-log", daemon=True)
+    thread.start()
+    return thread
+
+
+def _log_api(method, path, status, duration_ms, req_len, resp_len, ip):
+    METRICS.observe(method, path, status, duration_ms / 1000.0, req_len, resp_len)
+    ACCESS_LOG.log(method, path, status, duration_ms, req_len, resp_len, ip)
+
+
+def _cache_control_for_path(path):
+    if CACHE_MAX_AGE <= 0:
+        return "no-store"
+    path = (path or "").split("?", 1)[0]
+    if path in ("", "/") or path.endswith(".html") or path.endswith(".json"):
+        return "no-cache"
+    return f"public, max-age={CACHE_MAX_AGE}"
+
+
+def _static_file_path(url_path):
+    """Chemin disque d'un fichier statique sous BASE_DIR, ou None (404)."""
+    path = unquote(url_path.split("?", 1)[0].split("#", 1)[0])
+    parts = [p for p in posixpath.normpath(path).split("/") if p and p not in (".", "..")]
+    full = os.path.join(BASE_DIR, *parts)
+    if os.path.isdir(full):
+        if not path.endswith("/"):
+            return None
+        full = os.path.join(full, "index.html")
+    if not os.path.isfile(full):
+        return None
+    return full
+
+
+def _static_key(url_path):
+    """Forme normalisée d'un chemin statique: toutes ses graphies partagent une entrée."""
+    path = unquote(url_path.split("?", 1)[0].split("#", 1)[0])
+    parts = [p for p in posixpath.normpath(path).split("/") if p and p not in (".", "..")]
+    return "/".join(parts) + ("/" if path.endswith("/") else "")
+
+
+def _accepts_gzip(value):
+    for part in (value or "").split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() in ("gzip", "x-gzip", "*"):
+            q = params.replace(" ", "").lower()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return True
+    return False
+
+
+StaticAsset = namedtuple("StaticAsset", "path stamp body gzip etag ctype modified")
+
+
+class StaticCache:
+    """
+    Fichiers statiques gardés en mémoire, avec leur variante gzip calculée au
+    chargement et un ETag fort (empreinte du contenu). `refresh()` (thread
+    `static-watcher`) recharge les fichiers dont la date ou la taille change.
+    """
+
+    def __init__(self, max_file=STATIC_CACHE_MAX_FILE):
+        self.max_file = max_file
+        self._lock = threading.Lock()
+        self._routes = {}  # _static_key -> chemin disque
+        self._files = {}  # chemin disque -> StaticAsset
+        self.loads = 0
+
+    def _load(self, full):
+        try:
+            with open(full, "rb") as f:
+                st = os.fstat(f.fileno())
+                if st.st_size > self.max_file:
+                    return None
+                body = f.read()
+        except OSError:
+            return None
+        ctype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+        compressed = None
+        if len(body) >= STATIC_GZIP_MIN and (
+            ctype.startswith("text/") or ctype in STATIC_GZIP_TYPES
+        ):
+            compressed = gzip.compress(body, 9, mtime=0)
+            if len(compressed) >= len(body):
+                compressed = None
+        self.loads += 1
+        return StaticAsset(
+            full,
+            (st.st_mtime_ns, st.st_size),
+            body,
+            compressed,
+            hashlib.sha1(body).hexdigest()[:20],
+            ctype,
+            formatdate(st.st_mtime, usegmt=True),
+        )
+
+    def lookup(self, url_path):
+        """StaticAsset du chemin demandé, None s'il n'existe pas ou est trop gros."""
+        key = _static_key(url_path)
+        full = self._routes.get(key)
+        if full is not None:
+            asset = self._files.get(full)
+            if asset is not None:
+                return asset
+        full = _static_file_path(url_path)
+        if full is None:
+            return None
+        asset = self._files.get(full) or self._load(full)
+        if asset is None:
+            return None
+        with self._lock:
+            self._files[full] = asset
+            self._routes[key] = full
+        return asset
+
+    def refresh(self):
+        """Recharge les fichiers modifiés, oublie les fichiers disparus; renvoie leur nombre."""
+        changed = 0
+        for full, asset in list(self._files.items()):
+            try:
+                st = os.stat(full)
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+            if stamp == asset.stamp:
+                continue
+            fresh = self._load(full) if stamp is not None else None
+            with self._lock:
+                if fresh is None:
+                    self._files.pop(full, None)
+                    for key in [k for k, v in self._routes.items() if v == full]:
+                        del self._routes[key]
+                else:
+                    self._files[full] = fresh
+            changed += 1
+        return changed
+
+
+STATIC_CACHE = StaticCache()
+
+
+def _static_response(url_path, headers):
+    """
+    Réponse (ApiResponse) d'un GET/HEAD statique servi depuis STATIC_CACHE:
+    gzip si le client l'accepte, 304 si `If-None-Match` correspond. None si
+    le fichier n'est pas en cache (absent, répertoire, trop gros).
+    """
+    asset = STATIC_CACHE.lookup(url_path)
+    if asset is None:
+        return None
+    use_gzip = asset.gzip is not None and _accepts_gzip(headers.get("Accept-Encoding"))
+    # ETag fort: chaque encodage est une représentation distincte
+    etag = f"{asset.etag}-gz" if use_gzip else asset.etag
+    out = [
+        ("Content-Type", asset.ctype),
+        ("Last-Modified", asset.modified),
+        ("Cache-Control", _cache_control_for_path(url_path)),
+        ("ETag", f'"{etag}"'),
+    ]
+    if asset.gzip is not None:
+        out.append(("Vary", "Accept-Encoding"))
+    if _etag_matches(headers.get("If-None-Match"), etag):
+        return ApiResponse(304, b"", tuple(out), None)
+    if use_gzip:
+        out.append(("Content-Encoding", "gzip"))
+        return ApiResponse(200, asset.gzip, tuple(out), None)
+    return ApiResponse(200, asset.body, tuple(out), None)
+
+
+def _static_watcher_loop(stop_event):
+    while not stop_event.wait(STATIC_WATCH_INTERVAL):
+        try:
+            STATIC_CACHE.refresh()
+        except Exception:
+            continue
+
+
+def start_static_watcher():
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_static_watcher_loop, args=(stop_event,), name="static-watcher", daemon=True
+    )
+    thread.start()
+    return stop_event
+
+
+class Handler(SimpleHTTPRequestHandler):
+    timeout = IDLE_TIMEOUT
+    protocol_version = "HTTP/1.1" if KEEP_ALIVE else "HTTP/1.0"
+    # en-têtes et corps partent en deux écritures: sans TCP_NODELAY, une connexion
+    # persistante attend l'ACK retardé du client avant d'envoyer le corps
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self._responses_sent = 0
+        self._body_with_headers = b""
+        self._active = False
+
+    def parse_request(self):
+        # ligne de requête lue: la requête compte comme en cours (drainage SIGHUP)
+        if not self._active:
+            self._active = True
+            self.server.request_started()
+        if self._responses_sent:
+            # fin de l'attente entre deux requêtes: en-têtes et corps ont droit à IDLE_TIMEOUT
+            self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
+    def flush_headers(self):
+        # corps envoyé avec les en-têtes: une seule écriture par réponse
+        body, self._body_with_headers = self._body_with_headers, b""
+        if body and hasattr(self, "_headers_buffer"):
+            self._headers_buffer.append(body)
+        super().flush_headers()
+
+    def handle_one_request(self):
+        if self._responses_sent:
+            # entre deux requêtes d'une connexion persistante: délai d'inactivité dédié
+            self.connection.settimeout(KEEP_ALIVE_TIMEOUT)
+        try:
+            return super().handle_one_request()
+        except (socket.timeout, ConnectionResetError, BrokenPipeError):
+            self.close_connection = True
+            return
+        finally:
+            if self._active:
+                self._active = False
+                self.server.request_finished()
+
+    def _mark_response(self, status_code, resp_len=0):
+        self._last_status = status_code
+        self._last_response_len = resp_len
+
+    def _keep_alive_allowed(self):
+        if not KEEP_ALIVE or self.close_connection or HOT_RESTART.draining.is_set():
+            return False
+        if self._responses_sent >= KEEP_ALIVE_MAX_REQUESTS:
+            return False
+        open_connections = getattr(self.server, "open_connections", 0)
+        return open_connections <= MAX_KEEP_ALIVE_CONNECTIONS
+
+    def end_headers(self):
+        self._responses_sent += 1
+        header_buf = getattr(self, "_headers_buffer", None) or []
+        if not any(b.lower().startswith(b"connection:") for b in header_buf):
+            if self._keep_alive_allowed():
+                self.send_header("Connection", "keep-alive")
+                remaining = KEEP_ALIVE_MAX_REQUESTS - self._responses_sent
+                self.send_header(
+                    "Keep-Alive", f"timeout={int(KEEP_ALIVE_TIMEOUT)}, max={remaining}"
                 )
+            else:
+                self.send_header("Connection", "close")
+        if self.command in ("GET", "HEAD") and not self.path.startswith("/api"):
+            if not any(b.lower().startswith(b"cache-control:") for b in header_buf):
+                self.send_header("Cache-Control", _cache_control_for_path(self.path))
+        super().end_headers()
+        if not KEEP_ALIVE:
+            self.close_connection = True
 
-    def do_GET(self):
-        parsed = urlparse(self.path)
-        if parsed.path not in ("/api/state", "/api/board"):
-            return super().do_GET()
+    def _set_cors(self):
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
+
+    def _write_api_response(self, resp, cors=True):
+        if resp.error:
+            self.send_error(resp.status, resp.error)
+            return
+        self._mark_response(resp.status, len(resp.body))
+        self.send_response(resp.status)
+        if cors:
+            self._set_cors()
+        for name, value in resp.headers:
+            self.send_header(name, value)
+        if resp.status != 304:
+            self.send_header("Content-Length", str(len(resp.body)))
+        if resp.body and self.command != "HEAD":
+            self._body_with_headers = resp.body
+        self.end_headers()
+
+    def send_error(self, code, message=None, explain=None):
+        self._mark_response(code, 0)
+        # le corps de la requête n'a pas forcément été lu: on ne réutilise pas la connexion
+        self.close_connection = True
+        return super().send_error(code, message, explain)
+
+    def _discard_body(self, length):
+        if length:
+            try:
+                self.rfile.read(length)
+            except Exception:
+                pass
+
+    def _handle_api(self, parsed):
         start = time.perf_counter()
         ip = _get_client_ip(self)
+        req_len = 0
         self._last_status = None
         self._last_response_len = 0
         try:
-            if not _consume_rate_limit(ip, time.time()):
-                self.send_error(429, "too many requests")
-                return
-            with LOCK:
-                now = time.time()
-                _prune_leaderboard(now)
-                board = sorted(LEADERBOARD, key=_score_sort_key, reverse=True)[:MAX_BOARD]
-            self._write_json(200, {"ok": True, "board": board, "serverTime": now})
+            body = b""
+            resp = None
+            if self.command == "POST":
+                req_len, resp = _api_content_length(self.headers.get("Content-Length"))
+                if resp is not None and resp.status == 413:
+                    self._discard_body(req_len)
+                elif resp is None and req_len:
+                    body = self.rfile.read(req_len)
+            if resp is None:
+                resp = handle_api(
+                    self.command, parsed.path, parsed.query, self.headers, body, ip
+                )
+            self._write_api_response(resp)
         finally:
             if self._last_status is not None:
                 duration = (time.perf_counter() - start) * 1000
-                self._log_api(
-                    "GET",
+                _log_api(
+                    self.command,
                     parsed.path,
                     self._last_status,
                     duration,
-                    0,
+                    req_len,
                     self._last_response_len,
                     ip,
                 )
 
+    def _handle_stream(self, parsed):
+        start = time.perf_counter()
+        ip = _get_client_ip(self)
+        sub, resp = _stream_open(parsed.query, ip)
+        if resp is not None:
+            self._write_api_response(resp)
+            _log_api("GET", parsed.path, resp.status, 0.0, 0, 0, ip)
+            return
+        sent = 0
+        try:
+            self.send_response(200)
+            self._set_cors()
+            for name, value in STREAM_HEADERS:
+                self.send_header(name, value)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(b"retry: 2000\n\n")
+            last_write = time.monotonic()
+            tick = BROADCASTER.wait(BROADCASTER.current.seq, STREAM_PING_INTERVAL)
+            # redémarrage à chaud: le client se reconnecte (retry) au nouveau processus
+            while not HOT_RESTART.draining.is_set():
+                chunk = _stream_events(sub, tick)
+                if not chunk and time.monotonic() - last_write >= STREAM_PING_INTERVAL:
+                    chunk = b": ping\n\n"
+                if chunk:
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    last_write = time.monotonic()
+                tick = BROADCASTER.wait(sub.seq, STREAM_PING_INTERVAL)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.close_connection = True
+            BROADCASTER.unsubscribe()
+            duration = (time.perf_counter() - start) * 1000
+            _log_api("GET", parsed.path, 200, duration, 0, sent, ip)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._set_cors()
+        self.end_headers()
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if not _is_api_route("POST", parsed.path):
+            self.send_error(501, "Unsupported method ('POST')")
+            return
+        self._handle_api(parsed)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == API_STREAM_ROUTE:
+            self._handle_stream(parsed)
+            return
+        if not _is_api_route("GET", parsed.path):
+            return self._handle_static(parsed)
+        self._handle_api(parsed)
+
+    def do_HEAD(self):
+        return self._handle_static(urlparse(self.path))
+
+    def _handle_static(self, parsed):
+        resp = _static_response(parsed.path, self.headers)
+        if resp is None:
+            # répertoires (redirection, listing), fichiers trop gros, 404: lecture disque
+            return super().do_GET() if self.command == "GET" else super().do_HEAD()
+        self._write_api_response(resp, cors=False)
+
     def log_message(self, format, *args):
         return
 
@@ -636,20 +3344,987 @@ class Handler(SimpleHTTPRequestHandler):
 class Server(ThreadingHTTPServer):
     block_on_close = False
     allow_reuse_address = True
+    reuse_port = False  # SO_REUSEPORT, pour les workers de WORKERS=N
+    request_queue_size = LISTEN_BACKLOG
 
+    def __init__(self, *args, **kwargs):
+        self.open_connections = 0
+        self.active_requests = 0
+        self._connections_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
 
-def main():
-    load_board()
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self.open_connections += 1
+        return super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self._connections_lock:
+            self.open_connections = max(0, self.open_connections - 1)
+        return super().shutdown_request(request)
+
+    def request_started(self):
+        with self._connections_lock:
+            self.active_requests += 1
+
+    def request_finished(self):
+        with self._connections_lock:
+            self.active_requests = max(0, self.active_requests - 1)
+
+
+# ---------------------------------------------------------------------------
+# Moteur asyncio (ENGINE=asyncio): une boucle d'événements, une coroutine par
+# connexion, même coeur d'API et mêmes fichiers statiques que le Handler.
+# ---------------------------------------------------------------------------
+
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class AsyncServer:
+    server_version = "EtherRelay-asyncio"
+
+    def __init__(self, host, port, reuse_port=False):
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.open_connections = 0
+        self.active_requests = 0
+        self._writers = set()
+        self._server = None
+        self._loop = None
+        self._tick_future = None
+        self._tick_listener = None
+
+    def _on_tick(self):
+        # appelé dans la boucle: réveille tous les flux en attente du tick
+        future, self._tick_future = self._tick_future, self._loop.create_future()
+        if not future.done():
+            future.set_result(None)
+
+    async def _wait_tick(self, seq, timeout):
+        if BROADCASTER.current.seq <= seq:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._tick_future), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return BROADCASTER.current
+
+    def _probe_lag(self, expected):
+        now = self._loop.time()
+        LOAD.observe_lag(max(0.0, now - expected))
+        self._loop.call_at(now + LOAD_LAG_INTERVAL, self._probe_lag, now + LOAD_LAG_INTERVAL)
+
+    async def start(self, sock=None):
+        self._loop = asyncio.get_running_loop()
+        self._tick_future = self._loop.create_future()
+        self._probe_lag(self._loop.time())
+        if self._tick_listener is None:
+            loop = self._loop
+            self._tick_listener = lambda tick: loop.call_soon_threadsafe(self._on_tick)
+            BROADCASTER.add_listener(self._tick_listener)
+        if sock is not None:
+            self._server = await asyncio.start_server(
+                self._handle_connection, sock=sock, backlog=LISTEN_BACKLOG, limit=MAX_HEADER_BYTES
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection,
+                self.host,
+                self.port,
+                reuse_address=True,
+                reuse_port=self.reuse_port or None,
+                backlog=LISTEN_BACKLOG,
+                limit=MAX_HEADER_BYTES,
+            )
+        return self._server
+
+    async def serve_forever(self, sock=None):
+        if self._server is None:
+            await self.start(sock)
+        loop = self._loop
+        sock = self._server.sockets[0]
+        HOT_RESTART.attach(sock, lambda: loop.call_soon_threadsafe(self._server.close))
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                if not HOT_RESTART.draining.is_set():
+                    raise
+            else:
+                return
+            # SIGHUP: plus d'accept, on laisse finir les requêtes en cours
+            deadline = loop.time() + HOT_RESTART_DRAIN
+            while self.active_requests and loop.time() < deadline:
+                await asyncio.sleep(0.01)
+            grace = min(deadline, loop.time() + HOT_RESTART_IDLE_GRACE)
+            while self.open_connections and loop.time() < grace:
+                await asyncio.sleep(0.01)
+            # connexions persistantes restées inactives: fermées plutôt qu'annulées par asyncio.run
+            for writer in list(self._writers):
+                writer.close()
+            while self.open_connections and loop.time() < deadline:
+                await asyncio.sleep(0.01)
+
+    def _keep_alive_allowed(self, version, headers, responses_sent):
+        if not KEEP_ALIVE or responses_sent >= KEEP_ALIVE_MAX_REQUESTS:
+            return False
+        if HOT_RESTART.draining.is_set():
+            return False
+        if self.open_connections > MAX_KEEP_ALIVE_CONNECTIONS:
+            return False
+        connection = (headers.get("Connection") or "").lower()
+        if "close" in connection:
+            return False
+        return version == "HTTP/1.1" or "keep-alive" in connection
+
+    async def _handle_connection(self, reader, writer):
+        self.open_connections += 1
+        self._writers.add(writer)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+        peer = writer.get_extra_info("peername") or ("unknown", 0)
+        responses_sent = 0
+        try:
+            while True:
+                timeout = KEEP_ALIVE_TIMEOUT if responses_sent else IDLE_TIMEOUT
+                try:
+                    head = await self._read_head(reader, timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    return
+                except asyncio.LimitOverrunError:
+                    resp = _api_error(431, "headers too large")
+                    await self._send(writer, resp, False, "GET")
+                    return
+                self.active_requests += 1
+                try:
+                    keep_alive = await self._handle_request(
+                        reader, writer, head, peer, responses_sent
+                    )
+                finally:
+                    self.active_requests -= 1
+                responses_sent += 1
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return
+        finally:
+            self.open_connections -= 1
+            self._writers.discard(writer)
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _read_head(self, reader, timeout):
+        """
+        Ligne de requête sous `timeout` (KEEP_ALIVE_TIMEOUT entre deux requêtes),
+        puis en-têtes jusqu'à la ligne vide sous IDLE_TIMEOUT, comme le Handler.
+        """
+        head = line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+        deadline = self._loop.time() + IDLE_TIMEOUT
+        while line != b"\r\n":
+            if len(head) > MAX_HEADER_BYTES:
+                raise asyncio.LimitOverrunError("headers too large", len(head))
+            remaining = max(deadline - self._loop.time(), 0.0)
+            line = await asyncio.wait_for(reader.readuntil(b"\r\n"), remaining)
+            head += line
+        return head
+
+    async def _handle_request(self, reader, writer, head, peer, responses_sent):
+        try:
+            request_line, _, header_block = head.partition(b"\r\n")
+            method, target, version = request_line.decode("latin-1").split()
+            headers = BytesParser(_class=HTTPMessage).parsebytes(header_block)
+        except ValueError:
+            await self._send(writer, _api_error(400, "bad request"), False, "GET")
+            return False
+        keep_alive = self._keep_alive_allowed(version, headers, responses_sent)
+        parsed = urlparse(target)
+        ip = _client_ip(headers, peer)
+
+        if method == "OPTIONS":
+            resp = ApiResponse(204, b"", CORS_HEADERS, None)
+            await self._send(writer, resp, keep_alive, method, cors=False)
+            return keep_alive
+        if method == "GET" and parsed.path == API_STREAM_ROUTE:
+            await self._stream(writer, parsed, ip)
+            return False
+        if not _is_api_route(method, parsed.path):
+            if method in ("GET", "HEAD"):
+                await self._send_static(writer, parsed.path, keep_alive, method, headers)
+                return keep_alive
+            # corps éventuel non lu: la connexion ne peut pas être réutilisée
+            resp = _api_error(501, f"Unsupported method ({method!r})")
+            await self._send(writer, resp, False, method)
+            return False
+
+        start = time.perf_counter()
+        req_len = 0
+        body = b""
+        resp = None
+        if method == "POST":
+            req_len, resp = _api_content_length(headers.get("Content-Length"))
+            if resp is not None and resp.status == 413:
+                try:
+                    await asyncio.wait_for(reader.readexactly(req_len), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    pass
+            elif resp is None and req_len:
+                body = await asyncio.wait_for(reader.readexactly(req_len), IDLE_TIMEOUT)
+        if resp is None:
+            resp = handle_api(method, parsed.path, parsed.query, headers, body, ip)
+        if resp.error:
+            keep_alive = False
+        sent = await self._send(writer, resp, keep_alive, method)
+        _log_api(
+            method,
+            parsed.path,
+            resp.status,
+            (time.perf_counter() - start) * 1000,
+            req_len,
+            sent,
+            ip,
+        )
+        return keep_alive
+
+    async def _stream(self, writer, parsed, ip):
+        start = time.perf_counter()
+        sub, resp = _stream_open(parsed.query, ip)
+        if resp is not None:
+            await self._send(writer, resp, False, "GET")
+            _log_api("GET", parsed.path, resp.status, 0.0, 0, 0, ip)
+            return
+        sent = 0
+        try:
+            lines = [
+                "HTTP/1.1 200 OK",
+                f"Server: {self.server_version}",
+                f"Date: {formatdate(usegmt=True)}",
+            ]
+            lines.extend(f"{name}: {value}" for name, value in CORS_HEADERS + STREAM_HEADERS)
+            lines.append("Connection: close")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            writer.write(b"retry: 2000\n\n")
+            await writer.drain()
+            last_write = time.monotonic()
+            tick = await self._wait_tick(BROADCASTER.current.seq, STREAM_PING_INTERVAL)
+            while not writer.is_closing() and not HOT_RESTART.draining.is_set():
+                chunk = _stream_events(sub, tick)
+                if not chunk and time.monotonic() - last_write >= STREAM_PING_INTERVAL:
+                    chunk = b": ping\n\n"
+                if chunk:
+                    writer.write(chunk)
+                    await writer.drain()
+                    sent += len(chunk)
+                    last_write = time.monotonic()
+                tick = await self._wait_tick(sub.seq, STREAM_PING_INTERVAL)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            BROADCASTER.unsubscribe()
+            duration = (time.perf_counter() - start) * 1000
+            _log_api("GET", parsed.path, 200, duration, 0, sent, ip)
+
+    async def _send_static(self, writer, url_path, keep_alive, method, headers):
+        resp = _static_response(url_path, headers)
+        if resp is not None:
+            await self._send(writer, resp, keep_alive, method, cors=False)
+            return
+        full = _static_file_path(url_path)
+        if full is None:
+            await self._send(writer, _api_error(404, "File not found"), False, method)
+            return
+        try:
+            with open(full, "rb") as f:
+                body = f.read()
+        except OSError:
+            await self._send(writer, _api_error(404, "File not found"), False, method)
+            return
+        ctype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+        headers = (
+            ("Content-Type", ctype),
+            ("Last-Modified", formatdate(os.path.getmtime(full), usegmt=True)),
+            ("Cache-Control", _cache_control_for_path(url_path)),
+        )
+        resp = ApiResponse(200, body, headers, None)
+        await self._send(writer, resp, keep_alive, method, cors=False)
+
+    async def _send(self, writer, resp, keep_alive, method, cors=True):
+        """Écrit une réponse complète; renvoie la taille du corps (0 pour une erreur)."""
+        try:
+            status = HTTPStatus(resp.status)
+            reason, explain = status.phrase, status.description
+        except ValueError:
+            reason, explain = "", ""
+        headers = list(resp.headers)
+        body = resp.body
+        if resp.error:
+            # même page d'erreur que BaseHTTPRequestHandler.send_error
+            body = (
+                DEFAULT_ERROR_MESSAGE
+                % {
+                    "code": resp.status,
+                    "message": html.escape(resp.error, quote=False),
+                    "explain": html.escape(explain, quote=False),
+                }
+            ).encode("UTF-8", "replace")
+            headers = [("Content-Type", DEFAULT_ERROR_CONTENT_TYPE)]
+        lines = [
+            f"HTTP/1.1 {resp.status} {reason}",
+            f"Server: {self.server_version}",
+            f"Date: {formatdate(usegmt=True)}",
+        ]
+        if cors and not resp.error:
+            lines.extend(f"{name}: {value}" for name, value in CORS_HEADERS)
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if resp.status not in (204, 304):
+            lines.append(f"Content-Length: {len(body)}")
+        if keep_alive:
+            lines.append("Connection: keep-alive")
+            lines.append(f"Keep-Alive: timeout={int(KEEP_ALIVE_TIMEOUT)}")
+        else:
+            lines.append("Connection: close")
+        out = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        if method != "HEAD" and resp.status not in (204, 304):
+            out += body
+        writer.write(out)
+        await writer.drain()
+        return 0 if resp.error else len(body)
+
+
+# ---------------------------------------------------------------------------
+# Mode multi-processus (WORKERS=N): N workers forkés écoutent le même port
+# (SO_REUSEPORT); le processus parent relaie entre eux la présence et les
+# événements du classement et reste le seul à écrire les scores.
+# ---------------------------------------------------------------------------
+
+
+def _apply_board_events(events, now, record=False, observe=True):
+    """
+    Applique des événements `add`/`evict`/`reset` publiés par un worker au
+    classement et aux fenêtres (idempotent); `record` les passe à BOARD_WRITER,
+    `observe` aux index de rang du store (qui, eux, comptent chaque `add`).
+    """
+    with BOARD_LOCK:
+        for event in events:
+            op = event.get("op")
+            if op == "add" and isinstance(event.get("entry"), dict):
+                entry = _entry_from_raw(event["entry"], now)
+                LEADERBOARD.add(entry, MAX_STORE)
+                for board in BOARD_WINDOWS.values():
+                    board.add(entry, now)
+            elif op == "evict":
+                for entry_id in event.get("ids") or ():
+                    LEADERBOARD.remove(entry_id)
+                    for board in BOARD_WINDOWS.values():
+                        board.remove(entry_id)
+            elif op == "reset":
+                LEADERBOARD.clear()
+                for board in BOARD_WINDOWS.values():
+                    board.clear()
+            else:
+                continue
+            if observe:
+                STORE.observe(event)
+            if record:
+                BOARD_WRITER.record(event)
+        _board_changed()
+
+
+def _encode_sync(source, changes, events):
+    message = {"w": source}
+    if changes:
+        message["p"] = changes
+    if events:
+        message["b"] = events
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+class WorkerLink:
+    """
+    Côté worker: remplace BOARD_WRITER (`record` sous BOARD_LOCK) et publie au
+    parent, toutes les WORKER_SYNC_INTERVAL secondes, les changements de
+    PLAYERS et les événements du classement; applique ceux des autres workers.
+    """
+
+    def __init__(self, index, sock):
+        self.index = index
+        self._sock = sock
+        self._cond = threading.Condition()
+        self._events = []
+        self._closed = False
+        self.batches = 0
+        self.errors = 0
+        self.flush_total = 0.0
+        self.flush_max = 0.0
+
+    def record(self, event):
+        with self._cond:
+            self._events.append(event)
+
+    def flush(self):
+        start = time.perf_counter()
+        with PRESENCE_LOCK:
+            changes, PLAYERS.changes = PLAYERS.changes, {}
+            # encodé verrou tenu: les dicts joueurs publiés sont ceux de PLAYERS
+            changes = {sid: None if p is None else dict(p) for sid, p in (changes or {}).items()}
+        with self._cond:
+            events, self._events = self._events, []
+        if not changes and not events:
+            return False
+        try:
+            self._sock.sendall(_encode_sync(self.index, changes, events))
+        except OSError:
+            self.errors += 1
+            return False
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.flush_total += elapsed
+        self.flush_max = max(self.flush_max, elapsed)
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed, WORKER_SYNC_INTERVAL)
+                closed = self._closed
+            self.flush()
+            if closed:
+                break
+        try:
+            self._sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def listen(self):
+        """Applique les lots des autres workers; parent disparu: arrêt du worker."""
+        with self._sock.makefile("rb") as stream:
+            for line in stream:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                now = time.time()
+                if message.get("p"):
+                    with PRESENCE_LOCK:
+                        PLAYERS.merge(message["p"])
+                if message.get("b"):
+                    _apply_board_events(message["b"], now)
+        if not self._closed:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._events)
+        # mêmes clés que BoardWriter.stats(): ici un "append" est un lot envoyé au parent
+        return {
+            "pending": pending,
+            "journalEvents": 0,
+            "appends": self.batches,
+            "compactions": 0,
+            "errors": self.errors,
+            "flushAvgMs": round(self.flush_total * 1000 / self.batches, 3) if self.batches else 0.0,
+            "flushMs": round(self.flush_total * 1000, 3),
+            "flushMaxMs": round(self.flush_max * 1000, 3),
+            "compactMaxMs": 0.0,
+            "worker": self.index,
+        }
+
+
+def _run_worker(index, sock):
+    """Corps d'un worker forké; ne revient jamais (os._exit)."""
+    global BOARD_WRITER, BOARD_EPOCH, RATE_LIMITERS, ACCESS_LOG
+    code = 0
+    try:
+        # connexions sqlite ouvertes par le parent (load_board) avant le fork
+        STORE.after_fork()
+        link = WorkerLink(index, sock)
+        BOARD_WRITER = link
+        PLAYERS.changes = {}
+        # versions propres au worker: un client qui change de worker reçoit le classement
+        BOARD_EPOCH = secrets.token_hex(4)
+        with BOARD_LOCK:
+            _board_changed()
+            for board in BOARD_WINDOWS.values():
+                board._changed()
+        # verrous éventuellement tenus par un thread du parent au moment du fork
+        RATE_LIMITERS = {
+            route: RateLimiter(limiter.rps, limiter.burst) for route, limiter in RATE_LIMITERS.items()
+        }
+        threads = [
+            threading.Thread(target=link.run, name="worker-link", daemon=True),
+            threading.Thread(target=link.listen, name="worker-listen", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        # un fichier par worker: la rotation de RotatingFileHandler n'est pas sûre entre processus
+        ACCESS_LOG = AccessLog(
+            _worker_log_target(ACCESS_LOG_TARGET, index),
+            LOG_SAMPLE_STATE,
+            ACCESS_LOG_MAX_BYTES,
+            ACCESS_LOG_BACKUPS,
+        )
+        access_log = start_access_log()
+        reaper_stop = start_reaper()
+        broadcaster_stop = start_broadcaster()
+        static_stop = start_static_watcher()
+        try:
+            if ENGINE == "asyncio":
+                _serve_asyncio(reuse_port=True)
+            else:
+                _serve_threading(reuse_port=True)
+        finally:
+            static_stop.set()
+            broadcaster_stop.set()
+            reaper_stop.set()
+            link.close()
+            threads[0].join(timeout=5)
+            ACCESS_LOG.close()
+            access_log.join(timeout=5)
+    except BaseException:
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+
+class WorkerSupervisor:
+    """
+    Côté parent: forke les workers, applique leurs lots à sa propre copie de
+    PLAYERS et du classement (source de vérité pour BOARD_WRITER et pour les
+    workers relancés, qui en héritent au fork) et les relaie aux autres.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # pris avant PRESENCE_LOCK et BOARD_LOCK
+        self._peers = {}  # index -> socket côté parent
+        self._pids = {}  # pid -> index
+        self._readers = []
+        self.stopping = False
+
+    def spawn(self, index):
+        parent_sock, child_sock = socket.socketpair()
+        # aucun verrou de données tenu par un autre thread au moment du fork,
+        # et aucun lot appliqué sans être relayé au nouveau worker
+        with self._lock, PRESENCE_LOCK, BOARD_LOCK:
+            pid = os.fork()
+            if pid == 0:
+                for sock in self._peers.values():
+                    sock.close()
+                parent_sock.close()
+            else:
+                self._peers[index] = parent_sock
+                self._pids[pid] = index
+        if pid == 0:
+            _run_worker(index, child_sock)
+        child_sock.close()
+        reader = threading.Thread(
+            target=self._relay, args=(index, parent_sock), name=f"worker-{index}-relay", daemon=True
+        )
+        reader.start()
+        self._readers.append(reader)
+        return pid
+
+    def _relay(self, index, sock):
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                with self._lock:
+                    if message.get("p"):
+                        with PRESENCE_LOCK:
+                            PLAYERS.merge(message["p"])
+                    if message.get("b"):
+                        _apply_board_events(message["b"], time.time(), record=True)
+                    for peer_index, peer in list(self._peers.items()):
+                        if peer_index == index:
+                            continue
+                        try:
+                            peer.sendall(line)
+                        except OSError:
+                            continue
+        with self._lock:
+            if self._peers.get(index) is sock:
+                del self._peers[index]
+        sock.close()
+
+    def watch(self):
+        """Relance les workers qui meurent jusqu'à l'arrêt (KeyboardInterrupt)."""
+        while True:
+            pid, status = os.wait()
+            index = self._pids.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            print(f"[workers] worker {index} exited (status {status}), restarting")
+            time.sleep(WORKER_RESPAWN_DELAY)
+            self.spawn(index)
+
+    def stop(self, timeout=10.0):
+        """Arrête les workers (SIGTERM), attend leurs derniers lots puis leur sortie."""
+        self.stopping = True
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                self._pids.pop(pid, None)
+        deadline = time.monotonic() + timeout
+        while self._pids and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.05)
+                continue
+            self._pids.pop(pid, None)
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self._pids.clear()
+        for reader in self._readers:
+            reader.join(timeout=max(0.0, deadline - time.monotonic()))
+
+
+def _serve_workers(count):
+    writer = start_board_writer()
+    reaper_stop = start_reaper()
+    supervisor = WorkerSupervisor()
+    print(f"Space Cleaner server listening on http://0.0.0.0:{PORT} ({count} workers)")
+    try:
+        for index in range(count):
+            supervisor.spawn(index)
+        supervisor.watch()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+        reaper_stop.set()
+        BOARD_WRITER.close()
+        writer.join(timeout=10)
+
+
+# ---------------------------------------------------------------------------
+# Redémarrage à chaud (SIGHUP, WORKERS=1): l'ancien processus lance server.py
+# en lui passant la socket d'écoute et cesse d'accepter dès que le nouveau,
+# classement chargé, est prêt: le nouveau sert aussitôt. L'ancien draine ses
+# requêtes, écrit les scores puis envoie la présence, les seaux de limitation
+# de débit et son classement, fusionnés à leur arrivée; le nouveau n'écrit
+# dans le store qu'ensuite. Entre les deux, les connexions attendent dans la
+# file de la socket (LISTEN_BACKLOG).
+# ---------------------------------------------------------------------------
+
+HANDOFF_LISTEN_ENV = "HANDOFF_LISTEN_FD"
+HANDOFF_CONTROL_ENV = "HANDOFF_CONTROL_FD"
+HANDOFF_READY = b"ready\n"
+
+
+def _encode_snapshot(now):
+    """
+    Présence (`PLAYERS`), seaux entamés de chaque limiteur et scores en mémoire
+    (classement complet et fenêtres), en JSON compressé.
+    """
+    with PRESENCE_LOCK:
+        players = dict(PLAYERS.items())
+    with BOARD_LOCK:
+        board = {entry["id"]: entry for entry in LEADERBOARD[:MAX_STORE]}
+        for window in BOARD_WINDOWS.values():
+            for entry in window.board:
+                board.setdefault(entry["id"], entry)
+        board = [dict(entry) for entry in board.values()]
+    payload = {
+        "time": now,
+        "players": players,
+        "rateLimit": {route: limiter.snapshot(now) for route, limiter in RATE_LIMITERS.items()},
+        "board": board,
+    }
+    return gzip.compress(json.dumps(payload, separators=(",", ":")).encode(), compresslevel=6)
+
+
+def _restore_snapshot(blob):
+    """
+    Fusionne un instantané de `_encode_snapshot`; renvoie le nombre de sessions
+    reprises. Une session déjà revenue sur ce processus garde son état, complété
+    des champs qu'elle n'a pas encore.
+    """
+    try:
+        payload = json.loads(gzip.decompress(blob))
+    except (OSError, EOFError, ValueError):
+        return 0
+    if not isinstance(payload, dict):
+        return 0
+    taken = _safe_float(payload.get("time"), time.time())
+    players = payload.get("players")
+    restored = 0
+    if isinstance(players, dict):
+        with PRESENCE_LOCK:
+            for sid, player in players.items():
+                if not isinstance(player, dict):
+                    continue
+                if sid in PLAYERS:
+                    PLAYERS[sid] = dict(player, **PLAYERS[sid])
+                else:
+                    PLAYERS[sid] = player
+                restored += 1
+    buckets = payload.get("rateLimit")
+    if isinstance(buckets, dict):
+        for route, rows in buckets.items():
+            limiter = RATE_LIMITERS.get(route)
+            if limiter is not None and isinstance(rows, list):
+                limiter.restore(rows, taken)
+    board = payload.get("board")
+    if isinstance(board, list):
+        # scores déjà écrits par l'ancien processus: fusion en mémoire seulement
+        events = [{"op": "add", "entry": entry} for entry in board if isinstance(entry, dict)]
+        # scores déjà dans la base: l'index de rang les reprend par `refresh_ranks`
+        _apply_board_events(events, time.time(), observe=False)
+    return restored
+
+
+def _handoff_receive():
+    """
+    Côté nouveau processus: `(socket d'écoute, canal de contrôle)` hérités de
+    l'ancien, `(None, None)` pour un démarrage normal (voir `HotRestart.adopt`).
+    """
+    listen_fd = os.environ.pop(HANDOFF_LISTEN_ENV, "")
+    control_fd = os.environ.pop(HANDOFF_CONTROL_ENV, "")
+    if not listen_fd or not control_fd:
+        return None, None
+    return socket.socket(fileno=int(listen_fd)), socket.socket(fileno=int(control_fd))
+
+
+def _handoff_read(control):
+    """Attend l'instantané de l'ancien processus (après son drainage); b"" s'il n'arrive pas."""
+    chunks = []
+    with control:
+        try:
+            control.settimeout(HOT_RESTART_DRAIN + 15)
+            while True:
+                chunk = control.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except OSError:
+            # ancien processus mort ou trop lent: on continue sans sa présence
+            chunks = []
+    return b"".join(chunks)
+
+
+class HotRestart:
+    """Côté ancien processus: relève par un nouveau server.py sur la même socket."""
+
+    def __init__(self):
+        self.draining = threading.Event()  # plus d'accept, keep-alive et flux coupés
+        self._lock = threading.Lock()
+        self._listen = None
+        self._stop_accepting = None
+        self._control = None
+        self._pending = False
+
+    def attach(self, listen_sock, stop_accepting):
+        """Socket d'écoute à transmettre et fonction qui arrête d'accepter (hors thread du serveur)."""
+        self._listen = listen_sock
+        self._stop_accepting = stop_accepting
+
+    def request(self):
+        # appelé depuis le gestionnaire de signal: le lancement se fait dans un thread
+        with self._lock:
+            if self._pending or self.draining.is_set() or self._listen is None:
+                return False
+            self._pending = True
+        threading.Thread(target=self._spawn, name="hot-restart", daemon=True).start()
+        return True
+
+    def _spawn(self):
+        parent, child = socket.socketpair()
+        proc = None
+        try:
+            listen_fd = self._listen.fileno()
+            env = dict(os.environ)
+            env[HANDOFF_LISTEN_ENV] = str(listen_fd)
+            env[HANDOFF_CONTROL_ENV] = str(child.fileno())
+            proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__)] + sys.argv[1:],
+                env=env,
+                pass_fds=(listen_fd, child.fileno()),
+            )
+            child.close()
+            parent.settimeout(HOT_RESTART_TIMEOUT)
+            ready = parent.recv(len(HANDOFF_READY))
+            if ready != HANDOFF_READY:
+                raise OSError("new process exited before it was ready")
+        except OSError as exc:
+            print(f"[restart] hot restart aborted: {exc}")
+            child.close()
+            parent.close()
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            with self._lock:
+                self._pending = False
+            return
+        parent.settimeout(None)
+        print(f"[restart] handing over to pid {proc.pid}")
+        self._control = parent
+        self.draining.set()
+        self._stop_accepting()
+
+    def adopt(self, control):
+        """
+        Côté nouveau processus: signale à l'ancien qu'on sert, puis lance le
+        thread qui fusionne son instantané et seulement ensuite écrit les scores
+        (l'ancien écrit le store jusqu'à sa sortie). Renvoie ce thread.
+        """
+        with self._lock:
+            # pas de nouvelle relève tant que celle-ci n'est pas terminée
+            self._pending = True
+        try:
+            control.sendall(HANDOFF_READY)
+        except OSError:
+            pass
+        thread = threading.Thread(target=self._adopt, args=(control,), name="board-writer", daemon=True)
+        thread.start()
+        return thread
+
+    def _adopt(self, control):
+        try:
+            snapshot = _handoff_read(control)
+            if snapshot:
+                restored = _restore_snapshot(snapshot)
+                print(f"[restart] restored {restored} sessions from previous process")
+            # l'ancien processus a fini d'écrire: ses derniers scores rejoignent l'index de rang
+            try:
+                STORE.refresh_ranks()
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._lock:
+                self._pending = False
+        BOARD_WRITER.run()
+
+    def handoff(self):
+        """Envoie l'instantané au nouveau processus (après l'écriture des scores)."""
+        control, self._control = self._control, None
+        if control is None:
+            return
+        try:
+            control.sendall(_encode_snapshot(time.time()))
+        except OSError:
+            pass
+        finally:
+            control.close()
+
+
+HOT_RESTART = HotRestart()
+
+
+def _serve_threading(reuse_port=False, sock=None):
     handler = functools.partial(Handler, directory=BASE_DIR)
-    srv = Server(("0.0.0.0", PORT), handler)
+    srv = Server(("0.0.0.0", PORT), handler, bind_and_activate=False)
+    srv.reuse_port = reuse_port
+    if sock is not None:
+        # socket d'écoute héritée d'un redémarrage à chaud: déjà liée, listen()
+        # de nouveau pour appliquer LISTEN_BACKLOG
+        srv.socket.close()
+        srv.socket = sock
+        srv.server_activate()
+    else:
+        try:
+            srv.server_bind()
+            srv.server_activate()
+        except BaseException:
+            srv.server_close()
+            raise
+    HOT_RESTART.attach(srv.socket, srv.shutdown)
     print(f"Space Cleaner server listening on http://0.0.0.0:{PORT}")
     try:
         srv.serve_forever()
+        if HOT_RESTART.draining.is_set():
+            deadline = time.monotonic() + HOT_RESTART_DRAIN
+            while srv.active_requests and time.monotonic() < deadline:
+                time.sleep(0.01)
+            grace = min(deadline, time.monotonic() + HOT_RESTART_IDLE_GRACE)
+            while srv.open_connections and time.monotonic() < grace:
+                time.sleep(0.01)
     except KeyboardInterrupt:
         pass
     finally:
         srv.server_close()
 
 
+def _serve_asyncio(reuse_port=False, sock=None):
+    srv = AsyncServer("0.0.0.0", PORT, reuse_port)
+    print(f"Space Cleaner server listening on http://0.0.0.0:{PORT} (asyncio)")
+    try:
+        asyncio.run(srv.serve_forever(sock))
+    except KeyboardInterrupt:
+        pass
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _hangup(signum, frame):
+    if WORKERS > 1:
+        print("[restart] SIGHUP ignored: hot restart requires WORKERS=1")
+        return
+    HOT_RESTART.request()
+
+
+def main():
+    # redémarrage à chaud: socket d'écoute et canal de contrôle hérités de l'ancien processus
+    listen_sock, control = _handoff_receive()
+    load_board()
+    # SIGTERM suit le même chemin que Ctrl-C: dernière écriture des scores avant de sortir
+    signal.signal(signal.SIGTERM, _interrupt)
+    signal.signal(signal.SIGHUP, _hangup)
+    if WORKERS > 1:
+        _serve_workers(WORKERS)
+        return
+    if control is None:
+        writer = start_board_writer()
+    else:
+        # on sert tout de suite; instantané et écriture des scores suivent le drainage de l'ancien
+        writer = HOT_RESTART.adopt(control)
+    access_log = start_access_log()
+    reaper_stop = start_reaper()
+    broadcaster_stop = start_broadcaster()
+    static_stop = start_static_watcher()
+    try:
+        if ENGINE == "asyncio":
+            _serve_asyncio(sock=listen_sock)
+        else:
+            _serve_threading(sock=listen_sock)
+    finally:
+        static_stop.set()
+        broadcaster_stop.set()
+        reaper_stop.set()
+        BOARD_WRITER.close()
+        writer.join(timeout=10)
+        # scores écrits: le nouveau processus peut relire le store et reprendre la présence
+        HOT_RESTART.handoff()
+        ACCESS_LOG.close()
+        access_log.join(timeout=5)
+
+
 if __name__ == "__main__":
     main()
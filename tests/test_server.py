@@ -1,14 +1,33 @@
+import asyncio
+import functools
+import http.client
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
 import time
 import unittest
 
 import server
 
 
+def _backdate(entry, created):
+    # les entrées d'un RankedBoard sont figées: on retire, modifie puis réinsère
+    with server.BOARD_LOCK:
+        server.LEADERBOARD.remove(entry["id"])
+        for board in server.BOARD_WINDOWS.values():
+            board.remove(entry["id"])
+        entry["created"] = created
+        server.LEADERBOARD.add(entry)
+
+
 class ServerUtilsTests(unittest.TestCase):
     def setUp(self):
-        self._orig_leaderboard = list(server.LEADERBOARD)
+        self._orig_leaderboard = server.LEADERBOARD
         self._orig_dry_run = server.DRY_RUN
-        server.LEADERBOARD = []
+        server.LEADERBOARD = server.RankedBoard()
         server.DRY_RUN = True
 
     def tearDown(self):
@@ -37,13 +56,1258 @@ class ServerUtilsTests(unittest.TestCase):
 
     def test_prune_leaderboard(self):
         now = time.time()
-        server.LEADERBOARD = [
-            {"score": 10, "time": 1, "created": now - server.BOARD_TTL - 10},
-            {"score": 5, "time": 1, "created": now},
-        ]
+        server.LEADERBOARD = server.RankedBoard([
+            {"id": "a", "score": 10, "time": 1, "created": now - server.BOARD_TTL - 10},
+            {"id": "b", "score": 5, "time": 1, "created": now},
+        ])
         server._prune_leaderboard(now)
         self.assertEqual(len(server.LEADERBOARD), 1)
 
+    def test_board_snapshot_is_cached_until_board_changes(self):
+        server._board_changed()
+        first = server._board_snapshot()
+        self.assertIs(server._board_snapshot(), first)
+        self.assertEqual(first.json, b"[]")
+        server._add_score_entry("Ada", 12, 4)
+        second = server._board_snapshot()
+        self.assertGreater(second.version, first.version)
+        self.assertEqual([e["name"] for e in second.entries], ["Ada"])
+        self.assertEqual(json.loads(second.json), list(second.entries))
+
+    def test_etag_matches(self):
+        self.assertTrue(server._etag_matches('"ab-3"', "ab-3"))
+        self.assertTrue(server._etag_matches('W/"x", "ab-3"', "ab-3"))
+        self.assertTrue(server._etag_matches("*", "ab-3"))
+        self.assertFalse(server._etag_matches('"ab-2"', "ab-3"))
+        self.assertFalse(server._etag_matches(None, "ab-3"))
+
+    def test_encode_json_splices_raw_values(self):
+        body = server._encode_json({"ok": True}, raw={"board": b"[1, 2]"})
+        self.assertEqual(json.loads(body), {"ok": True, "board": [1, 2]})
+        self.assertEqual(json.loads(server._encode_json({}, raw={"a": b"1"})), {"a": 1})
+
+
+class PresenceRegistryTests(unittest.TestCase):
+    def _player(self, sid, ip="1.2.3.4", client_id=None, instance_id=None):
+        return {"id": sid, "ip": ip, "clientId": client_id, "instanceId": instance_id}
+
+    def test_ip_index_follows_insert_and_delete(self):
+        registry = server.PresenceRegistry()
+        registry["a"] = self._player("a")
+        registry["b"] = self._player("b")
+        registry["c"] = self._player("c", ip="5.6.7.8")
+        self.assertEqual(registry.count_ip("1.2.3.4"), 2)
+        del registry["a"]
+        self.assertEqual(registry.count_ip("1.2.3.4"), 1)
+        registry["b"] = self._player("b", ip="5.6.7.8")
+        self.assertEqual(registry.count_ip("1.2.3.4"), 0)
+        self.assertEqual(registry.count_ip("5.6.7.8"), 2)
+
+    def test_client_index_matches_instance(self):
+        registry = server.PresenceRegistry()
+        registry["a"] = self._player("a", client_id="c1", instance_id="t1")
+        registry["b"] = self._player("b", client_id="c1")
+        registry["c"] = self._player("c", client_id="c1", instance_id="t2")
+        self.assertEqual(registry.sessions_for_client("c1", "t1"), ["a"])
+        self.assertEqual(registry.sessions_for_client("c1"), ["b"])
+        self.assertEqual(registry.sessions_for_client(" c1 ", "t2"), ["c"])
+        registry.clear()
+        self.assertEqual(registry.sessions_for_client("c1", "t1"), [])
+        self.assertEqual(len(registry), 0)
+
+    def test_pop_expired_skips_refreshed_sessions(self):
+        registry = server.PresenceRegistry()
+        registry["old"] = dict(self._player("old", client_id="c1"), ts=100.0)
+        registry["fresh"] = dict(self._player("fresh"), ts=100.0)
+        registry["fresh"] = dict(self._player("fresh"), ts=500.0)
+        expired = registry.pop_expired(200.0)
+        self.assertEqual([sid for sid, _ in expired], ["old"])
+        self.assertNotIn("old", registry)
+        self.assertIn("fresh", registry)
+        self.assertEqual(registry.sessions_for_client("c1"), [])
+        self.assertEqual(registry.pop_expired(200.0), [])
+
+    def test_reap_expired_players_records_best(self):
+        orig_players = server.PLAYERS
+        orig_leaderboard = server.LEADERBOARD
+        orig_dry_run = server.DRY_RUN
+        server.PLAYERS = server.PresenceRegistry()
+        server.LEADERBOARD = server.RankedBoard()
+        server.DRY_RUN = True
+        try:
+            now = time.time()
+            server.PLAYERS["gone"] = {
+                "id": "gone", "name": "Ada", "best": 30, "bestTime": 9,
+                "ts": now - server.EXPIRATION - 5,
+            }
+            server.PLAYERS["here"] = {"id": "here", "best": 10, "ts": now}
+            self.assertEqual(server._reap_expired_players(now), ["gone"])
+            self.assertEqual(list(server.PLAYERS.keys()), ["here"])
+            self.assertEqual(len(server.LEADERBOARD), 1)
+            self.assertEqual(server.LEADERBOARD[0]["score"], 30.0)
+        finally:
+            server.PLAYERS = orig_players
+            server.LEADERBOARD = orig_leaderboard
+            server.DRY_RUN = orig_dry_run
+
+
+class PresenceMergeTests(unittest.TestCase):
+    def _player(self, sid, ip="1.2.3.4"):
+        return {"id": sid, "ip": ip, "clientId": None, "instanceId": None}
+
+    def test_merge_keeps_newest_and_is_not_republished(self):
+        registry = server.PresenceRegistry()
+        registry.changes = {}
+        registry["a"] = dict(self._player("a"), ts=200.0)
+        registry["b"] = dict(self._player("b"), ts=100.0)
+        registry.changes.clear()
+        registry.merge({
+            "a": dict(self._player("a"), ts=150.0, x=9),
+            "b": dict(self._player("b"), ts=300.0, x=7),
+            "c": dict(self._player("c"), ts=300.0),
+        })
+        self.assertNotIn("remote", registry["a"])
+        self.assertEqual((registry["b"]["x"], registry["b"]["remote"]), (7, True))
+        self.assertEqual(registry.count_ip("1.2.3.4"), 3)
+        registry.merge({"c": None})
+        self.assertNotIn("c", registry)
+        self.assertEqual(registry.changes, {})
+        del registry["a"]
+        self.assertEqual(registry.changes, {"a": None})
+
+    def test_reaper_leaves_remote_sessions_to_their_worker(self):
+        orig = (server.PLAYERS, server.LEADERBOARD, server.DRY_RUN)
+        server.PLAYERS = server.PresenceRegistry()
+        server.LEADERBOARD = server.RankedBoard()
+        server.DRY_RUN = True
+        try:
+            old = time.time() - server.EXPIRATION - 5
+            server.PLAYERS.merge({"r": {"id": "r", "best": 30, "ts": old}})
+            self.assertEqual(server._reap_expired_players(time.time()), ["r"])
+            self.assertEqual(len(server.LEADERBOARD), 0)
+        finally:
+            server.PLAYERS, server.LEADERBOARD, server.DRY_RUN = orig
+
+
+class RankedBoardTests(unittest.TestCase):
+    def _entry(self, i, score, created=0.0):
+        return {"id": f"s-{i}", "score": score, "time": i % 7, "created": created}
+
+    def test_matches_sorted_list_with_limit(self):
+        rng = random.Random(3)
+        board = server.RankedBoard()
+        reference = []
+        for i in range(400):
+            entry = self._entry(i, rng.randint(0, 50), created=float(i))
+            board.add(entry, 25)
+            reference.append(entry)
+            reference.sort(key=server._score_sort_key, reverse=True)
+            del reference[25:]
+        self.assertEqual(list(board), reference)
+        self.assertEqual(len(board), 25)
+
+    def test_rejects_below_cutoff_and_duplicates(self):
+        board = server.RankedBoard([self._entry(i, 10 + i) for i in range(3)], limit=3)
+        self.assertFalse(board.add(self._entry(9, 5), 3))
+        self.assertFalse(board.add(self._entry(0, 99), 3))
+        self.assertTrue(board.add(self._entry(8, 50), 3))
+        self.assertEqual([e["score"] for e in board], [50, 12, 11])
+        self.assertNotIn("s-0", board)
+
+    def test_expire_follows_creation_order(self):
+        board = server.RankedBoard(self._entry(i, 100 - i, created=float(i % 4)) for i in range(8))
+        expired = board.expire(2.0)
+        self.assertEqual(sorted(e["id"] for e in expired), ["s-0", "s-1", "s-4", "s-5"])
+        self.assertEqual([e["id"] for e in board], ["s-2", "s-3", "s-6", "s-7"])
+        self.assertEqual(board.expire(2.0), [])
+        self.assertIsNone(board.remove("s-0"))
+
+
+class WindowBoardTests(unittest.TestCase):
+    def _entry(self, sid, score, created):
+        return {"id": sid, "score": score, "time": 0, "created": created}
+
+    def test_snapshot_is_cached_and_rolls_over(self):
+        day = server.WindowBoard("day", 86400.0)
+        noon = 20000 * 86400.0 + 43200
+        day.add(self._entry("a", 5, noon), noon)
+        day.add(self._entry("b", 9, noon - 86400), noon)
+        first = day.top(noon)
+        self.assertEqual([e["id"] for e in first.entries], ["a"])
+        self.assertIs(day.top(noon + 60), first)
+        day.add(self._entry("c", 7, noon + 60), noon + 60)
+        second = day.top(noon + 60)
+        self.assertEqual([e["id"] for e in second.entries], ["c", "a"])
+        rolled = day.top(noon + 86400)
+        self.assertEqual((rolled.entries, day.start), ((), 20001 * 86400.0))
+        self.assertNotEqual(rolled.tag, second.tag)
+
+    def test_week_starts_on_monday(self):
+        week = server.WindowBoard("week", 7 * 86400.0, 4 * 86400.0)
+        week.roll(1700000000.0)  # mardi 14 novembre 2023
+        self.assertEqual(time.gmtime(week.start)[:7], (2023, 11, 13, 0, 0, 0, 0))
+
+
+class BoardWriterTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = (
+            server.SCORES_FILE,
+            server.JOURNAL_FILE,
+            server.DRY_RUN,
+            server.LEADERBOARD,
+            server.BOARD_WRITER,
+            server.BOARD_WINDOWS,
+            server.STORE,
+        )
+        self._tmp = tempfile.TemporaryDirectory()
+        server.SCORES_FILE = os.path.join(self._tmp.name, "scores.json")
+        server.JOURNAL_FILE = os.path.join(self._tmp.name, "scores.jsonl")
+        server.DRY_RUN = False
+        server.LEADERBOARD = server.RankedBoard()
+        server.BOARD_WRITER = server.BoardWriter(interval=0.0)
+        server.BOARD_WINDOWS = {"day": server.WindowBoard("day", 86400.0)}
+        server.STORE = server.JsonStore()
+
+    def tearDown(self):
+        (
+            server.SCORES_FILE,
+            server.JOURNAL_FILE,
+            server.DRY_RUN,
+            server.LEADERBOARD,
+            server.BOARD_WRITER,
+            server.BOARD_WINDOWS,
+            server.STORE,
+        ) = self._orig
+        self._tmp.cleanup()
+
+    def _reload(self):
+        current = [dict(e) for e in server.LEADERBOARD]
+        server.LEADERBOARD = server.RankedBoard()
+        server.load_board()
+        return current, list(server.LEADERBOARD)
+
+    def _journal_lines(self):
+        with open(server.JOURNAL_FILE, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_flush_appends_events_and_load_replays_them(self):
+        writer = server.BOARD_WRITER
+        self.assertFalse(writer.flush())
+        for score in (3, 7, 5):
+            server._add_score_entry("Ada", score, 1)
+        self.assertEqual(writer.stats()["pending"], 3)
+        self.assertTrue(writer.flush())
+        self.assertEqual((writer.stats()["pending"], writer.appends), (0, 1))
+        self.assertEqual([e["op"] for e in self._journal_lines()], ["add"] * 3)
+        self.assertFalse(os.path.exists(server.SCORES_FILE))
+        before, after = self._reload()
+        self.assertEqual(after, before)
+        self.assertEqual(server.BOARD_WRITER.journal_events, 3)
+
+    def test_day_scores_below_cutoff_survive_restart(self):
+        saved = server.MAX_STORE
+        server.MAX_STORE = 2
+        try:
+            old = server._entry_from_raw({"name": "Old", "score": 90, "time": 1}, time.time() - 3 * 86400)
+            with server.BOARD_LOCK:
+                server.LEADERBOARD.add(old, server.MAX_STORE)
+                server.BOARD_WRITER.record({"op": "add", "entry": old})
+            for score in (50, 10):
+                server._add_score_entry("Ada", score, 1)
+            # 10 est sous la coupure du classement complet (90, 50) mais dans le top du jour
+            day = [e["score"] for e in server.BOARD_WINDOWS["day"].board]
+            self.assertEqual(day, [50, 10])
+            # rejeu du journal, puis instantané compacté
+            for step in ("journal", "snapshot"):
+                server.BOARD_WRITER.flush()
+                if step == "snapshot":
+                    self.assertTrue(server.BOARD_WRITER.compact())
+                _, after = self._reload()
+                self.assertEqual([e["score"] for e in after], [90, 50])
+                self.assertEqual([e["score"] for e in server.BOARD_WINDOWS["day"].board], day)
+        finally:
+            server.MAX_STORE = saved
+
+    def test_compaction_writes_snapshot_and_empties_journal(self):
+        writer = server.BOARD_WRITER
+        server._add_score_entry("Ada", 3, 1)
+        writer.flush()
+        server._add_score_entry("Bob", 8, 1)
+        self.assertTrue(writer.compact())
+        self.assertEqual(writer.stats()["pending"], 0)
+        self.assertEqual(self._journal_lines(), [])
+        with open(server.SCORES_FILE, encoding="utf-8") as f:
+            self.assertEqual([e["name"] for e in json.load(f)], ["Bob", "Ada"])
+        before, after = self._reload()
+        self.assertEqual(after, before)
+
+    def test_replay_survives_interrupted_compaction_and_torn_line(self):
+        ada = server._add_score_entry("Ada", 3, 1)
+        server._add_score_entry("Bob", 8, 1)
+        with server.BOARD_LOCK:
+            server.LEADERBOARD.remove(ada["id"])
+            server.BOARD_WRITER.record({"op": "evict", "ids": [ada["id"]]})
+        server._add_score_entry("Cyd", 5, 1)
+        server.BOARD_WRITER.flush()
+        # instantané écrit mais journal pas encore vidé, puis ligne coupée en plein ajout
+        with open(server.SCORES_FILE, "w", encoding="utf-8") as f:
+            json.dump(list(server.LEADERBOARD), f)
+        with open(server.JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write('{"op": "add", "entry": {"na')
+        before, after = self._reload()
+        self.assertEqual([e["name"] for e in after], ["Bob", "Cyd"])
+        self.assertEqual(after, before)
+
+    def test_reset_and_ttl_eviction_are_journaled(self):
+        now = time.time()
+        _backdate(server._add_score_entry("Ada", 3, 1), now - server.BOARD_TTL - 1)
+        server._add_score_entry("Bob", 4, 1)
+        with server.BOARD_LOCK:
+            server._prune_leaderboard(now)
+        server.BOARD_WRITER.flush()
+        self.assertEqual([e["op"] for e in self._journal_lines()], ["add", "evict", "add"])
+        before, after = self._reload()
+        self.assertEqual([e["name"] for e in after], ["Bob"])
+        with server.BOARD_LOCK:
+            server.LEADERBOARD.clear()
+            server.BOARD_WRITER.record({"op": "reset"})
+        server.BOARD_WRITER.flush()
+        self.assertEqual(self._reload()[1], [])
+
+    def test_close_compacts_pending_changes(self):
+        writer = server.BOARD_WRITER
+        writer.interval = 60.0
+        writer.last_flush = time.monotonic()
+        thread = threading.Thread(target=writer.run)
+        thread.start()
+        server._add_score_entry("Ada", 9, 1)
+        writer.close()
+        thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+        with open(server.SCORES_FILE, encoding="utf-8") as f:
+            self.assertEqual([e["score"] for e in json.load(f)], [9])
+        self.assertEqual(self._journal_lines(), [])
+
+
+class SqliteStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = (
+            server.SCORES_FILE,
+            server.JOURNAL_FILE,
+            server.DRY_RUN,
+            server.LEADERBOARD,
+            server.BOARD_WRITER,
+            server.STORE,
+            server.MAX_STORE,
+        )
+        self._tmp = tempfile.TemporaryDirectory()
+        server.SCORES_FILE = os.path.join(self._tmp.name, "scores.json")
+        server.JOURNAL_FILE = os.path.join(self._tmp.name, "scores.jsonl")
+        server.DRY_RUN = False
+        server.LEADERBOARD = server.RankedBoard()
+        server.BOARD_WRITER = server.BoardWriter(interval=0.0)
+        server.STORE = server.SqliteStore(os.path.join(self._tmp.name, "scores.db"))
+        server.MAX_STORE = 3
+
+    def tearDown(self):
+        server.STORE.close()
+        (
+            server.SCORES_FILE,
+            server.JOURNAL_FILE,
+            server.DRY_RUN,
+            server.LEADERBOARD,
+            server.BOARD_WRITER,
+            server.STORE,
+            server.MAX_STORE,
+        ) = self._orig
+        self._tmp.cleanup()
+
+    def _rows(self):
+        return server.STORE._conn().execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def test_first_load_migrates_json_board(self):
+        with open(server.SCORES_FILE, "w", encoding="utf-8") as f:
+            json.dump([{"name": "Ada", "best": 12, "bestTime": 4}, {"name": "Bob", "score": 30}], f)
+        server.load_board()
+        self.assertEqual([e["name"] for e in server.LEADERBOARD], ["Bob", "Ada"])
+        self.assertEqual(self._rows(), 2)
+        os.remove(server.SCORES_FILE)
+        server.LEADERBOARD = server.RankedBoard()
+        server.load_board()
+        self.assertEqual(len(server.LEADERBOARD), 2)
+
+    def test_keeps_scores_below_cutoff_and_refills_after_eviction(self):
+        now = time.time()
+        for score in (5, 4, 3, 2, 1):
+            server._add_score_entry("p", score, 1)
+        self.assertEqual([e["score"] for e in server.LEADERBOARD], [5, 4, 3])
+        server.BOARD_WRITER.flush()
+        self.assertEqual(self._rows(), 5)
+        _backdate(server.LEADERBOARD[0], now - server.BOARD_TTL - 1)
+        with server.BOARD_LOCK:
+            server._prune_leaderboard(now)
+        server.BOARD_WRITER.flush()
+        self.assertEqual([e["score"] for e in server.LEADERBOARD], [4, 3, 2])
+        self.assertEqual(self._rows(), 4)
+
+    def test_dry_run_without_db_serves_an_empty_board(self):
+        server.DRY_RUN = True
+        server.load_board()
+        self.assertIsInstance(server.LEADERBOARD, server.RankedBoard)
+        self.assertIsNotNone(server._add_score_entry("Ada", 5, 1))
+        with server.BOARD_LOCK:
+            server._prune_leaderboard(time.time())
+        self.assertEqual([e["name"] for e in server.LEADERBOARD], ["Ada"])
+        server.BOARD_WRITER.flush()
+        self.assertFalse(os.path.exists(server.STORE.path))
+
+    def test_dry_run_reads_existing_db_without_writing(self):
+        server._add_score_entry("Ada", 5, 1)
+        server.BOARD_WRITER.flush()
+        server.STORE.close()
+        server.DRY_RUN = True
+        server.LEADERBOARD = server.RankedBoard()
+        server.load_board()
+        self.assertEqual([e["name"] for e in server.LEADERBOARD], ["Ada"])
+        with self.assertRaises(server.sqlite3.OperationalError):
+            server.STORE._conn().execute("DELETE FROM scores")
+
+    def test_ranks_below_memory_cutoff_come_from_the_db(self):
+        for score in (50, 40, 30, 20, 10):
+            server._add_score_entry("p", score, 1)
+        server.BOARD_WRITER.flush()
+        resp = server._api_score({"name": "low", "score": 15, "time": 1})
+        self.assertEqual(json.loads(resp.body)["rank"], 5)
+        server.BOARD_WRITER.flush()
+        data = json.loads(server._api_rank("score=12&time=1").body)
+        self.assertEqual((data["rank"], data["total"]), (6, 6))
+        low = json.loads(resp.body)["id"]
+        data = json.loads(server._api_rank(f"id={low}").body)
+        self.assertEqual((data["rank"], data["total"]), (5, 6))
+        self.assertEqual(json.loads(server._api_rank("score=45").body)["rank"], 2)
+
+    def test_deep_rank_never_exceeds_total_before_the_flush(self):
+        for score in (50, 40, 30, 20, 10):
+            server._add_score_entry("p", score, 1)
+        # rien d'écrit encore (écriture différée): l'index connaît déjà les scores
+        data = json.loads(server._api_score({"name": "low", "score": 1, "time": 1}).body)
+        self.assertEqual(data["rank"], 6)
+        rank = json.loads(server._api_rank("score=10&time=1&window=day").body)
+        self.assertEqual((rank["rank"], rank["total"]), (5, 6))
+        server.BOARD_WRITER.flush()
+        rank = json.loads(server._api_rank(f"id={data['id']}").body)
+        self.assertEqual((rank["rank"], rank["total"]), (6, 6))
+        # lignes écrites par un autre processus (relève à chaud): reprises par refresh_ranks
+        conn = server.STORE._conn()
+        with conn:
+            server.STORE._insert(conn, [
+                {"id": "other", "name": "o", "color": "#fff", "score": 45, "time": 1, "created": time.time()}
+            ])
+        server.STORE.refresh_ranks()
+        rank = json.loads(server._api_rank(f"id={data['id']}").body)
+        self.assertEqual((rank["rank"], rank["total"]), (7, 7))
+
+    def test_request_threads_share_one_reader_connection(self):
+        entry = server._add_score_entry("Ada", 5, 1)
+        server.BOARD_WRITER.flush()
+        reader = server.STORE._reader
+        found = []
+        threads = [
+            threading.Thread(target=lambda: found.append(server.STORE.get(entry["id"])["name"]))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(found, ["Ada"] * 4)
+        self.assertIs(server.STORE._reader, reader)
+        self.assertIsNot(reader, server.STORE._conn())
+        server.STORE.close()
+        self.assertIsNone(server.STORE._reader)
+
+    def test_forked_worker_opens_its_own_connections(self):
+        entry = server._add_score_entry("Ada", 5, 1)
+        server.BOARD_WRITER.flush()
+        parent = (server.STORE._conn(), server.STORE._reader)
+        server.STORE.after_fork()
+        self.assertEqual(server.STORE.get(entry["id"])["name"], "Ada")
+        self.assertNotIn(server.STORE._reader, parent)
+        self.assertNotIn(server.STORE._conn(), parent)
+        # connexions du parent écartées, pas fermées
+        self.assertEqual(parent[1].execute("SELECT COUNT(*) FROM scores").fetchone()[0], 1)
+        for conn in parent:
+            conn.close()
+
+    def test_score_index_expires_by_creation_time(self):
+        index = server.ScoreIndex([(5, 1.0), (3, 2.0), (5, 3.0)])
+        index.add(7, 0.5)
+        self.assertEqual((len(index), index.better(5), index.better(4)), (4, 1, 3))
+        index.expire(1.5)
+        self.assertEqual((len(index), index.better(4)), (2, 1))
+        big = server.ScoreIndex((i % 10, float(i)) for i in range(1000))
+        big.expire(900.0)
+        self.assertEqual((len(big), big.better(8)), (100, 10))
+
+    def test_compact_deletes_expired_rows_in_batches(self):
+        old = time.time() - server.BOARD_TTL - 10
+        rows = [
+            {"id": f"s-{i}", "name": "p", "color": "#fff", "score": i + 1, "time": 1, "created": old}
+            for i in range(7)
+        ]
+        conn = server.STORE._conn()
+        with conn:
+            server.STORE._insert(conn, rows)
+        server._add_score_entry("new", 1, 1)
+        server.BOARD_WRITER.flush()
+        saved = server.SQLITE_BATCH
+        server.SQLITE_BATCH = 2
+        try:
+            self.assertTrue(server.BOARD_WRITER.compact())
+        finally:
+            server.SQLITE_BATCH = saved
+        self.assertEqual([r["name"] for r in server.STORE.top(10)], ["new"])
+
+
+class AccessLogTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "access.log")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _open(self, **kwargs):
+        log = server.AccessLog(self.path, **kwargs)
+        self.addCleanup(lambda: [h.close() for h in log._logger.handlers])
+        return log
+
+    def _lines(self, path=None):
+        with open(path or self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_sampling_keeps_errors_and_other_routes(self):
+        log = self._open(sample_state=0.0)
+        log.log("POST", "/api/state", 200, 1.5, 120, 300, "1.2.3.4")
+        log.log("POST", "/api/state", 429, 0.2, 120, 40, "1.2.3.4")
+        log.log("POST", "/api/score", 200, 2.0, 80, 500, "1.2.3.4")
+        self.assertEqual(log.flush(), 2)
+        lines = self._lines()
+        self.assertEqual([(l["path"], l["status"]) for l in lines], [("/api/state", 429), ("/api/score", 200)])
+        self.assertEqual(lines[0]["ip"], "1.2.3.4")
+        self.assertEqual(log.flush(), 0)
+
+    def test_batches_rotate_file(self):
+        log = self._open(max_bytes=200, backups=2)
+        for batch in range(3):
+            for _ in range(3):
+                log.log("GET", "/api/board", 200, 0.5, 0, 900, "::1")
+            log.flush()
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertEqual(len(self._lines()), 3)
+        self.assertEqual(log.written, 9)
+
+    def test_each_worker_gets_its_own_file(self):
+        self.assertEqual(server._worker_log_target(self.path, 2), os.path.join(self._tmp.name, "access-w2.log"))
+        self.assertEqual(server._worker_log_target("-", 2), "-")
+        self.assertEqual(server._worker_log_target("off", 2), "off")
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_bucket_refills_and_rejects(self):
+        limiter = server.RateLimiter(2, 2, max_ips=100, shards=4)
+        self.assertTrue(limiter.consume("a", 100.0))
+        self.assertTrue(limiter.consume("a", 100.0))
+        self.assertFalse(limiter.consume("a", 100.0))
+        self.assertTrue(limiter.consume("b", 100.0))
+        self.assertTrue(limiter.consume("a", 100.5))
+        self.assertEqual(limiter.stats()["rejected"], 1)
+
+    def test_idle_and_overflow_buckets_are_evicted(self):
+        limiter = server.RateLimiter(1, 2, max_ips=4, shards=1)
+        for i in range(4):
+            limiter.consume(f"ip-{i}", 100.0 + i / 10)
+        # plein, aucun seau inactif: le moins récent est évincé pour faire de la place
+        limiter.consume("ip-4", 101.0)
+        self.assertEqual(len(limiter), 4)
+        self.assertEqual(limiter.stats()["evicted"], 1)
+        # seaux pleins (inactifs depuis burst / rps) oubliés par le balayage
+        self.assertEqual(limiter.sweep(102.25), 2)
+        self.assertEqual(len(limiter), 2)
+
+    def test_routes_have_separate_budgets(self):
+        orig = server.RATE_LIMITERS
+        server.RATE_LIMITERS = {
+            "state": server.RateLimiter(1, 1),
+            "score": server.RateLimiter(1, 1),
+        }
+        try:
+            self.assertTrue(server._consume_rate_limit("ip", 10.0, "/api/state"))
+            self.assertFalse(server._consume_rate_limit("ip", 10.0, "/api/state"))
+            self.assertTrue(server._consume_rate_limit("ip", 10.0, "/api/score"))
+            # pas de budget "default": routes non limitées
+            self.assertTrue(server._consume_rate_limit("ip", 10.0, "/api/board"))
+        finally:
+            server.RATE_LIMITERS = orig
+
+    def test_snapshot_keeps_only_drained_buckets(self):
+        limiter = server.RateLimiter(1, 2, max_ips=100, shards=4)
+        limiter.consume("busy", 10.0)
+        limiter.consume("busy", 10.0)
+        limiter.consume("idle", 5.0)
+        rows = limiter.snapshot(10.5)
+        self.assertEqual(rows, [["busy", 0.5]])
+        copy = server.RateLimiter(1, 2, max_ips=100, shards=4)
+        copy.restore(rows, 10.5)
+        self.assertFalse(copy.consume("busy", 10.5))
+        self.assertTrue(copy.consume("busy", 11.0))
+
+
+class SpatialGridTests(unittest.TestCase):
+    def _entries(self, count, spread, seed=7):
+        rng = random.Random(seed)
+        return [
+            server.PeerEntry(f"p{i}", float(i), rng.uniform(0, spread), rng.uniform(0, spread), b"{}")
+            for i in range(count)
+        ]
+
+    def _brute(self, entries, x, y, k, radius=0.0):
+        scored = sorted(((e.x - x) ** 2 + (e.y - y) ** 2, e.sid) for e in entries)
+        if radius > 0:
+            scored = [item for item in scored if item[0] <= radius * radius]
+        return [sid for _, sid in scored[:k]]
+
+    def test_nearest_matches_brute_force(self):
+        entries = self._entries(500, 3000)
+        grid = server.SpatialGrid(entries, 256)
+        for x, y in ((0, 0), (1500, 1500), (2999, 10), (-400, 5000)):
+            got = [e.sid for e in grid.nearest(x, y, 5)]
+            self.assertEqual(got, self._brute(entries, x, y, 5))
+
+    def test_nearest_honours_radius_and_filter(self):
+        entries = self._entries(200, 2000)
+        grid = server.SpatialGrid(entries, 128)
+        got = [e.sid for e in grid.nearest(1000, 1000, 50, radius=150)]
+        self.assertEqual(got, self._brute(entries, 1000, 1000, 50, radius=150))
+        odd = grid.nearest(1000, 1000, 3, accept=lambda e: e.ts % 2 == 1)
+        self.assertTrue(all(e.ts % 2 == 1 for e in odd))
+        self.assertEqual(len(odd), 3)
+
+
+class ApiCoreTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = (
+            server.PLAYERS,
+            server.LEADERBOARD,
+            server.DRY_RUN,
+            server.RATE_LIMITERS,
+            server.MAX_SESSIONS_PER_IP,
+            server.BROADCASTER,
+            server.BOARD_WINDOWS,
+        )
+        server.PLAYERS = server.PresenceRegistry()
+        server.LEADERBOARD = server.RankedBoard()
+        server.DRY_RUN = True
+        server.RATE_LIMITERS = {}
+        server.MAX_SESSIONS_PER_IP = 0
+        # intervalle nul: chaque /api/state voit un instantané à jour
+        server.BROADCASTER = server.PresenceBroadcaster(interval=0.0)
+        server.BOARD_WINDOWS = {
+            "day": server.WindowBoard("day", 86400.0),
+            "week": server.WindowBoard("week", 7 * 86400.0, 4 * 86400.0),
+        }
+        server._board_changed()
+
+    def tearDown(self):
+        (
+            server.PLAYERS,
+            server.LEADERBOARD,
+            server.DRY_RUN,
+            server.RATE_LIMITERS,
+            server.MAX_SESSIONS_PER_IP,
+            server.BROADCASTER,
+            server.BOARD_WINDOWS,
+        ) = self._orig
+        server._board_changed()
+
+    def _post(self, path, payload):
+        body = json.dumps(payload).encode()
+        return server.handle_api("POST", path, "", {}, body, "10.0.0.1")
+
+    def test_state_returns_peers_and_board(self):
+        self._post("/api/state", {"sessionId": "a", "x": 3})
+        resp = self._post("/api/state", {"sessionId": "b"})
+        self.assertEqual(resp.status, 200)
+        data = json.loads(resp.body)
+        self.assertEqual([p["id"] for p in data["players"]], ["a"])
+        self.assertEqual(data["board"], [])
+        again = self._post("/api/state", {"sessionId": "b", "boardVersion": data["boardVersion"]})
+        self.assertNotIn("board", json.loads(again.body))
+
+    def test_non_finite_scores_do_not_stall_peers(self):
+        body = b'{"sessionId": "x", "score": 1e999, "time": NaN, "best": -1e999, "bestTime": NaN}'
+        self.assertEqual(server.handle_api("POST", "/api/state", "", {}, body, "10.0.0.1").status, 200)
+        score = server.handle_api("POST", "/api/score", "", {}, b'{"name": "X", "score": 1e999}', "10.0.0.1")
+        self.assertEqual(score.status, 400)
+        # joueur non encodable inséré directement: le tick l'omet sans bloquer les autres
+        server.PLAYERS["bad"] = {"id": "bad", "x": float("inf"), "y": 0.0, "ts": time.time()}
+        for peer_format in (1, 2):
+            resp = self._post("/api/state", {"sessionId": "b", "peerFormat": peer_format})
+            self.assertEqual(resp.status, 200)
+            players = json.loads(resp.body)["players"]
+            self.assertEqual(len(players), 1)
+        self.assertEqual(players[0][:1] + players[0][5:7], ["x", 0, 0])
+
+    def test_hot_restart_snapshot_restores_sessions_and_limits(self):
+        self._post("/api/state", {"sessionId": "a", "x": 3, "name": "Ada"})
+        server.RATE_LIMITERS = {"state": server.RateLimiter(1, 1)}
+        server._consume_rate_limit("10.0.0.9", time.time(), "/api/state")
+        blob = server._encode_snapshot(time.time())
+        server.PLAYERS = server.PresenceRegistry()
+        server.RATE_LIMITERS = {"state": server.RateLimiter(1, 1)}
+        self.assertEqual(server._restore_snapshot(blob), 1)
+        self.assertEqual(server.PLAYERS["a"]["name"], "Ada")
+        self.assertEqual(server.PLAYERS.count_ip("10.0.0.1"), 1)
+        self.assertFalse(server._consume_rate_limit("10.0.0.9", time.time(), "/api/state"))
+        self.assertEqual(server._restore_snapshot(b"not gzip"), 0)
+
+    def test_hot_restart_snapshot_merges_into_a_serving_process(self):
+        self._post("/api/state", {"sessionId": "a", "name": "Ada"})
+        self._post("/api/state", {"sessionId": "b", "name": "Bob"})
+        entry = server._add_score_entry("Ada", 42, 10)
+        blob = server._encode_snapshot(time.time())
+        # nouveau processus: il sert déjà quand l'instantané arrive
+        server.PLAYERS = server.PresenceRegistry()
+        server.LEADERBOARD = server.RankedBoard()
+        for window in server.BOARD_WINDOWS.values():
+            window.clear()
+        self._post("/api/state", {"sessionId": "a", "x": 7, "name": "Ada2"})
+        self.assertEqual(server._restore_snapshot(blob), 2)
+        # la session revenue entre-temps garde son état plus récent
+        self.assertEqual((server.PLAYERS["a"]["x"], server.PLAYERS["a"]["name"]), (7, "Ada2"))
+        self.assertEqual(server.PLAYERS["b"]["name"], "Bob")
+        self.assertEqual([e["id"] for e in server.LEADERBOARD], [entry["id"]])
+        self.assertEqual([e["id"] for e in server.BOARD_WINDOWS["day"].board], [entry["id"]])
+
+    def test_state_cursor_keeps_updates_made_after_the_tick(self):
+        server.BROADCASTER = server.PresenceBroadcaster(interval=60.0)
+        self._post("/api/state", {"sessionId": "a"})
+        self._post("/api/state", {"sessionId": "b", "x": 5})
+        # tick pas encore reconstruit: b n'y est pas, le curseur ne doit pas le dépasser
+        a2 = json.loads(self._post("/api/state", {"sessionId": "a"}).body)
+        self.assertEqual(a2["players"], [])
+        server.BROADCASTER.tick()
+        a3 = json.loads(self._post("/api/state", {"sessionId": "a", "since": a2["serverTime"]}).body)
+        self.assertEqual([p["id"] for p in a3["players"]], ["b"])
+
+    def test_errors_are_reported_without_body(self):
+        self.assertEqual(self._post("/api/state", {}).error, "missing sessionId")
+        bad = server.handle_api("POST", "/api/state", "", {}, b"[1]", "10.0.0.1")
+        self.assertEqual((bad.status, bad.error), (400, "bad json"))
+        self.assertEqual(server._api_content_length("-1")[1].status, 400)
+        self.assertEqual(server._api_content_length(str(server.MAX_BODY_BYTES + 1))[1].status, 413)
+
+    def _get(self, path, query="", headers=None):
+        return server.handle_api("GET", path, query, headers or {}, b"", "10.0.0.1")
+
+    def test_score_reply_includes_rank(self):
+        for score in (50, 30, 10):
+            self._post("/api/score", {"name": "p", "score": score})
+        data = json.loads(self._post("/api/score", {"name": "me", "score": 20}).body)
+        self.assertEqual(data["rank"], 3)
+        self.assertEqual(json.loads(self._get("/api/rank", f"id={data['id']}").body)["rank"], 3)
+        self.assertNotIn("outsideTop", data)
+        saved = server.MAX_STORE
+        server.MAX_STORE = 4
+        try:
+            low = json.loads(self._post("/api/score", {"name": "low", "score": 1}).body)
+        finally:
+            server.MAX_STORE = saved
+        self.assertEqual((low["rank"], low["outsideTop"]), (None, 4))
+
+    def test_board_pages_and_rank_by_score(self):
+        for score in range(1, 31):
+            self._post("/api/score", {"name": f"p{score}", "score": score})
+        resp = self._get("/api/board", "offset=12&limit=5")
+        data = json.loads(resp.body)
+        self.assertEqual([e["score"] for e in data["board"]], [18, 17, 16, 15, 14])
+        self.assertEqual((data["offset"], data["limit"], data["total"]), (12, 5, 30))
+        etag = dict(resp.headers)["ETag"]
+        again = self._get("/api/board", "offset=12&limit=5", {"If-None-Match": etag})
+        self.assertEqual(again.status, 304)
+        capped = json.loads(self._get("/api/board", "limit=1000").body)
+        self.assertEqual((capped["limit"], len(capped["board"])), (server.MAX_PAGE, 30))
+        rank = json.loads(self._get("/api/rank", "score=25.5").body)
+        self.assertEqual((rank["rank"], rank["total"]), (6, 30))
+        self.assertEqual(self._get("/api/rank", "id=nope").status, 404)
+        self.assertEqual(self._get("/api/rank").status, 400)
+
+    def test_board_window_only_counts_recent_scores(self):
+        old = {"id": "old", "name": "Old", "color": "#fff", "score": 99.0, "time": 1.0,
+               "created": time.time() - 8 * 86400}
+        with server.BOARD_LOCK:
+            server.LEADERBOARD.add(old)
+            server._board_changed()
+        self._post("/api/score", {"name": "New", "score": 10})
+        day = json.loads(self._get("/api/board", "window=day").body)
+        self.assertEqual(([e["name"] for e in day["board"]], day["window"]), (["New"], "day"))
+        everything = json.loads(self._get("/api/board").body)
+        self.assertEqual([e["name"] for e in everything["board"]], ["Old", "New"])
+        self.assertEqual(json.loads(self._get("/api/rank", "score=50&window=week").body)["rank"], 1)
+        self.assertEqual(self._get("/api/board", "window=year").status, 400)
+
+    def test_worker_board_events_apply_once(self):
+        entry = {"id": "w-1", "name": "Ada", "score": 50, "time": 3, "created": time.time()}
+        events = [{"op": "add", "entry": entry}]
+        server._apply_board_events(events, time.time())
+        server._apply_board_events(events, time.time())
+        self.assertEqual([e["id"] for e in server.LEADERBOARD], ["w-1"])
+        self.assertEqual(len(server.BOARD_WINDOWS["day"].board), 1)
+        server._apply_board_events([{"op": "evict", "ids": ["w-1"]}], time.time())
+        self.assertEqual(len(server.LEADERBOARD), 0)
+        self.assertEqual(len(server.BOARD_WINDOWS["week"].board), 0)
+
+    def test_state_sheds_board_then_peers_then_heartbeats(self):
+        self._post("/api/state", {"sessionId": "a"})
+        server._add_score_entry("Ada", 10, 1)
+        orig = server.LOAD
+        self.addCleanup(setattr, server, "LOAD", orig)
+        server.LOAD = server.LoadMonitor()
+        data = json.loads(self._post("/api/state", {"sessionId": "b"}).body)
+        self.assertEqual(data["syncIntervalMs"], server.SYNC_INTERVAL_MS)
+        self.assertIn("board", data)
+        server.LOAD.latency = 1.5 * server.LOAD_SHED_LATENCY_MS / 1000
+        data = json.loads(self._post("/api/state", {"sessionId": "b"}).body)
+        self.assertEqual(data["syncIntervalMs"], 2 * server.SYNC_INTERVAL_MS)
+        self.assertEqual(([p["id"] for p in data["players"]], "board" in data), (["a"], False))
+        server.LOAD.latency = 3 * server.LOAD_SHED_LATENCY_MS / 1000
+        data = json.loads(self._post("/api/state", {"sessionId": "b"}).body)
+        self.assertNotIn("players", data)
+        self.assertEqual(server.LOAD.shed["board"], 1)
+        server.LOAD.latency = 100 * server.LOAD_SHED_LATENCY_MS / 1000
+        statuses = {self._post("/api/state", {"sessionId": "b"}).status for _ in range(40)}
+        self.assertEqual(statuses, {200, 503})
+
+    def test_board_not_modified(self):
+        first = server.handle_api("GET", "/api/board", "", {}, b"", "10.0.0.1")
+        etag = dict(first.headers)["ETag"]
+        second = server.handle_api("GET", "/api/board", "", {"If-None-Match": etag}, b"", "10.0.0.1")
+        self.assertEqual((second.status, second.body), (304, b""))
+        # le corps mis en cache sous cet ETag ne porte pas d'heure qui vieillirait
+        third = server.handle_api("GET", "/api/board", "", {}, b"", "10.0.0.1")
+        self.assertEqual(third.body, first.body)
+        self.assertNotIn("serverTime", json.loads(first.body))
+
+    def test_state_returns_nearest_peers_up_to_max_peers(self):
+        for i in range(6):
+            self._post("/api/state", {"sessionId": f"p{i}", "x": i * 100, "y": 0})
+        resp = self._post("/api/state", {"sessionId": "me", "x": 520, "y": 0, "maxPeers": 2})
+        self.assertEqual([p["id"] for p in json.loads(resp.body)["players"]], ["p5", "p4"])
+
+    def test_compact_peer_format_drops_private_fields(self):
+        self._post("/api/state", {"sessionId": "a", "x": 12.6, "y": 4.2, "name": "Ann"})
+        full = json.loads(self._post("/api/state", {"sessionId": "b"}).body)
+        self.assertEqual(full["peerFormat"], server.PEER_FORMAT_OBJECT)
+        self.assertNotIn("ip", full["players"][0])
+        self.assertNotIn("clientId", full["players"][0])
+        resp = self._post("/api/state", {"sessionId": "b", "peerFormat": 2})
+        data = json.loads(resp.body)
+        self.assertEqual(data["peerFormat"], server.PEER_FORMAT_COMPACT)
+        peer = dict(zip(server.PEER_FIELDS, data["players"][0]))
+        self.assertEqual((peer["id"], peer["x"], peer["y"]), ("a", 13, 4))
+        self.assertEqual(len(data["players"][0]), len(server.PEER_FIELDS))
+
+    def test_stats_require_admin_token_and_report_locks(self):
+        saved = server.ADMIN_TOKEN
+        server.ADMIN_TOKEN = "secret"
+        try:
+            denied = server.handle_api("GET", "/api/stats", "", {}, b"", "10.0.0.1")
+            self.assertEqual(denied.status, 403)
+            self._post("/api/state", {"sessionId": "a"})
+            resp = server.handle_api(
+                "GET", "/api/stats", "", {"X-Admin-Token": "secret"}, b"", "10.0.0.1"
+            )
+        finally:
+            server.ADMIN_TOKEN = saved
+        data = json.loads(resp.body)
+        self.assertEqual(data["players"], 1)
+        self.assertEqual(set(data["locks"]), {"presence", "board", "save"})
+        self.assertGreater(data["locks"]["presence"]["acquisitions"], 0)
+
+    def test_metrics_expose_request_histograms_and_gauges(self):
+        saved = (server.ADMIN_TOKEN, server.METRICS)
+        server.ADMIN_TOKEN = "secret"
+        server.METRICS = server.Metrics()
+        try:
+            self.assertEqual(self._get("/api/metrics").status, 403)
+            server.METRICS.observe("POST", "/api/state", 200, 0.003, 40, 120)
+            server.METRICS.observe("POST", "/api/state", 200, 0.2, 40, 80)
+            resp = self._get("/api/metrics", headers={"Authorization": "Bearer secret"})
+        finally:
+            server.ADMIN_TOKEN, server.METRICS = saved
+        self.assertEqual(resp.status, 200)
+        self.assertTrue(dict(resp.headers)["Content-Type"].startswith("text/plain"))
+        text = resp.body.decode()
+        self.assertIn('ether_http_requests_total{method="POST",route="/api/state",status="200"} 2', text)
+        self.assertIn('ether_http_request_duration_seconds_bucket{route="/api/state",le="0.005"} 1', text)
+        self.assertIn('ether_http_request_duration_seconds_bucket{route="/api/state",le="+Inf"} 2', text)
+        self.assertIn('ether_http_response_bytes_total{route="/api/state"} 200', text)
+        self.assertIn('ether_lock_acquisitions_total{lock="presence"}', text)
+        self.assertIn("ether_players 0", text)
+        self.assertIn("ether_persist_pending_events", text)
+
+    def test_score_does_not_wait_for_presence_lock(self):
+        with server.PRESENCE_LOCK:
+            done = threading.Event()
+            worker = threading.Thread(
+                target=lambda: (server._add_score_entry("Ann", 5, 1), done.set())
+            )
+            worker.start()
+            self.assertTrue(done.wait(2.0))
+            worker.join()
+        self.assertEqual(server.LEADERBOARD[0]["score"], 5)
+
+    def test_score_and_reaper_record_a_game_once(self):
+        server.PLAYERS["s"] = {"id": "s", "name": "Ada", "best": 30, "bestTime": 9, "ts": time.time()}
+        add = server._add_score_entry
+        reaped = []
+
+        def add_after_reap(*args, **kwargs):
+            # le reaper passe entre la réservation de /api/score et son ajout
+            if not reaped:
+                reaped.extend(server._reap_expired_players(time.time() + server.EXPIRATION + 5))
+            return add(*args, **kwargs)
+
+        server._add_score_entry = add_after_reap
+        try:
+            resp = self._post("/api/score", {"sessionId": "s", "name": "Ada", "score": 30, "time": 9})
+        finally:
+            server._add_score_entry = add
+        self.assertEqual((resp.status, reaped), (200, ["s"]))
+        self.assertEqual(len(server.LEADERBOARD), 1)
+
+    def test_stream_flag_skips_peers_and_board(self):
+        resp = self._post("/api/state", {"sessionId": "a", "stream": 1})
+        self.assertEqual(set(json.loads(resp.body)), {"ok", "syncIntervalMs", "serverTime"})
+        self.assertIn("a", server.PLAYERS)
+
+    def test_broadcaster_sends_snapshot_then_deltas(self):
+        broadcaster = server.PresenceBroadcaster()
+        self._post("/api/state", {"sessionId": "a"})
+        self._post("/api/state", {"sessionId": "b"})
+        sub = server.StreamSubscriber("b")
+        first = server._stream_events(sub, broadcaster.tick())
+        self.assertIn(b"event: snapshot", first)
+        self.assertIn(b"event: board", first)
+        self.assertNotIn(b'"id": "b"', first)
+        self.assertEqual(server._stream_events(sub, broadcaster.tick()), b"")
+        del server.PLAYERS["a"]
+        delta = server._stream_events(sub, broadcaster.tick())
+        self.assertTrue(delta.startswith(b"event: presence"))
+        data = json.loads(delta.split(b"data: ", 1)[1])
+        self.assertEqual((data["players"], data["removed"]), ([], ["a"]))
+
+    def test_stream_sends_only_nearest_peers(self):
+        broadcaster = server.PresenceBroadcaster()
+        for i in range(5):
+            self._post("/api/state", {"sessionId": f"p{i}", "x": i * 100, "y": 0})
+        self._post("/api/state", {"sessionId": "me", "x": 0, "y": 0, "stream": 1})
+        sub = server.StreamSubscriber("me", max_peers=2)
+        first = server._stream_events(sub, broadcaster.tick())
+        data = json.loads(first.split(b"data: ", 1)[1].split(b"\n", 1)[0])
+        self.assertEqual([p["id"] for p in data["players"]], ["p0", "p1"])
+        # un pair lointain qui bouge n'est pas envoyé
+        self._post("/api/state", {"sessionId": "p4", "x": 401, "y": 0})
+        self.assertEqual(server._stream_events(sub, broadcaster.tick()), b"")
+        # on se déplace: p3/p4 entrent dans le voisinage, p0/p1 en sortent
+        self._post("/api/state", {"sessionId": "me", "x": 400, "y": 0, "stream": 1})
+        delta = json.loads(server._stream_events(sub, broadcaster.tick()).split(b"data: ", 1)[1])
+        self.assertEqual(sorted(p["id"] for p in delta["players"]), ["p3", "p4"])
+        self.assertEqual(sorted(delta["removed"]), ["p0", "p1"])
+
+    def test_fresh_tick_is_shared_within_interval(self):
+        broadcaster = server.PresenceBroadcaster(interval=10.0)
+        self._post("/api/state", {"sessionId": "a"})
+        first = broadcaster.fresh(1000.0)
+        self.assertEqual([e.sid for e in first.players], ["a"])
+        self._post("/api/state", {"sessionId": "b"})
+        self.assertIs(broadcaster.fresh(1005.0), first)
+        second = broadcaster.fresh(1010.0)
+        self.assertEqual(sorted(e.sid for e in second.players), ["a", "b"])
+        self.assertEqual([sid for sid, _ in second.changed], ["b"])
+
+    def test_static_file_path_stays_in_base_dir(self):
+        self.assertTrue(server._static_file_path("/").endswith("index.html"))
+        self.assertIsNone(server._static_file_path("/../../etc/passwd"))
+        self.assertIsNone(server._static_file_path("/missing.js"))
+
+
+class StaticCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = (server.BASE_DIR, server.STATIC_CACHE)
+        self._tmp = tempfile.TemporaryDirectory()
+        server.BASE_DIR = self._tmp.name
+        server.STATIC_CACHE = server.StaticCache()
+        self.page = os.path.join(self._tmp.name, "index.html")
+        with open(self.page, "w", encoding="utf-8") as f:
+            f.write("<p>relay</p>" * 200)
+
+    def tearDown(self):
+        server.BASE_DIR, server.STATIC_CACHE = self._orig
+        self._tmp.cleanup()
+
+    def test_gzip_variant_etag_and_not_modified(self):
+        plain = server._static_response("/", {})
+        zipped = server._static_response("/index.html", {"Accept-Encoding": "br, gzip"})
+        self.assertEqual(server.STATIC_CACHE.loads, 1)
+        self.assertEqual(dict(zipped.headers)["Content-Encoding"], "gzip")
+        self.assertLess(len(zipped.body), len(plain.body))
+        self.assertNotEqual(dict(plain.headers)["ETag"], dict(zipped.headers)["ETag"])
+        again = server._static_response("/./index.html", {"If-None-Match": dict(plain.headers)["ETag"]})
+        self.assertEqual((again.status, again.body), (304, b""))
+        refused = server._static_response("/", {"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("Content-Encoding", dict(refused.headers))
+        self.assertIsNone(server._static_response("/missing.js", {}))
+
+    def test_refresh_reloads_changed_files(self):
+        before = server._static_response("/", {})
+        with open(self.page, "w", encoding="utf-8") as f:
+            f.write("<p>v2</p>")
+        os.utime(self.page, ns=(0, 10**9))
+        self.assertEqual(server.STATIC_CACHE.refresh(), 1)
+        after = server._static_response("/", {})
+        self.assertEqual(after.body, b"<p>v2</p>")
+        self.assertNotEqual(dict(before.headers)["ETag"], dict(after.headers)["ETag"])
+        os.remove(self.page)
+        server.STATIC_CACHE.refresh()
+        self.assertIsNone(server._static_response("/", {}))
+
+
+class EngineSocketTests:
+    """
+    Vérifications communes aux deux moteurs, sur de vraies sockets: chaque
+    sous-classe démarre son serveur dans `_start_engine` et renvoie le port.
+    """
+
+    def setUp(self):
+        self._orig = (
+            server.KEEP_ALIVE,
+            server.KEEP_ALIVE_TIMEOUT,
+            server.MAX_KEEP_ALIVE_CONNECTIONS,
+            server.Handler.protocol_version,
+            server.BASE_DIR,
+            server.STATIC_CACHE,
+            server.PLAYERS,
+            server.DRY_RUN,
+            server.RATE_LIMITERS,
+            server.BROADCASTER,
+        )
+        server.KEEP_ALIVE = True
+        server.KEEP_ALIVE_TIMEOUT = 0.2
+        server.Handler.protocol_version = "HTTP/1.1"
+        self._tmp = tempfile.TemporaryDirectory()
+        server.BASE_DIR = self._tmp.name
+        server.STATIC_CACHE = server.StaticCache()
+        with open(os.path.join(self._tmp.name, "index.html"), "w", encoding="utf-8") as f:
+            f.write("<p>relay</p>" * 200)
+        server.PLAYERS = server.PresenceRegistry()
+        server.DRY_RUN = True
+        server.RATE_LIMITERS = {}
+        server.BROADCASTER = server.PresenceBroadcaster(interval=0.0)
+        self.port = self._start_engine()
+
+    def tearDown(self):
+        self._stop_engine()
+        (
+            server.KEEP_ALIVE,
+            server.KEEP_ALIVE_TIMEOUT,
+            server.MAX_KEEP_ALIVE_CONNECTIONS,
+            server.Handler.protocol_version,
+            server.BASE_DIR,
+            server.STATIC_CACHE,
+            server.PLAYERS,
+            server.DRY_RUN,
+            server.RATE_LIMITERS,
+            server.BROADCASTER,
+        ) = self._orig
+        self._tmp.cleanup()
+
+    def _connect(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        self.addCleanup(conn.close)
+        return conn
+
+    def _get(self, conn, path="/api/board", headers=None):
+        conn.request("GET", path, headers=headers or {})
+        resp = conn.getresponse()
+        resp.read()
+        return resp
+
+    def _raw(self, data, until_close=True):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(data)
+        out = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return out
+            out += chunk
+            if not until_close and b"\r\n\r\n" in out:
+                return out
+
+    def test_keep_alive_headers_and_connection_reuse(self):
+        conn = self._connect()
+        first = self._get(conn)
+        self.assertEqual(first.status, 200)
+        self.assertEqual(first.getheader("Connection"), "keep-alive")
+        remaining = server.KEEP_ALIVE_MAX_REQUESTS - 1
+        self.assertEqual(first.getheader("Keep-Alive"), self._keep_alive_header(remaining))
+        sock = conn.sock
+        second = self._get(conn)
+        self.assertIs(conn.sock, sock)
+        self.assertEqual(second.getheader("Keep-Alive"), self._keep_alive_header(remaining - 1))
+
+    def test_request_after_keep_alive_wait_gets_idle_timeout(self):
+        conn = self._connect()
+        self._get(conn)
+        # ligne de requête à temps, en-têtes après KEEP_ALIVE_TIMEOUT: la requête aboutit
+        conn.sock.sendall(b"GET /api/board HTTP/1.1\r\n")
+        time.sleep(0.4)
+        conn.sock.sendall(b"Host: 127.0.0.1\r\n\r\n")
+        self.assertTrue(conn.sock.recv(64).startswith(b"HTTP/1.1 200"))
+
+    def test_idle_keep_alive_connection_is_closed(self):
+        conn = self._connect()
+        self._get(conn)
+        conn.sock.settimeout(2.0)
+        self.assertEqual(conn.sock.recv(64), b"")
+
+    def test_connection_cap_answers_with_close(self):
+        server.MAX_KEEP_ALIVE_CONNECTIONS = 1
+        kept = self._connect()
+        self.assertEqual(self._get(kept).getheader("Connection"), "keep-alive")
+        capped = self._connect()
+        resp = self._get(capped)
+        self.assertEqual((resp.status, resp.getheader("Connection")), (200, "close"))
+        self.assertIsNone(capped.sock)
+
+    def test_header_parsing(self):
+        out = self._raw(b"GET /api/board HTTP/1.1\r\nHost: x\r\nconnection: Close\r\n\r\n")
+        self.assertTrue(out.startswith(b"HTTP/1.1 200"))
+        self.assertIn(b"\r\nConnection: close\r\n", out)
+        out = self._raw(b"GET /api/board HTTP/1.0\r\n\r\n")
+        self.assertIn(b"\r\nConnection: close\r\n", out)
+        out = self._raw(b"GET /api/board HTTP/1.0\r\nConnection: keep-alive\r\n\r\n", False)
+        self.assertIn(b"\r\nConnection: keep-alive\r\n", out)
+
+    def test_bad_request_line_gets_an_error_page(self):
+        out = self._raw(b"GET / HTTP/1.1 extra\r\n\r\n")
+        # le Handler répond en HTTP/0.9 (sans en-têtes) avant d'avoir lu la version
+        self.assertIn(b"Error code: 400", out)
+
+    def test_error_closes_the_connection(self):
+        conn = self._connect()
+        conn.request("GET", "/missing.js")
+        resp = conn.getresponse()
+        body = resp.read()
+        self.assertEqual((resp.status, resp.getheader("Connection")), (404, "close"))
+        self.assertTrue(resp.getheader("Content-Type").startswith("text/html"))
+        self.assertIn(b"Error code: 404", body)
+        self.assertIsNone(conn.sock)
+
+    def test_static_etag_and_not_modified_on_one_connection(self):
+        conn = self._connect()
+        first = self._get(conn, "/", {"Accept-Encoding": "gzip"})
+        self.assertEqual(first.status, 200)
+        self.assertEqual(first.getheader("Content-Encoding"), "gzip")
+        etag = first.getheader("ETag")
+        self.assertTrue(etag)
+        sock = conn.sock
+        again = self._get(conn, "/", {"Accept-Encoding": "gzip", "If-None-Match": etag})
+        self.assertEqual((again.status, again.getheader("Connection")), (304, "keep-alive"))
+        self.assertIs(conn.sock, sock)
+
+    def test_oversized_body_is_drained_before_413(self):
+        size = server.MAX_BODY_BYTES + 4096
+        head = f"POST /api/state HTTP/1.1\r\nHost: x\r\nContent-Length: {size}\r\n\r\n"
+        # corps complet lu par le serveur: fermeture propre (FIN), pas de RST
+        out = self._raw(head.encode() + b"x" * size)
+        self.assertTrue(out.startswith(b"HTTP/1.1 413"))
+        self.assertIn(b"\r\nConnection: close\r\n", out)
+
+    def test_stream_sends_snapshot_with_peers(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(b"GET /api/stream?sessionId=me HTTP/1.1\r\nHost: x\r\n\r\n")
+        out = b""
+        while b"retry: 2000" not in out:
+            out += sock.recv(4096)
+        self.assertTrue(out.startswith(b"HTTP/1.1 200"))
+        self.assertIn(b"Content-Type: text/event-stream", out)
+        # intervalle nul: chaque /api/state publie un tick jusqu'à ce que le flux le voie
+        sock.settimeout(0.1)
+        deadline = time.monotonic() + 5
+        while b'"peer"' not in out and time.monotonic() < deadline:
+            body = json.dumps({"sessionId": "peer", "x": 0, "y": 0}).encode()
+            server.handle_api("POST", "/api/state", "", {}, body, "10.0.0.1")
+            try:
+                out += sock.recv(65536)
+            except socket.timeout:
+                pass
+        self.assertIn(b"event: snapshot", out)
+        self.assertIn(b'"peer"', out)
+
+
+class HandlerEngineTests(EngineSocketTests, unittest.TestCase):
+    def _start_engine(self):
+        handler = functools.partial(server.Handler, directory=self._tmp.name)
+        self.srv = server.Server(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self.srv.serve_forever, daemon=True)
+        self._thread.start()
+        return self.srv.server_address[1]
+
+    def _stop_engine(self):
+        self.srv.shutdown()
+        self.srv.server_close()
+        self._thread.join(timeout=5)
+
+    def _keep_alive_header(self, remaining):
+        return f"timeout={int(server.KEEP_ALIVE_TIMEOUT)}, max={remaining}"
+
+
+class AsyncEngineTests(EngineSocketTests, unittest.TestCase):
+    def _start_engine(self):
+        self.srv = server.AsyncServer("127.0.0.1", 0)
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self.srv.start())
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        return self.srv._server.sockets[0].getsockname()[1]
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        # flux et connexions encore ouverts: annulés avant de fermer la boucle
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def _stop_engine(self):
+        def stop():
+            self.srv._server.close()
+            for writer in list(self.srv._writers):
+                writer.close()
+            self._loop.stop()
+
+        self._loop.call_soon_threadsafe(stop)
+        self._thread.join(timeout=5)
+        server.BROADCASTER.remove_listener(self.srv._tick_listener)
+
+    def _keep_alive_header(self, remaining):
+        return f"timeout={int(server.KEEP_ALIVE_TIMEOUT)}"
 
 if __name__ == "__main__":
     unittest.main()